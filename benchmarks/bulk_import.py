@@ -0,0 +1,109 @@
+"""Throughput of the bulk import path against one POST per movie.
+
+Generates NDJSON for `--rows` movies, then ratings and comments on them, and
+feeds each through RecordReader and BulkImporter (the code behind
+`POST /movie/import` and `python -m capstone.manage import-data`), printing
+rows/s per kind. The per-row baseline replays the listing flow (insert
+checked by the unique description index, commit, refresh) for `--baseline-rows` movies.
+
+Usage:
+    python -m benchmarks.bulk_import [--rows 200000] [--batch-size 5000] [--database-url URL]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import orjson
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bulk_import")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--baseline-rows", type=int, default=2000)
+    parser.add_argument("--database-url", default=None, help="Defaults to a temporary SQLite file")
+    return parser.parse_args()
+
+
+def movie_lines(rows):
+    for number in range(rows):
+        yield orjson.dumps({"title": f"Movie {number}", "description": f"Imported description {number}"}) + b"\n"
+
+
+def rating_lines(rows):
+    for number in range(rows):
+        yield orjson.dumps({"movie_id": number + 1, "rating": number % 9 + 1}) + b"\n"
+
+
+def comment_lines(rows):
+    for number in range(rows):
+        yield orjson.dumps({"movie_id": number + 1, "content": f"Comment {number}"}) + b"\n"
+
+
+def timed_import(db, user_id, kind, lines, batch_size):
+    from capstone.movie.bulk import BulkImporter, RecordReader
+
+    importer = BulkImporter(db, user_id, kind, batch_size)
+    reader = RecordReader("ndjson")
+    start = time.perf_counter()
+    for line in lines:
+        for line_number, record in reader.feed(line.decode()):
+            if importer.add(line_number, record):
+                importer.flush()
+    importer.flush()
+    elapsed = time.perf_counter() - start
+    summary = importer.summary()
+    print(f"{kind:<9} {summary['inserted']:8d} rows in {elapsed:6.2f}s   {summary['inserted'] / elapsed:9.0f} rows/s   "
+          f"errors {summary['errors']}")
+
+
+def per_row_baseline(db, user_id, rows):
+    from types import SimpleNamespace
+    from capstone.movie.service import MovieService
+
+    start = time.perf_counter()
+    for number in range(rows):
+        payload = SimpleNamespace(title=f"Baseline {number}", description=f"Baseline description {number}")
+        MovieService.create_new_movie(db, payload, user_id)
+    elapsed = time.perf_counter() - start
+    print(f"{'per row':<9} {rows:8d} rows in {elapsed:6.2f}s   {rows / elapsed:9.0f} rows/s")
+
+
+def main():
+    args = parse_args()
+    if args.database_url:
+        run(args, args.database_url)
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        run(args, f"sqlite:///{directory}/bulk_import_benchmark.db")
+
+
+def run(args, database_url):
+    os.environ.setdefault("DATABASE_URL", database_url)
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from capstone.database import Base
+    from capstone.user.models import User
+    import capstone.movie.models  # noqa: F401 - registers the movie tables
+
+    engine = create_engine(database_url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine, autoflush=False)()
+    user = User(username="importer", email="importer@example.com", password="-")
+    db.add(user)
+    db.commit()
+
+    print(f"Dialect: {engine.dialect.name}, batches of {args.batch_size}")
+    timed_import(db, user.id, "movies", movie_lines(args.rows), args.batch_size)
+    timed_import(db, user.id, "ratings", rating_lines(args.rows), args.batch_size)
+    timed_import(db, user.id, "comments", comment_lines(args.rows), args.batch_size)
+    per_row_baseline(db, user.id, args.baseline_rows)
+    db.close()
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Throughput of the sync and async database modes under rising concurrency.
+
+Seeds a catalog, then for each DATABASE_MODE starts the app under uvicorn and
+drives public reads (catalog pages, single movies, ratings) with an increasing
+number of concurrent connections, printing requests/s and latency per level.
+
+Usage:
+    python -m benchmarks.load [--concurrency 50 200 500 1000] [--duration 10] [--database-url URL]
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 200, 500, 1000])
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency level")
+    parser.add_argument("--movies", type=int, default=1000)
+    parser.add_argument("--modes", nargs="+", default=["sync", "async"], choices=["sync", "async"])
+    parser.add_argument("--database-url", default=None, help="Defaults to a temporary SQLite file")
+    return parser.parse_args()
+
+
+def seed(database_url, movies):
+    from sqlalchemy import create_engine
+    from capstone.database import Base
+    import capstone.user.models  # noqa: F401 - registers the users table the movies table refers to
+    from capstone.movie.models import Movie
+
+    engine = create_engine(database_url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(Movie.__table__.insert(), [
+            {
+                "title": f"Movie {number}",
+                "description": f"Description {number}",
+                "rating_count": 2,
+                "rating_sum": 13,
+                "rating_histogram": {"6": 1, "7": 1},
+            }
+            for number in range(movies)
+        ])
+    engine.dispose()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database_url, mode, port):
+    env = dict(os.environ, DATABASE_URL=database_url, DATABASE_MODE=mode)
+    env.setdefault("SECRET_KEY", "benchmark")
+    env.setdefault("ALGORITHM", "HS256")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "capstone.main:app", "--port", str(port),
+         "--log-level", "warning", "--backlog", "4096"],
+        env=env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/movie/1", timeout=1)
+            return server
+        except httpx.TransportError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"Server in {mode} mode did not start")
+
+
+async def drive(base_url, concurrency, duration, movies):
+    latencies, errors = [], 0
+    deadline = time.monotonic() + duration
+    paths = ["/movie/?limit=20", "/movie/{id}", "/movie/{id}/ratings"]
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def worker(seed):
+            nonlocal errors
+            rng = random.Random(seed)
+            while time.monotonic() < deadline:
+                path = rng.choice(paths).format(id=rng.randint(1, movies))
+                start = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        started = time.monotonic()
+        await asyncio.gather(*(worker(number) for number in range(concurrency)))
+        elapsed = time.monotonic() - started
+    return latencies, errors, elapsed
+
+
+def report(mode, concurrency, latencies, errors, elapsed):
+    latencies.sort()
+    percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    print(
+        f"{mode:<6} c={concurrency:<5} {len(latencies) / elapsed:8.0f} req/s   "
+        f"p50 {percentile(0.50):7.1f} ms   p99 {percentile(0.99):7.1f} ms   errors {errors}"
+    )
+
+
+def run(args, database_url):
+    os.environ.setdefault("DATABASE_URL", database_url)
+    seed(database_url, args.movies)
+    for mode in args.modes:
+        port = free_port()
+        server = start_server(database_url, mode, port)
+        try:
+            for concurrency in args.concurrency:
+                result = asyncio.run(drive(f"http://127.0.0.1:{port}", concurrency, args.duration, args.movies))
+                report(mode, concurrency, *result)
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def main():
+    args = parse_args()
+    if args.database_url:
+        run(args, args.database_url)
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        run(args, f"sqlite:///{directory}/load_benchmark.db")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Compare full-text movie search with the exact-title query it replaced.
+
+Seeds a synthetic catalog and times three ways of answering a search:
+the old exact-match `title == ?` filter, an unindexed LIKE scan (what partial
+matching costs without an index) and the FTS5 / tsvector backend.
+
+Usage:
+    python -m benchmarks.search [--rows 1000000] [--queries 200] [--database-url URL]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+SYLLABLES = "ka lo mi ra te su vin dor el an gar bel tor mus fen ric ost ul py zan".split()
+
+
+def vocabulary(rng, size=20_000):
+    """Pseudo-words, so that each search matches a realistic handful of movies rather than most of the catalog."""
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.search")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    parser.add_argument("--database-url", default=None, help="Defaults to a temporary SQLite file")
+    return parser.parse_args()
+
+
+def random_title(rng, words):
+    return " ".join(rng.choice(words).title() for _ in range(rng.randint(2, 4)))
+
+
+def seed(engine, rows, batch_size, rng, words):
+    from capstone.database import Base
+    import capstone.user.models  # noqa: F401 - registers the users table the movies table refers to
+    from capstone.movie.models import Movie
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    start = time.perf_counter()
+    with engine.begin() as connection:
+        for first in range(0, rows, batch_size):
+            batch = [
+                {
+                    "title": random_title(rng, words),
+                    "description": " ".join(rng.sample(words, 12)),
+                    "user_id": None,
+                }
+                for _ in range(first, min(first + batch_size, rows))
+            ]
+            connection.execute(Movie.__table__.insert(), batch)
+    print(f"Seeded {rows} movies in {time.perf_counter() - start:.1f}s")
+
+
+def measure(label, run, queries):
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        run(query)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    print(
+        f"{label:<28} mean {statistics.mean(timings):8.2f} ms   "
+        f"p50 {timings[len(timings) // 2]:8.2f} ms   p95 {timings[int(len(timings) * 0.95)]:8.2f} ms"
+    )
+
+
+def main():
+    args = parse_args()
+    if args.database_url:
+        run(args, args.database_url)
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        run(args, f"sqlite:///{directory}/search_benchmark.db")
+
+
+def run(args, database_url):
+    os.environ.setdefault("DATABASE_URL", database_url)
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from capstone.movie.models import Movie
+    from capstone.movie.search import LikeSearch, get_search_backend
+
+    rng = random.Random(42)
+    engine = create_engine(database_url)
+    words = vocabulary(rng)
+    seed(engine, args.rows, args.batch_size, rng, words)
+    db = sessionmaker(bind=engine)()
+
+    exact = [random_title(rng, words) for _ in range(args.queries)]
+    # Users type the first word in full and only the start of the second
+    partial = [f"{first} {second[:3]}" for first, second in (title.lower().split()[:2] for title in exact)]
+    backend = get_search_backend(engine)
+
+    print(f"Dialect: {engine.dialect.name}, {args.queries} queries each, first page of 10")
+    measure("exact title (old query)", lambda q: db.query(Movie).filter(Movie.title == q).offset(0).limit(10).all(), exact)
+    measure("LIKE substring scan", lambda q: LikeSearch().search(db, q, 0, 10), partial)
+    measure(f"{type(backend).__name__} prefix match", lambda q: backend.search(db, q, 0, 10), partial)
+    db.close()
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
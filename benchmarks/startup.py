@@ -0,0 +1,89 @@
+"""Worker boot time: importing `capstone.main`, then serving the first request.
+
+Every run is a fresh interpreter, so nothing is cached between runs. Each run
+also reports whether the import built the database engine or started the log
+thread, which it should leave to the first request that needs them.
+`capstone/test/test_startup.py` runs `measure_startup` as a regression test.
+
+Usage:
+    python -m benchmarks.startup [--runs 10] [--database-url URL]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import capstone.main
+imported = time.perf_counter()
+from capstone import database, logger
+state = {
+    "engine_built": database.get_engine.cache_info().currsize > 0,
+    "log_thread_started": logger._listener is not None,
+}
+first_request = None
+if FIRST_REQUEST:
+    from fastapi.testclient import TestClient
+    with TestClient(capstone.main.app) as client:
+        client.get("/movie/1")
+    first_request = time.perf_counter() - imported
+print(json.dumps({"import": imported - start, "first_request": first_request, **state}))
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--database-url", default=None, help="Defaults to a temporary SQLite file")
+    return parser.parse_args()
+
+
+def measure_startup(database_url: str | None = None) -> dict:
+    """Time one import of the app in a fresh interpreter, and its first request when `database_url` is given."""
+    env = dict(os.environ, LOG_SINK="memory", SENTRY_DSN="", PYTHONPATH=ROOT)
+    env.pop("DATABASE_URL", None)
+    if database_url:
+        env["DATABASE_URL"] = database_url
+    script = STARTUP_SCRIPT.replace("FIRST_REQUEST", repr(bool(database_url)))
+    output = subprocess.run([sys.executable, "-c", script], env=env, cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    args = parse_args()
+    if args.database_url:
+        run(args, args.database_url)
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        run(args, f"sqlite:///{directory}/startup_benchmark.db")
+
+
+def run(args, database_url):
+    from sqlalchemy import create_engine
+    from capstone.database import Base
+    import capstone.user.models  # noqa: F401 - registers the users table the movies table refers to
+    import capstone.movie.models  # noqa: F401 - registers the movie tables
+
+    engine = create_engine(database_url)
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+
+    runs = [measure_startup(database_url) for _ in range(args.runs)]
+    imports = [run["import"] * 1000 for run in runs]
+    first_requests = [run["first_request"] * 1000 for run in runs]
+    print(f"{args.runs} runs")
+    print(f"import          median {statistics.median(imports):8.1f} ms   max {max(imports):8.1f} ms")
+    print(f"first request   median {statistics.median(first_requests):8.1f} ms   max {max(first_requests):8.1f} ms")
+    print(f"engine built at import: {any(run['engine_built'] for run in runs)}   "
+          f"log thread started at import: {any(run['log_thread_started'] for run in runs)}")
+
+
+if __name__ == "__main__":
+    main()
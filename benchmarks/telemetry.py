@@ -0,0 +1,91 @@
+"""Per-request cost of Sentry tracing and profiling at each sampling setting.
+
+Runs the app in process and times `--requests` reads of `/movie/1` with Sentry
+off, then initialized through `capstone.telemetry.sentry_options` at rising
+trace rates, and with every trace profiled. Events go to a transport that
+discards them, so the numbers are the SDK's own overhead, not network time.
+
+Usage:
+    python -m benchmarks.telemetry [--requests 2000] [--database-url URL]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+SETTINGS = [
+    ("off", None, 0.0, 0.0),
+    ("traces 0%", "https://public@example.invalid/1", 0.0, 0.0),
+    ("traces 1%", "https://public@example.invalid/1", 0.01, 0.0),
+    ("traces 10%", "https://public@example.invalid/1", 0.1, 0.0),
+    ("traces 100%", "https://public@example.invalid/1", 1.0, 0.0),
+    ("traces + profiles 100%", "https://public@example.invalid/1", 1.0, 1.0),
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.telemetry")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--database-url", default=None, help="Defaults to a temporary SQLite file")
+    return parser.parse_args()
+
+
+def measure(client, requests):
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        client.get("/movie/1")
+        timings.append((time.perf_counter() - start) * 1_000_000)
+    timings.sort()
+    return statistics.mean(timings), timings[int(len(timings) * 0.95)]
+
+
+def main():
+    args = parse_args()
+    if args.database_url:
+        run(args, args.database_url)
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        run(args, f"sqlite:///{directory}/telemetry_benchmark.db")
+
+
+def run(args, database_url):
+    os.environ.setdefault("DATABASE_URL", database_url)
+    os.environ.setdefault("LOG_SINK", "memory")
+    os.environ.setdefault("RESPONSE_CACHE_SIZE", "0")
+    os.environ.pop("SENTRY_DSN", None)
+
+    import sentry_sdk
+    from sentry_sdk.transport import Transport
+    from fastapi.testclient import TestClient
+    from capstone.main import app
+    from capstone.database import Base, get_engine, get_sessionmaker
+    from capstone.movie.models import Movie
+    from capstone.telemetry import sentry_options
+
+    class NullTransport(Transport):
+        def capture_envelope(self, envelope):
+            pass
+
+    Base.metadata.create_all(bind=get_engine())
+    db = get_sessionmaker()()
+    if db.get(Movie, 1) is None:
+        db.add(Movie(title="Telemetry", description="Telemetry benchmark"))
+        db.commit()
+    db.close()
+
+    client = TestClient(app)
+    client.get("/movie/1")
+    baseline = None
+    print(f"{args.requests} requests per setting")
+    for label, dsn, traces, profiles in SETTINGS:
+        sentry_sdk.init(**sentry_options(dsn, traces, profiles, ""), transport=NullTransport)
+        mean, p95 = measure(client, args.requests)
+        baseline = baseline or mean
+        print(f"{label:<24} mean {mean:8.1f} us   p95 {p95:8.1f} us   overhead {mean - baseline:+8.1f} us")
+    sentry_sdk.init(dsn=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Compare level-by-level reply loading with the recursive CTE behind the thread endpoints.
+
+Seeds one movie with a single reply chain `--depth` comments deep and a bushy
+thread (`--fanout` replies per comment over `--levels` levels), then times
+fetching each thread whole: one query per level (what clients did through the
+flat listing) against one `thread_statement` query plus the in-memory assembly.
+
+Usage:
+    python -m benchmarks.threads [--depth 1000] [--fanout 4] [--levels 6] [--repeat 20] [--database-url URL]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.threads")
+    parser.add_argument("--depth", type=int, default=1000, help="Length of the reply chain")
+    parser.add_argument("--fanout", type=int, default=4, help="Replies per comment in the bushy thread")
+    parser.add_argument("--levels", type=int, default=6, help="Levels of the bushy thread")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--database-url", default=None, help="Defaults to a temporary SQLite file")
+    return parser.parse_args()
+
+
+def seed(engine, depth, fanout, levels):
+    from capstone.database import Base
+    import capstone.user.models  # noqa: F401 - registers the users table the movies table refers to
+    from capstone.movie.models import Movie, Comment
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    comments = Comment.__table__
+    with engine.begin() as connection:
+        movie_id = connection.execute(Movie.__table__.insert(), {"title": "Thread", "description": "Thread"}).inserted_primary_key[0]
+
+        chain_root = parent_id = None
+        for number in range(depth):
+            parent_id = connection.execute(
+                comments.insert(), {"movie_id": movie_id, "parent_id": parent_id, "content": f"Chain {number}"}
+            ).inserted_primary_key[0]
+            chain_root = chain_root or parent_id
+
+        bushy_root = connection.execute(
+            comments.insert(), {"movie_id": movie_id, "parent_id": None, "content": "Bushy"}
+        ).inserted_primary_key[0]
+        level = [bushy_root]
+        total = 1
+        for _ in range(levels):
+            next_level = []
+            for parent_id in level:
+                for number in range(fanout):
+                    next_level.append(connection.execute(
+                        comments.insert(), {"movie_id": movie_id, "parent_id": parent_id, "content": f"Reply {number}"}
+                    ).inserted_primary_key[0])
+            level = next_level
+            total += len(level)
+    return chain_root, bushy_root, total
+
+
+def level_by_level(db, root_id):
+    from capstone.movie.models import Comment
+
+    frontier = [db.query(Comment).filter(Comment.id == root_id).one()]
+    fetched = 1
+    while frontier:
+        frontier = db.query(Comment).filter(Comment.parent_id.in_([comment.id for comment in frontier])).all()
+        fetched += len(frontier)
+    return fetched
+
+
+def recursive_cte(db, root_id, depth):
+    from capstone.movie.threads import thread_statement, build_threads
+
+    rows = db.execute(thread_statement([root_id], depth)).all()
+    build_threads(rows)
+    return len(rows)
+
+
+def measure(label, run, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fetched = run()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    print(
+        f"{label:<34} {fetched:6d} comments   mean {statistics.mean(timings):8.2f} ms   "
+        f"p95 {timings[int(len(timings) * 0.95)]:8.2f} ms"
+    )
+
+
+def main():
+    args = parse_args()
+    if args.database_url:
+        run(args, args.database_url)
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        run(args, f"sqlite:///{directory}/threads_benchmark.db")
+
+
+def run(args, database_url):
+    os.environ.setdefault("DATABASE_URL", database_url)
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    engine = create_engine(database_url)
+    chain_root, bushy_root, bushy_size = seed(engine, args.depth, args.fanout, args.levels)
+    db = sessionmaker(bind=engine)()
+
+    print(f"Dialect: {engine.dialect.name}, {args.repeat} runs each")
+    measure(f"chain x{args.depth}, query per level", lambda: level_by_level(db, chain_root), args.repeat)
+    measure(f"chain x{args.depth}, recursive CTE", lambda: recursive_cte(db, chain_root, args.depth), args.repeat)
+    measure(f"bushy x{bushy_size}, query per level", lambda: level_by_level(db, bushy_root), args.repeat)
+    measure(f"bushy x{bushy_size}, recursive CTE", lambda: recursive_cte(db, bushy_root, args.levels), args.repeat)
+    db.close()
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
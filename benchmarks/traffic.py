@@ -0,0 +1,247 @@
+"""Mixed end-to-end traffic through the ASGI app, with latency and throughput per route.
+
+Seeds `--users` users, `--movies` movies with ratings and comments, then runs
+`--concurrency` virtual users against `capstone.main.app` in process through
+httpx's ASGI transport for `--duration` seconds. Each virtual user logs in,
+then picks its next action by weight: browse the catalog, open a movie, read
+its ratings or comments, search, rate a movie it has not rated, comment, or
+log in again. Prints p50/p95/p99 latency and requests/s per route, and writes
+them with the run's settings and commit to `--output` as JSON, so runs can be
+compared across commits.
+
+Works against SQLite (the default, a temporary file) and PostgreSQL
+(`--database-url postgresql://...`), in either DATABASE_MODE.
+
+Usage:
+    python -m benchmarks.traffic [--concurrency 50] [--duration 30] [--movies 5000] [--users 200]
+                                 [--mode sync|async] [--database-url URL] [--output traffic.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import httpx
+
+PASSWORD = "benchmark-password"
+WORDS = ["night", "river", "silent", "golden", "last", "city", "storm", "winter", "lost", "empire", "shadow", "garden"]
+
+# Route template, relative weight
+ACTIONS = {
+    "GET /movie/": 30,
+    "GET /movie/{id}": 20,
+    "GET /movie/{movie_id}/ratings": 8,
+    "GET /movie/{movie_id}/comments": 8,
+    "GET /movie/search/{title}": 15,
+    "POST /movie/{movie_id}/rate": 8,
+    "POST /movie/{id}/comment": 8,
+    "POST /user/auth/login": 3,
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.traffic")
+    parser.add_argument("--concurrency", type=int, default=50, help="Virtual users running at once")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of traffic")
+    parser.add_argument("--movies", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync", help="DATABASE_MODE of the app")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random traffic")
+    parser.add_argument("--database-url", default=None, help="Defaults to a temporary SQLite file")
+    parser.add_argument("--output", default="traffic.json", help="Where to write the results as JSON")
+    return parser.parse_args()
+
+
+def seed(database_url, movies, users):
+    from sqlalchemy import create_engine
+    from capstone.database import Base
+    from capstone.authentification.hash import Hash
+    from capstone.user.models import User
+    from capstone.movie.models import Movie, Rating, Comment, description_digest
+
+    engine = create_engine(database_url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    # Every user shares one password, so seeding hashes it once
+    hashed_password = Hash.bcrypt(PASSWORD)
+    rng = random.Random(0)
+    with engine.begin() as connection:
+        connection.execute(User.__table__.insert(), [
+            {"username": f"user{number}", "email": f"user{number}@example.com", "password": hashed_password}
+            for number in range(users)
+        ])
+        movie_rows = []
+        for number in range(movies):
+            description = f"{' '.join(rng.sample(WORDS, 5))} {number}"
+            movie_rows.append({
+                "title": f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {number}",
+                "description": description,
+                "description_hash": description_digest(description),
+                "user_id": number % users + 1,
+            })
+        connection.execute(Movie.__table__.insert(), movie_rows)
+        # The first user rates and comments on every movie, so reads have something to return
+        connection.execute(Rating.__table__.insert(), [
+            {"user_id": 1, "movie_id": number + 1, "rating": number % 10 + 1} for number in range(movies)
+        ])
+        connection.execute(Comment.__table__.insert(), [
+            {"user_id": 1, "movie_id": number + 1, "content": f"Seeded comment {number}"} for number in range(movies)
+        ])
+    engine.dispose()
+
+    from capstone.manage import reconcile_ratings, rebuild_search_index
+
+    reconcile_ratings()
+    rebuild_search_index()
+
+
+class VirtualUser:
+    """One client session: a token, and the movies it has not rated yet."""
+
+    def __init__(self, client, number, movies, rng):
+        self.client = client
+        self.username = f"user{number}"
+        self.rng = rng
+        self.movies = movies
+        self.unrated = rng.sample(range(1, movies + 1), movies) if number else []
+        self.headers = {}
+
+    async def login(self):
+        response = await self.client.post("/user/auth/login", data={"username": self.username, "password": PASSWORD})
+        if response.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        return response
+
+    async def act(self, action):
+        movie_id = self.rng.randint(1, self.movies)
+        if action == "GET /movie/":
+            return await self.client.get("/movie/", params={"limit": 20, "order": self.rng.choice(["id", "release_date"])})
+        if action == "GET /movie/{id}":
+            return await self.client.get(f"/movie/{movie_id}")
+        if action == "GET /movie/{movie_id}/ratings":
+            return await self.client.get(f"/movie/{movie_id}/ratings")
+        if action == "GET /movie/{movie_id}/comments":
+            return await self.client.get(f"/movie/{movie_id}/comments")
+        if action == "GET /movie/search/{title}":
+            return await self.client.get(f"/movie/search/{self.rng.choice(WORDS)}")
+        if action == "POST /movie/{movie_id}/rate":
+            movie_id = self.unrated.pop() if self.unrated else movie_id
+            return await self.client.post(f"/movie/{movie_id}/rate", headers=self.headers,
+                                          json={"movie_id": movie_id, "rating": self.rng.randint(1, 10)})
+        if action == "POST /movie/{id}/comment":
+            return await self.client.post(f"/movie/{movie_id}/comment", headers=self.headers,
+                                          json={"movie_id": movie_id, "content": "Benchmark comment"})
+        return await self.login()
+
+
+async def drive(app, args):
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    names, weights = list(ACTIONS), list(ACTIONS.values())
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=120) as client:
+        async def session(number):
+            rng = random.Random(args.seed * 100_003 + number)
+            user = VirtualUser(client, number % args.users, args.movies, rng)
+            await user.login()
+            while time.monotonic() < deadline:
+                action = rng.choices(names, weights)[0]
+                start = time.perf_counter()
+                try:
+                    response = await user.act(action)
+                    failed = response.status_code >= 400
+                except httpx.HTTPError:
+                    failed = True
+                latencies[action].append(time.perf_counter() - start)
+                errors[action] += failed
+
+        deadline = time.monotonic() + args.duration
+        started = time.monotonic()
+        await asyncio.gather(*(session(number) for number in range(args.concurrency)))
+        elapsed = time.monotonic() - started
+    return latencies, errors, elapsed
+
+
+def summarize(latencies, errors, elapsed):
+    routes = {}
+    for action in ACTIONS:
+        timings = sorted(latencies.get(action, []))
+        if not timings:
+            continue
+        percentile = lambda p: round(timings[min(len(timings) - 1, int(len(timings) * p))] * 1000, 3)
+        routes[action] = {
+            "requests": len(timings),
+            "errors": errors[action],
+            "rps": round(len(timings) / elapsed, 1),
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+        }
+    return routes
+
+
+def commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args, database_url):
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["DATABASE_MODE"] = args.mode
+    os.environ.setdefault("LOG_SINK", "memory")
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("ALGORITHM", "HS256")
+
+    seed(database_url, args.movies, args.users)
+    from sqlalchemy.engine import make_url
+    from capstone.main import app
+
+    latencies, errors, elapsed = asyncio.run(drive(app, args))
+    routes = summarize(latencies, errors, elapsed)
+
+    total = sum(route["requests"] for route in routes.values())
+    print(f"{make_url(database_url).get_backend_name()} / {args.mode}, {args.concurrency} virtual users, "
+          f"{elapsed:.1f}s, {total / elapsed:.0f} req/s overall")
+    for action, route in routes.items():
+        print(f"{action:<32} {route['rps']:8.1f} req/s   p50 {route['p50_ms']:8.1f} ms   p95 {route['p95_ms']:8.1f} ms   "
+              f"p99 {route['p99_ms']:8.1f} ms   errors {route['errors']}")
+
+    results = {
+        "commit": commit(),
+        "recorded_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "database": make_url(database_url).get_backend_name(),
+        "mode": args.mode,
+        "concurrency": args.concurrency,
+        "duration": round(elapsed, 3),
+        "movies": args.movies,
+        "users": args.users,
+        "seed": args.seed,
+        "routes": routes,
+    }
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2)
+    print(f"Results written to {args.output}")
+
+
+def main():
+    args = parse_args()
+    if args.database_url:
+        run(args, args.database_url)
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        run(args, f"sqlite:///{directory}/traffic_benchmark.db")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,18 @@
+import asyncio
+import os
+import threading
+import time
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
 
+from capstone.logger import get_logger
+
+logger = get_logger(__name__)
+
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated = "auto")
 
@@ -12,4 +25,114 @@ class Hash:
            return hashed_password
 
     def verify(plain_password, hashed_password):
-          return pwd_context.verify( plain_password, hashed_password)
\ No newline at end of file
+          return pwd_context.verify( plain_password, hashed_password)
+
+
+# Process pool that keeps bcrypt off request threads and the event loop.
+# HASH_WORKERS defaults to one process per core; HASH_QUEUE_SIZE bounds the
+# hashes waiting for a worker before new ones are turned away with a 503.
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", os.cpu_count() or 1))
+HASH_QUEUE_SIZE = int(os.getenv("HASH_QUEUE_SIZE", HASH_WORKERS * 8))
+
+# Upper bounds (seconds) of the hash latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class HashPool:
+    """Runs `Hash.bcrypt` and `Hash.verify` in worker processes.
+
+    At most `workers + queue_size` hashes are in flight; past that, callers get
+    a 503 with a Retry-After header instead of queueing without bound. A worker
+    that dies breaks its executor for good, so a new one is started and the
+    hash retried once.
+    """
+
+    def __init__(self, workers: int = HASH_WORKERS, queue_size: int = HASH_QUEUE_SIZE):
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self._executor = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.latency_sum = 0.0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def executor(self) -> ProcessPoolExecutor:
+        # Started on first use, so importing the app does not fork workers
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    async def bcrypt(self, password: str) -> str:
+        return await self._run(Hash.bcrypt, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(Hash.verify, plain_password, hashed_password)
+
+    async def _run(self, function, *args):
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many authentication requests, try again shortly",
+                    headers={"Retry-After": "1"},
+                )
+            self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            try:
+                return await self._submit(function, *args)
+            except BrokenProcessPool:
+                return await self._submit(function, *args)
+        finally:
+            self._record(time.perf_counter() - start)
+
+    async def _submit(self, function, *args):
+        executor = self.executor()
+        try:
+            return await asyncio.wrap_future(executor.submit(function, *args))
+        except BrokenProcessPool:
+            self._replace(executor)
+            raise
+
+    def _replace(self, broken: ProcessPoolExecutor):
+        # Every hash in flight on the broken executor fails at once; only the first of them replaces it
+        with self._lock:
+            if self._executor is not broken:
+                return
+            self._executor = None
+        logger.warning("A hashing process died, starting a new pool")
+        broken.shutdown(wait=False)
+
+    def _record(self, elapsed: float):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+            self.latency_sum += elapsed
+            self.latency_buckets[bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+
+    def metrics(self) -> dict:
+        """Snapshot of the queue depth, rejections and hash latency histogram."""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "in_flight": self.in_flight,
+                "queue_depth": max(0, self.in_flight - self.workers),
+                "capacity": self.capacity,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "latency_seconds_sum": self.latency_sum,
+                "latency_seconds_buckets": dict(zip([*map(str, LATENCY_BUCKETS), "+Inf"], self.latency_buckets)),
+            }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+hash_pool = HashPool()
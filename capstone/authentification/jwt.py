@@ -1,4 +1,7 @@
 import os
+import threading
+import time
+from collections import OrderedDict
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -11,6 +14,56 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 
+# Verified tokens are remembered for TOKEN_CACHE_TTL seconds, at most TOKEN_CACHE_SIZE of them
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10_000))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", 300))
+
+
+class TokenCache:
+    """Bounded LRU of verified tokens and the identity they resolved to.
+
+    An entry expires after `ttl` seconds, or earlier at the token's own `exp` claim.
+    Only valid tokens are stored, so a rejected token is decoded again every time.
+    """
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE, ttl: float = TOKEN_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            expires_at, token_data = entry
+            if expires_at <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return token_data
+
+    def put(self, token: str, token_data, exp=None):
+        expires_at = time.time() + self.ttl
+        if exp is not None:
+            expires_at = min(expires_at, exp)
+        with self._lock:
+            self._entries[token] = (expires_at, token_data)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+token_cache = TokenCache()
+
 
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -19,12 +72,17 @@ def create_access_token(data: dict):
 
 
 def verify_token(token : str, credentials_exception):
+    token_data = token_cache.get(token)
+    if token_data is not None:
+        return token_data
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
-        token_data = user_schemas.TokenData(username=username)
+        # Tokens issued before the id claim was added only carry the username
+        token_data = user_schemas.TokenData(username=username, id=payload.get("user_id"))
+        token_cache.put(token, token_data, payload.get("exp"))
         return token_data
 
     except JWTError:
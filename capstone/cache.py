@@ -0,0 +1,157 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import orjson
+from fastapi import Request, Response, status
+
+from capstone.database import READ_YOUR_WRITES_WINDOW, reads_from_primary
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 10_000))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 30))
+
+# Version tag bumped by every change to the list of movies
+CATALOG = ("catalog",)
+# Version tag bumped by every new rating or comment, for responses embedding the counts of many movies
+ACTIVITY = ("activity",)
+# Version tag every entry depends on, bumped by `clear`
+EVERYTHING = ("everything",)
+
+
+def movie_tag(movie_id: int) -> tuple:
+    """Version tag bumped by every change to one movie or its ratings."""
+    return ("movie", movie_id)
+
+
+class ResponseCache:
+    """Bounded LRU of serialized JSON responses with a TTL and version-based invalidation.
+
+    Every entry records the version of each tag it was built from. Writers call
+    `invalidate` with the tags they changed, which makes the dependent entries stale
+    without scanning the cache. Entries carry a strong ETag, so a client revalidating
+    with If-None-Match gets a 304 straight from memory.
+
+    The cache lives in one worker process: other workers see a change once their
+    own entries expire, after at most `ttl` seconds.
+
+    With read replicas, a client inside its read-your-writes window neither reads
+    nor fills the cache, since an entry may predate its write. A response a replica
+    built within `replica_lag` seconds of a change to one of its tags is served but
+    not stored, since the replica may not have the change yet.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL,
+                 replica_lag: float = READ_YOUR_WRITES_WINDOW):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.replica_lag = replica_lag
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._invalidated_at = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bypasses = 0
+
+    def invalidate(self, *tags):
+        now = time.monotonic()
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+                self._invalidated_at[tag] = now
+
+    def clear(self):
+        """Drop every entry, including the ones being built right now."""
+        with self._lock:
+            self._entries.clear()
+            self._versions[EVERYTHING] = self._versions.get(EVERYTHING, 0) + 1
+            self._invalidated_at[EVERYTHING] = time.monotonic()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "bypasses": self.bypasses}
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, versions = entry[0], entry[1]
+                if expires_at > time.monotonic() and all(self._versions.get(tag, 0) == version for tag, version in versions):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry, versions
+                del self._entries[key]
+            self.misses += 1
+            # Versions are read before the response is built, so a write that lands meanwhile leaves the entry stale
+            _, tags = key
+            return None, tuple((tag, self._versions.get(tag, 0)) for tag in tags)
+
+    def _begin(self, request: Request, name: str, tags: list):
+        """The key of a response, and its entry or the versions to build one at; no versions when bypassing."""
+        key = (name, (EVERYTHING, *tags))
+        if reads_from_primary(request):
+            with self._lock:
+                self.bypasses += 1
+            return key, None, None
+        entry, versions = self._lookup(key)
+        return key, entry, versions
+
+    def _finish(self, request: Request, key, versions, content, headers):
+        body = orjson.dumps(content)
+        etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        entry = (time.monotonic() + self.ttl, versions, body, etag, headers or {})
+        if versions is None:
+            return entry
+        with self._lock:
+            if getattr(request.state, "read_replica", False):
+                horizon = time.monotonic() - self.replica_lag
+                if any(self._invalidated_at.get(tag, horizon) > horizon for tag, _ in versions):
+                    return entry
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    @staticmethod
+    def _respond(request: Request, entry) -> Response:
+        _, _, body, etag, headers = entry
+        if_none_match = request.headers.get("if-none-match", "")
+        candidates = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+        if etag in candidates or "*" in candidates:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        return Response(body, media_type="application/json", headers={"ETag": etag, **headers})
+
+    def respond(self, request: Request, name: str, tags: list, produce) -> Response:
+        """Serve `name` (the route and its parameters) from the cache, or build it with `produce`.
+
+        Args:
+            request (Request): The incoming request, read for If-None-Match and the read-your-writes cookie.
+            name (str): A key unique to the route and its parameters.
+            tags (list): The version tags the response depends on.
+            produce: Returns the JSON content and a dict of extra headers (or None) on a miss.
+
+        Returns:
+            Response: The JSON response with its ETag, or a 304 if the client's copy is current.
+        """
+        key, entry, versions = self._begin(request, name, tags)
+        if entry is None:
+            content, headers = produce()
+            entry = self._finish(request, key, versions, content, headers)
+        return self._respond(request, entry)
+
+    async def respond_async(self, request: Request, name: str, tags: list, produce) -> Response:
+        """Like `respond`, for a `produce` coroutine function."""
+        key, entry, versions = self._begin(request, name, tags)
+        if entry is None:
+            content, headers = await produce()
+            entry = self._finish(request, key, versions, content, headers)
+        return self._respond(request, entry)
+
+
+response_cache = ResponseCache()
@@ -1,32 +1,236 @@
 import os
+import time
+from functools import cache
 
 from typing import Annotated
 
-from fastapi import Depends
+from fastapi import Depends, Request, Response
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 
+from capstone.metrics import track_statements
+from capstone.replicas import ReplicaSession, ReplicaSet
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Optional read replicas, comma separated; the public read routes are spread over them
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+
+# Seconds after a client's own write during which its reads go to the primary, which replicas may lag behind
+READ_YOUR_WRITES_WINDOW = float(os.getenv("READ_YOUR_WRITES_WINDOW", 5))
+# Set on the responses of writes, holding the time until which the client reads from the primary
+READ_PRIMARY_COOKIE = "read_primary_until"
+
+# "sync" serves every route from the threadpool with blocking sessions,
+# "async" serves the ported routes from the event loop with AsyncSession
+DATABASE_MODE = os.getenv("DATABASE_MODE", "sync").lower()
+
+# Async drivers used when ASYNC_DATABASE_URL is not set explicitly
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def to_async_url(url: str) -> str:
+    """Swap the driver of a sync database URL for its asyncio counterpart."""
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername)).render_as_string(hide_password=False)
+
+
+def database_url() -> str:
+    if not DATABASE_URL:
+        raise ValueError("No DATABASE_URL set for SQLAlchemy engine")
+    return DATABASE_URL
+
+
+# Every engine, async ones included, counts the statements of the request being served
+track_statements(Engine)
+
+
+# The engines and session factories are built on first use, so importing the app
+# neither needs a database URL nor loads a driver
+
+@cache
+def get_engine():
+    return create_engine(database_url())
+
+
+@cache
+def get_sessionmaker():
+    return sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
+
+
+@cache
+def get_async_engine():
+    # Only built when an async route runs, so sync deployments do not need an async driver installed
+    return create_async_engine(os.getenv("ASYNC_DATABASE_URL") or to_async_url(database_url()))
+
+
+@cache
+def get_async_sessionmaker():
+    # Objects stay loaded after commit: lazy refreshes are not possible outside the session's greenlet
+    return async_sessionmaker(bind=get_async_engine(), autoflush=False, expire_on_commit=False)
+
+
+@cache
+def get_replicas():
+    """The ReplicaSet of DATABASE_REPLICA_URLS, or None when no replica is configured."""
+    if not DATABASE_REPLICA_URLS:
+        return None
+    return ReplicaSet(
+        [sessionmaker(autocommit=False, autoflush=False, bind=create_engine(url, pool_pre_ping=True)) for url in DATABASE_REPLICA_URLS],
+        [make_url(url).render_as_string() for url in DATABASE_REPLICA_URLS],
+    )
+
+
+@cache
+def get_async_replicas():
+    """Like `get_replicas`, with the async drivers or the URLs of ASYNC_DATABASE_REPLICA_URLS."""
+    if not DATABASE_REPLICA_URLS:
+        return None
+    urls = [url.strip() for url in os.getenv("ASYNC_DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+    urls = urls or [to_async_url(url) for url in DATABASE_REPLICA_URLS]
+    return ReplicaSet(
+        [async_sessionmaker(bind=create_async_engine(url, pool_pre_ping=True), autoflush=False, expire_on_commit=False) for url in urls],
+        [make_url(url).render_as_string() for url in urls],
+    )
+
+
+def replica_metrics() -> dict:
+    """Reads served by the replicas and falls back to the primary, for /metrics."""
+    replicas = get_replicas() if DATABASE_MODE != "async" else get_async_replicas()
+    return replicas.stats() if replicas is not None else {}
+
+
+_LAZY_ATTRIBUTES = {
+    "engine": get_engine,
+    "SessionLocal": get_sessionmaker,
+    "async_engine": get_async_engine,
+    "AsyncSessionLocal": get_async_sessionmaker,
+}
+
+
+def __getattr__(name):
+    # `from capstone.database import engine` keeps working, and builds the engine at that point
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-if not DATABASE_URL:
-    raise ValueError("No DATABASE_URL set for SQLAlchemy engine")
 
-engine = create_engine(DATABASE_URL)
+def upsert(db, table, index_elements: list[str], rows):
+    """Build an INSERT of `rows`, a list of dicts, that updates the given columns of rows already present.
+
+    Uses the INSERT .. ON CONFLICT of PostgreSQL and SQLite, the backends this app runs on.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"No upsert for the {dialect} dialect")
+    statement = insert(table).values(rows)
+    return statement.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={name: statement.excluded[name] for name in rows[0] if name not in index_elements},
+    )
+
+
+async def dispose_engines():
+    """Close the pooled connections of the engines built so far."""
+    if get_engine.cache_info().currsize:
+        get_engine().dispose()
+    if get_async_engine.cache_info().currsize:
+        await get_async_engine().dispose()
+    if get_replicas.cache_info().currsize and get_replicas() is not None:
+        for replica in get_replicas().engines():
+            replica.dispose()
+    if get_async_replicas.cache_info().currsize and get_async_replicas() is not None:
+        for replica in get_async_replicas().engines():
+            await replica.dispose()
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
+
+def remember_writes(session, response: Response):
+    """Send the client to the primary for its next reads once `session` commits, when replicas are in use."""
+    @event.listens_for(session, "after_commit")
+    def read_primary(session):
+        until = time.time() + READ_YOUR_WRITES_WINDOW
+        response.set_cookie(READ_PRIMARY_COOKIE, f"{until:.3f}", max_age=max(1, round(READ_YOUR_WRITES_WINDOW)),
+                            httponly=True, samesite="lax")
+
+
+def reads_from_primary(request: Request) -> bool:
+    """Whether the client wrote recently enough that a replica may not have its write yet."""
+    try:
+        return float(request.cookies.get(READ_PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def get_db(response: Response):
+    db = get_sessionmaker()()
+    if get_replicas() is not None:
+        remember_writes(db, response)
+    try:
+        yield db
+    finally:
+        db.close()
+
+db_dependency = Annotated[Session, Depends(get_db)]
+
+
+def served_by_replica(request: Request):
+    """Mark `request` as read from a replica: the response cache does not keep what one built right after a write."""
+    def mark():
+        request.state.read_replica = True
+    return mark
+
+
+def get_read_db(request: Request, primary: db_dependency):
+    # Neither session connects before the route's first statement, so a cached response or a 304 costs no round trip
+    replicas = get_replicas()
+    if replicas is None or reads_from_primary(request):
+        yield primary
+        return
+    db = ReplicaSession(replicas, primary.get_bind(), served_by_replica(request), autoflush=False)
     try:
         yield db
     finally:
         db.close()
 
-db_dependency = Annotated[Session, Depends(get_db)]
\ No newline at end of file
+# For the public read-only routes: a replica when one is configured and healthy, the primary otherwise
+read_db_dependency = Annotated[Session, Depends(get_read_db)]
+
+
+async def get_async_db(response: Response):
+    async with get_async_sessionmaker()() as db:
+        if get_async_replicas() is not None:
+            remember_writes(db.sync_session, response)
+        yield db
+
+async_db_dependency = Annotated[AsyncSession, Depends(get_async_db)]
+
+
+async def get_async_read_db(request: Request, primary: async_db_dependency):
+    replicas = get_async_replicas()
+    if replicas is None or reads_from_primary(request):
+        yield primary
+        return
+    db = AsyncSession(sync_session_class=ReplicaSession, replicas=replicas, primary=primary.sync_session.get_bind(),
+                      on_replica=served_by_replica(request), autoflush=False, expire_on_commit=False)
+    try:
+        yield db
+    finally:
+        await db.close()
+
+async_read_db_dependency = Annotated[AsyncSession, Depends(get_async_read_db)]
@@ -0,0 +1,202 @@
+import asyncio
+import os
+import threading
+from typing import NamedTuple
+
+import orjson
+from fastapi import WebSocket, status
+
+from capstone.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Events one client may have waiting; a client further behind is disconnected
+FEED_QUEUE_SIZE = int(os.getenv("FEED_QUEUE_SIZE", 100))
+# Seconds between the comments an idle event stream sends, which keep proxies from closing it
+FEED_HEARTBEAT = float(os.getenv("FEED_HEARTBEAT", 15))
+
+
+class Event(NamedTuple):
+    """One published event, serialized once for every subscriber."""
+    json: str
+    sse: str
+
+
+class Subscription:
+    """One client's bounded queue of events for a movie, read on the event loop that created it."""
+
+    def __init__(self, movie_id: int, queue_size: int):
+        self.movie_id = movie_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(queue_size)
+        self.closed = False
+        self.close_code = status.WS_1000_NORMAL_CLOSURE
+
+    def offer(self, event: Event) -> bool:
+        """Queue `event`, or return False when the client is too far behind to take it."""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def end(self, close_code: int):
+        """Drop the waiting events and wake the client's task with None, which ends its feed."""
+        self.closed = True
+        self.close_code = close_code
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+    async def next(self, timeout: float | None = None) -> Event | None:
+        """The next event, None once the feed ended; raises TimeoutError after `timeout` seconds without one."""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class FeedHub:
+    """In-process publish/subscribe of new comments and ratings, per movie.
+
+    Writers call `publish` after their commit, from any thread. The event is
+    serialized once and fanned out on the subscribers' event loop, one call per
+    loop however many clients follow the movie. Each client has a queue of
+    `queue_size` events: a client that lets it fill up is evicted rather than
+    slowing the others down or buffering without bound, and reconnects to catch up.
+
+    The hub lives in one worker process, so a client only sees the writes
+    served by the worker it is connected to. Running several workers behind
+    a load balancer needs a shared broker in front of `publish`.
+    """
+
+    def __init__(self, queue_size: int = FEED_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._topics = {}
+        self._lock = threading.Lock()
+        self.published = 0
+        self.delivered = 0
+        self.evicted = 0
+
+    def subscribe(self, movie_id: int) -> Subscription:
+        """Follow a movie's events; must be called on the event loop that reads them."""
+        subscription = Subscription(movie_id, self.queue_size)
+        with self._lock:
+            self._topics.setdefault(movie_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._topics.get(subscription.movie_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._topics[subscription.movie_id]
+
+    def publish(self, movie_id: int, kind: str, data: dict):
+        """Send a `kind` event with `data` to the clients following `movie_id`."""
+        with self._lock:
+            self.published += 1
+            subscribers = list(self._topics.get(movie_id, ()))
+        if not subscribers:
+            return
+        message = orjson.dumps({"type": kind, **data}, option=orjson.OPT_NON_STR_KEYS).decode()
+        event = Event(json=message, sse=f"event: {kind}\ndata: {message}\n\n")
+        by_loop = {}
+        for subscription in subscribers:
+            by_loop.setdefault(subscription.loop, []).append(subscription)
+        for loop, group in by_loop.items():
+            self._call_on(loop, self._fan_out, group, event)
+
+    def close(self):
+        """End every feed, as the server shuts down."""
+        with self._lock:
+            subscribers = [subscription for group in self._topics.values() for subscription in group]
+            self._topics.clear()
+        for subscription in subscribers:
+            self._call_on(subscription.loop, subscription.end, status.WS_1001_GOING_AWAY)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "movies": len(self._topics),
+                "subscribers": sum(len(group) for group in self._topics.values()),
+                "published": self.published,
+                "delivered": self.delivered,
+                "evicted": self.evicted,
+            }
+
+    @staticmethod
+    def _call_on(loop, callback, *args):
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if loop is running:
+            callback(*args)
+            return
+        try:
+            loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # The loop is closed, and its clients are gone with it
+            pass
+
+    def _fan_out(self, subscribers: list, event: Event):
+        delivered = 0
+        for subscription in subscribers:
+            if subscription.closed:
+                continue
+            if subscription.offer(event):
+                delivered += 1
+                continue
+            self.unsubscribe(subscription)
+            subscription.end(status.WS_1013_TRY_AGAIN_LATER)
+            with self._lock:
+                self.evicted += 1
+            logger.info(f"Evicted a slow subscriber of movie {subscription.movie_id}, {self.queue_size} events behind")
+        with self._lock:
+            self.delivered += delivered
+
+
+feed_hub = FeedHub()
+
+
+async def event_stream(hub: FeedHub, movie_id: int):
+    """Yield a movie's events as server-sent events, until the client leaves or is evicted."""
+    subscription = hub.subscribe(movie_id)
+    try:
+        while True:
+            try:
+                event = await subscription.next(FEED_HEARTBEAT)
+            except TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if event is None:
+                return
+            yield event.sse
+    finally:
+        hub.unsubscribe(subscription)
+
+
+async def serve_websocket(hub: FeedHub, websocket: WebSocket, movie_id: int):
+    """Send a movie's events as JSON text messages, until the client leaves or is evicted."""
+    # Subscribe first, so that no event is missed between the handshake and the subscription
+    subscription = hub.subscribe(movie_id)
+
+    async def forward():
+        while (event := await subscription.next()) is not None:
+            await websocket.send_text(event.json)
+        await websocket.close(code=subscription.close_code)
+
+    async def listen():
+        # The feed is one way: receiving only notices the client leaving
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = []
+    try:
+        await websocket.accept()
+        tasks = [asyncio.create_task(forward()), asyncio.create_task(listen())]
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        hub.unsubscribe(subscription)
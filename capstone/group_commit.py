@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+
+from capstone.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Opt in to committing the comment, reply and rating writes of concurrent requests together
+GROUP_COMMIT = os.getenv("GROUP_COMMIT", "off").lower() in ("1", "true", "on", "yes")
+# Longest a write waits for others to share its commit, and the most writes one commit takes
+GROUP_COMMIT_INTERVAL = float(os.getenv("GROUP_COMMIT_INTERVAL_MS", 5)) / 1000
+GROUP_COMMIT_MAX_ROWS = int(os.getenv("GROUP_COMMIT_MAX_ROWS", 100))
+# Seconds a request waits for its write to be committed before it gives up with a 503
+GROUP_COMMIT_TIMEOUT = float(os.getenv("GROUP_COMMIT_TIMEOUT", 30))
+
+
+class GroupCommitBuffer:
+    """Runs the writes of concurrent requests in one transaction, so they share a single commit.
+
+    A request submits a write, a function of a Session returning the request's
+    result, and blocks on the returned future. A background thread collects the
+    writes arriving within `interval` seconds of the first one, or until
+    `max_rows` are waiting, runs them on one session per engine and commits.
+    Each future is resolved only after that commit returns, so a request never
+    answers before its row is durable.
+
+    A write may raise HTTPException before it has written anything, which fails
+    its own request only. Any other error aborts the shared transaction; the
+    writes of that batch are then committed one by one, so only the faulty one fails.
+    """
+
+    def __init__(self, interval: float = GROUP_COMMIT_INTERVAL, max_rows: int = GROUP_COMMIT_MAX_ROWS):
+        self.interval = interval
+        self.max_rows = max_rows
+        self._pending = []
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self.batches = 0
+        self.rows = 0
+        self.retries = 0
+
+    def submit(self, bind, write) -> Future:
+        """Queue `write` for the next commit on `bind`, an engine, and return the future of its result."""
+        future = Future()
+        with self._condition:
+            self._pending.append((bind, write, future))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return future
+
+    def close(self):
+        """Commit the writes still waiting, then stop the background thread until the next write."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        with self._condition:
+            self._closed = False
+            self._thread = None
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {"pending": len(self._pending), "batches": self.batches, "rows": self.rows, "retries": self.retries}
+
+    def _run(self):
+        try:
+            while (batch := self._next_batch()) is not None:
+                by_bind = {}
+                for bind, write, future in batch:
+                    by_bind.setdefault(bind, []).append((write, future))
+                for bind, writes in by_bind.items():
+                    try:
+                        self._commit(bind, writes)
+                    except Exception as error:
+                        # Such as a rollback on a dead connection: this batch fails, the thread keeps serving the next ones
+                        logger.error(f"A group commit of {len(writes)} writes failed: {error}")
+                        for _, future in writes:
+                            if not future.done():
+                                future.set_exception(error)
+        finally:
+            # Should the thread die anyway, the next write starts another one
+            with self._condition:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+
+    def _next_batch(self):
+        """Wait for the next batch of writes, None once the buffer is closed and empty."""
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            if not self._pending:
+                return None
+            # The first write waits up to `interval` for others to join its commit
+            deadline = time.monotonic() + self.interval
+            while len(self._pending) < self.max_rows and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch, self._pending = self._pending[:self.max_rows], self._pending[self.max_rows:]
+            return batch
+
+    def _commit(self, bind, writes):
+        outcomes = []
+        db = Session(bind=bind, autoflush=False)
+        try:
+            for write, future in writes:
+                try:
+                    outcomes.append((future, write(db), None))
+                except HTTPException as error:
+                    outcomes.append((future, None, error))
+                # Flush each write, so the next one reads the rows and aggregates it changed
+                db.flush()
+            db.commit()
+        except Exception as error:
+            db.rollback()
+            if len(writes) == 1:
+                writes[0][1].set_exception(error)
+                return
+            logger.warning(f"A group commit of {len(writes)} writes failed, committing them one by one: {error}")
+            with self._condition:
+                self.retries += 1
+            for write in writes:
+                self._commit(bind, [write])
+            return
+        finally:
+            db.close()
+
+        with self._condition:
+            self.batches += 1
+            self.rows += sum(error is None for _, _, error in outcomes)
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+write_buffer = GroupCommitBuffer()
+
+
+def commit_write(db, write):
+    """Run `write` on `db` and commit, or share the commit of concurrent requests when GROUP_COMMIT is on.
+
+    Either way, the result of `write` is returned only once its transaction has committed.
+    """
+    if not GROUP_COMMIT:
+        result = write(db)
+        db.commit()
+        return result
+    # End the request's own transaction first: on SQLite, its read lock would keep the batch from committing
+    db.rollback()
+    try:
+        result = write_buffer.submit(db.get_bind(), write).result(timeout=GROUP_COMMIT_TIMEOUT)
+    except TimeoutError:
+        logger.error(f"A write waited more than {GROUP_COMMIT_TIMEOUT:g}s for its group commit")
+        raise HTTPException(
+            status_code = status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail = "The write could not be confirmed in time, it may still be saved"
+        )
+    # Commit the request's empty session too: no statement is sent, but its after_commit listeners,
+    # such as the read-your-writes cookie, learn that the request wrote
+    db.commit()
+    return result
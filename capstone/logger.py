@@ -1,36 +1,258 @@
+import atexit
 import logging
-import sentry_sdk
-from sentry_sdk.integrations.logging import LoggingIntegration
-import logging
-from logging.handlers import SysLogHandler
-# Enable sending logs from the standard Python logging module to Sentry
-logging_integration = LoggingIntegration(
-    level=logging.INFO,  # Capture info and above as breadcrumbs
-    event_level=logging.ERROR  # Send errors as events
-)
-sentry_sdk.init(
-    dsn="https://ee3ca659cdc5658bf02659af610f818b@o4507693153386496.ingest.de.sentry.io/4507693158629456",
-    # Set traces_sample_rate to 1.0 to capture 100%
-    # of transactions for performance monitoring.
-    traces_sample_rate=1.0,
-    # Set profiles_sample_rate to 1.0 to profile 100%
-    # of sampled transactions.
-    # We recommend adjusting this value in production.
-    profiles_sample_rate=1.0,
-    integrations= [logging_integration]
-)
+import os
+import queue
+import random
+import socket
+import threading
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener, SysLogHandler
 
 PAPERTRAIL_HOST = "logs6.papertrailapp.com"
 PAPERTRAIL_PORT =  13596
 
-handler = SysLogHandler(address=(PAPERTRAIL_HOST, PAPERTRAIL_PORT))
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s %(message)s"
+# "papertrail" ships to syslog, "memory" keeps the lines in process (used by the test suite)
+LOG_SINK = os.getenv("LOG_SINK", "papertrail")
+# "udp" sends one datagram per line, "tcp" writes a whole batch of lines at once
+LOG_TRANSPORT = os.getenv("LOG_TRANSPORT", "udp")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10_000))
+# "drop" discards records while the queue is full, "block" waits up to LOG_BLOCK_TIMEOUT seconds first
+LOG_QUEUE_POLICY = os.getenv("LOG_QUEUE_POLICY", "drop")
+LOG_BLOCK_TIMEOUT = float(os.getenv("LOG_BLOCK_TIMEOUT", 0.05))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", 100))
+# Fraction of INFO and DEBUG lines kept per logger, e.g. "capstone.movie.crud=0.1,capstone.user=0.5"
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "")
+
+
+class BoundedQueueHandler(QueueHandler):
+    """Hands records to the log queue, never waiting on the network.
+
+    With the "drop" policy a full queue discards the record, with "block" the caller
+    waits up to `block_timeout` seconds for room before discarding it. Either way
+    the loss is counted in `dropped`. `on_first_record` is called before the first
+    record is queued, to start whatever drains the queue, and called again by the
+    next record if it raises.
+    """
+
+    def __init__(self, log_queue: queue.Queue, policy: str = "drop", block_timeout: float = LOG_BLOCK_TIMEOUT,
+                 on_first_record=None):
+        super().__init__(log_queue)
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self._on_first_record = on_first_record
+
+    def enqueue(self, record):
+        if self._on_first_record is not None:
+            try:
+                self._on_first_record()
+            except Exception:
+                # The record is still queued, for the next record's attempt to ship
+                self.handleError(record)
+            else:
+                self._on_first_record = None
+        try:
+            if self.policy == "block":
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of the INFO and DEBUG records of the configured loggers.
+
+    Rates apply to a logger and its children, the most specific name wins.
+    Warnings and errors always pass.
+    """
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self.sampled_out = 0
+        self._resolved = {}
+
+    def _rate(self, name: str) -> float:
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate = 1.0
+            candidate = name
+            while candidate:
+                if candidate in self.rates:
+                    rate = self.rates[candidate]
+                    break
+                candidate = candidate.rpartition(".")[0]
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno > logging.INFO or not self.rates:
+            return True
+        rate = self._rate(record.name)
+        if rate >= 1 or random.random() < rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+def parse_sampling(value: str) -> dict[str, float]:
+    """Parse "logger=rate,logger=rate" into a dict of rates."""
+    rates = {}
+    for item in value.split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+class BatchingSysLogHandler(SysLogHandler):
+    """Formats syslog frames as they arrive and sends them once per batch, or when flushed.
+
+    Over TCP a batch is a single write of newline-delimited frames. Over UDP every
+    frame is still its own datagram, but the sends happen together on the log thread.
+    The socket is created by the first flush, on that thread too, so building the
+    handler neither resolves the host nor connects. A failed send drops the batch,
+    counts it in `failed` and reconnects on the next one.
+    """
+
+    def __init__(self, address, socktype=socket.SOCK_DGRAM, batch_size: int = LOG_BATCH_SIZE):
+        super().__init__(address=address, socktype=socktype)
+        self.batch_size = batch_size
+        self.failed = 0
+        self._frames = []
+
+    def createSocket(self):
+        # SysLogHandler.__init__ calls this; the socket waits for the first flush instead
+        pass
+
+    def emit(self, record):
+        try:
+            message = self.format(record)
+            if self.ident:
+                message = self.ident + message
+            priority = self.encodePriority(self.facility, self.mapPriority(record.levelname))
+            self._frames.append(f"<{priority}>{message}".encode("utf-8"))
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self._frames) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        frames, self._frames = self._frames, []
+        if not frames:
+            return
+        try:
+            if self.socket is None:
+                super().createSocket()
+            if self.socktype == socket.SOCK_DGRAM:
+                for frame in frames:
+                    self.socket.sendto(frame, self.address)
+            else:
+                self.socket.sendall(b"".join(frame + b"\n" for frame in frames))
+        except OSError:
+            self.failed += len(frames)
+            if self.socket is not None:
+                self.socket.close()
+                self.socket = None
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s %(levelname)s %(name)s %(message)s",
-    handlers=[handler]
-)
+
+class MemorySink(logging.Handler):
+    """Keeps the last `capacity` formatted lines in memory, a stand-in for the syslog collector."""
+
+    def __init__(self, capacity: int = 10_000):
+        super().__init__()
+        self.lines = deque(maxlen=capacity)
+        self.flushes = 0
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+    def flush(self):
+        self.flushes += 1
+
+
+class BatchingQueueListener(QueueListener):
+    """Drains the log queue on a background thread and flushes the sink whenever the queue runs dry."""
+
+    def _monitor(self):
+        while True:
+            record = self.dequeue(True)
+            if record is self._sentinel:
+                break
+            self.handle(record)
+            if self.queue.empty():
+                self._flush()
+        self._flush()
+
+    def _flush(self):
+        for handler in self.handlers:
+            handler.flush()
+
+
+def create_sink() -> logging.Handler:
+    if LOG_SINK == "memory":
+        sink = MemorySink()
+    else:
+        socktype = socket.SOCK_STREAM if LOG_TRANSPORT == "tcp" else socket.SOCK_DGRAM
+        sink = BatchingSysLogHandler((PAPERTRAIL_HOST, PAPERTRAIL_PORT), socktype, LOG_BATCH_SIZE)
+    sink.setFormatter(logging.Formatter(LOG_FORMAT))
+    return sink
+
+
+_sink = None
+_listener = None
+_start_lock = threading.Lock()
+
+
+def start_logging() -> logging.Handler:
+    """Create the sink and start the log thread, once. Returns the sink.
+
+    Called on the app's startup, and by the first record logged before it (or in a
+    script), so importing the app starts no thread. The sink connects from the log thread.
+    """
+    global _sink, _listener
+    with _start_lock:
+        if _listener is None:
+            _sink = create_sink()
+            _listener = BatchingQueueListener(queue_handler.queue, _sink)
+            _listener.start()
+            queue_handler._on_first_record = None
+            # Ship whatever is still queued when the process exits
+            atexit.register(stop_logging)
+    return _sink
+
+
+def stop_logging():
+    """Ship the queued records and stop the log thread, the next record starts it again."""
+    global _listener
+    with _start_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+            queue_handler._on_first_record = start_logging
+
+
+queue_handler = BoundedQueueHandler(queue.Queue(LOG_QUEUE_SIZE), LOG_QUEUE_POLICY, on_first_record=start_logging)
+sampling_filter = SamplingFilter(parse_sampling(LOG_SAMPLING))
+queue_handler.addFilter(sampling_filter)
+# The sink adds the timestamp, level and logger name on the log thread
+queue_handler.setFormatter(logging.Formatter("%(message)s"))
+
+root_logger = logging.getLogger()
+root_logger.setLevel(logging.INFO)
+root_logger.addHandler(queue_handler)
 
 def get_logger(name):
     return logging.getLogger(name)
 
+
+def log_metrics() -> dict:
+    return {
+        "queued": queue_handler.queue.qsize(),
+        "dropped": queue_handler.dropped,
+        "sampled_out": sampling_filter.sampled_out,
+        "failed": getattr(_sink, "failed", 0),
+    }
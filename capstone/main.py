@@ -1,19 +1,81 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.routing import APIRoute, APIWebSocketRoute
 
 from capstone.user.routers import user_router
 from capstone.movie.routers import movie_router
-import capstone.user.models as user_models
-import capstone.movie.models as movie_models
-from capstone.database import engine
+from capstone.database import DATABASE_MODE, dispose_engines, replica_metrics
+from capstone.authentification.hash import hash_pool
+from capstone.logger import log_metrics, start_logging, stop_logging
+from capstone.telemetry import init_telemetry
+from capstone.metrics import MetricsMiddleware, metrics_registry, metrics_router
+from capstone.cache import response_cache
+from capstone.group_commit import write_buffer
+from capstone.feed import feed_hub
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Nothing here touches the database: the schema is created by `python -m capstone.manage sync-schema`,
+    # and the engine and the hashing processes start with the first request that needs them
+    start_logging()
+    init_telemetry()
+    yield
+    feed_hub.close()
+    hash_pool.shutdown()
+    write_buffer.close()
+    await dispose_engines()
+    stop_logging()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+
+metrics_registry.register_collector("hash_pool", hash_pool.metrics)
+metrics_registry.register_collector("response_cache", response_cache.stats)
+metrics_registry.register_collector("log", log_metrics)
+metrics_registry.register_collector("replicas", replica_metrics)
+metrics_registry.register_collector("group_commit", write_buffer.stats)
+metrics_registry.register_collector("feed", feed_hub.stats)
+
+
+def route_methods(route) -> set[str]:
+    # WebSocket routes have no HTTP methods, they are told apart by the scope type
+    return getattr(route, "methods", None) or {"WEBSOCKET"}
 
-app = FastAPI()
 
+def include_routers(app, routers, fallback_routers=()):
+    """Include `routers`, then every route of `fallback_routers` that they do not already serve.
 
-user_models.Base.metadata.create_all(bind = engine)
-movie_models.Base.metadata.create_all(bind = engine)
+    Fallback routes with a fixed path are placed first, so that a parameterized
+    route such as `/movie/{id}` cannot capture a path like `/movie/export`.
+    """
+    for router in routers:
+        app.include_router(router)
+    served = {
+        (route.path, method)
+        for route in app.routes if isinstance(route, (APIRoute, APIWebSocketRoute))
+        for method in route_methods(route)
+    }
+    fixed = 0
+    for router in fallback_routers:
+        for route in router.routes:
+            if any((route.path, method) in served for method in route_methods(route)):
+                continue
+            if "{" in route.path:
+                app.router.routes.append(route)
+            else:
+                app.router.routes.insert(fixed, route)
+                fixed += 1
 
 
-app.include_router(user_router)
-app.include_router(movie_router)
+if DATABASE_MODE == "async":
+    from capstone.user.async_routers import async_user_router
+    from capstone.movie.async_routers import async_movie_router
 
+    # Routes without an async port keep being served by the sync routers
+    include_routers(app, [async_user_router, async_movie_router, metrics_router], [user_router, movie_router])
+else:
+    include_routers(app, [user_router, movie_router, metrics_router])
 
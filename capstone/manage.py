@@ -0,0 +1,169 @@
+"""Maintenance commands for the movie listing API.
+
+Usage:
+    python -m capstone.manage sync-schema
+    python -m capstone.manage reconcile-ratings [--movie-id ID]
+    python -m capstone.manage rebuild-search-index
+    python -m capstone.manage backfill-description-hashes [--batch-size N]
+    python -m capstone.manage import-data FILE --kind {movies,ratings,comments} --username NAME [--format {ndjson,csv}] [--batch-size N]
+"""
+import argparse
+
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.schema import CreateColumn
+
+from capstone.database import Base, SessionLocal, engine
+import capstone.user.models as user_models
+import capstone.movie.models as movie_models
+from capstone.movie.service import MovieService
+from capstone.movie.search import get_search_backend
+from capstone.movie.bulk import BulkImporter, RecordReader, IMPORT_KINDS, IMPORT_FORMATS, DEFAULT_BATCH_SIZE
+from capstone.logger import get_logger
+from capstone.telemetry import init_telemetry
+
+logger = get_logger(__name__)
+
+
+def sync_schema():
+    """Create missing tables, and add the columns and indexes introduced after a table was created."""
+    Base.metadata.create_all(bind=engine)
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+                logger.info(f"Added column {table.name}.{column.name}")
+            if table.name == "ratings" and "uq_ratings_user_id_movie_id" not in {index["name"] for index in inspector.get_indexes(table.name)}:
+                remove_duplicate_ratings(connection)
+            for index in table.indexes:
+                index.create(bind=connection, checkfirst=True)
+
+
+def remove_duplicate_ratings(connection):
+    """Keep only the latest rating of each user for a movie, so the unique rating index can be built."""
+    ratings = movie_models.Rating.__table__
+    latest = select(func.max(ratings.c.id)).group_by(ratings.c.user_id, ratings.c.movie_id)
+    removed = connection.execute(ratings.delete().where(ratings.c.id.not_in(latest))).rowcount
+    if removed:
+        logger.warning(f"Removed {removed} duplicate rating(s), run reconcile-ratings to rebuild the aggregates")
+    return removed
+
+
+def reconcile_ratings(movie_id=None):
+    """Backfill or repair the rating aggregates stored on the movies table."""
+    db = SessionLocal()
+    try:
+        return MovieService.reconcile_rating_aggregates(db, movie_id)
+    finally:
+        db.close()
+
+
+def rebuild_search_index():
+    """Create the full-text search index if it is missing and index every existing movie."""
+    with engine.begin() as connection:
+        get_search_backend(connection).rebuild(connection)
+
+
+def recompute_rankings():
+    """Rebuild the leaderboard with a fresh catalog-wide mean rating, run periodically to correct drift."""
+    db = SessionLocal()
+    try:
+        return MovieService.recompute_rankings(db)
+    finally:
+        db.close()
+
+
+def backfill_description_hashes(batch_size=1000):
+    """Hash the descriptions of movies listed before duplicate detection moved to the description hash index."""
+    db = SessionLocal()
+    try:
+        return MovieService.backfill_description_hashes(db, batch_size)
+    finally:
+        db.close()
+
+
+def import_data(path, kind, username, fmt=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Stream an NDJSON or CSV file into the database as `username`, printing a line per batch."""
+    fmt = fmt or ("csv" if path.endswith(".csv") else "ndjson")
+    db = SessionLocal()
+    try:
+        user = db.query(user_models.User).filter(user_models.User.username == username).first()
+        if user is None:
+            raise SystemExit(f"User '{username}' not found")
+        importer = BulkImporter(db, user.id, kind, batch_size)
+        reader = RecordReader(fmt)
+
+        def report(batch):
+            print(f"batch {batch['batch']} (lines {batch['first_line']}-{batch['last_line']}): "
+                  f"{batch['inserted']} inserted, {batch['duplicates']} duplicates, {batch['error_count']} errors")
+            for error in batch["errors"]:
+                print(f"  line {error['line']}: {error['error']}")
+
+        with open(path, encoding="utf-8", newline="") as upload:
+            for line in upload:
+                for line_number, record in reader.feed(line):
+                    if importer.add(line_number, record):
+                        report(importer.flush())
+        for line_number, record in reader.finish():
+            importer.add(line_number, record)
+        batch = importer.flush()
+        if batch:
+            report(batch)
+        return importer.summary()
+    finally:
+        db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m capstone.manage")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("sync-schema", help="Create tables and add missing columns")
+
+    reconcile = commands.add_parser("reconcile-ratings", help="Recompute rating aggregates from the ratings table")
+    reconcile.add_argument("--movie-id", type=int, default=None, help="Only reconcile this movie")
+
+    commands.add_parser("rebuild-search-index", help="Create the full-text search index and re-index all movies")
+
+    commands.add_parser("recompute-rankings", help="Rebuild the leaderboard from the rating aggregates")
+
+    backfill = commands.add_parser("backfill-description-hashes", help="Hash the descriptions of existing movies")
+    backfill.add_argument("--batch-size", type=int, default=1000)
+
+    data = commands.add_parser("import-data", help="Bulk import movies, ratings or comments from NDJSON or CSV")
+    data.add_argument("path")
+    data.add_argument("--kind", choices=IMPORT_KINDS, required=True)
+    data.add_argument("--username", required=True, help="The user the imported records belong to")
+    data.add_argument("--format", choices=IMPORT_FORMATS, default=None, help="Defaults to the file extension")
+    data.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+
+    args = parser.parse_args(argv)
+    init_telemetry()
+
+    if args.command == "sync-schema":
+        sync_schema()
+        print("Schema is up to date")
+    elif args.command == "reconcile-ratings":
+        updated = reconcile_ratings(args.movie_id)
+        print(f"Reconciled rating aggregates, {updated} movie(s) updated")
+    elif args.command == "rebuild-search-index":
+        rebuild_search_index()
+        print("Search index rebuilt")
+    elif args.command == "recompute-rankings":
+        ranked = recompute_rankings()
+        print(f"Leaderboard rebuilt, {ranked} movie(s) ranked")
+    elif args.command == "backfill-description-hashes":
+        updated, duplicates = backfill_description_hashes(args.batch_size)
+        print(f"Hashed {updated} description(s), {duplicates} duplicate(s) left unhashed")
+    elif args.command == "import-data":
+        summary = import_data(args.path, args.kind, args.username, args.format, args.batch_size)
+        print(f"Imported {summary['inserted']} {args.kind}: {summary['duplicates']} duplicates, "
+              f"{summary['errors']} errors in {summary['batches']} batch(es)")
+
+
+if __name__ == "__main__":
+    main()
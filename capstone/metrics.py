@@ -0,0 +1,210 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+
+from capstone.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Statements one request may issue before a warning is logged
+SQL_STATEMENT_BUDGET = int(os.getenv("SQL_STATEMENT_BUDGET", 20))
+
+# Upper bounds of the request latency (seconds) and statements per request histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class RequestStats:
+    """The SQL work of one request, filled in by the engine hooks."""
+
+    __slots__ = ("statements", "db_seconds", "rows")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+
+
+_current_request = ContextVar("current_request", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_request.get() is not None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_request.get()
+    if stats is None or not conn.info.get("query_start"):
+        return
+    stats.db_seconds += time.perf_counter() - conn.info["query_start"].pop()
+    stats.statements += 1
+    # Drivers report -1 when they do not know the row count of a SELECT before it is fetched
+    if cursor.rowcount > 0:
+        stats.rows += cursor.rowcount
+
+
+def track_statements(target):
+    """Count the statements, rows and DB time of the current request on `target`, an engine or the Engine class."""
+    event.listen(target, "before_cursor_execute", _before_cursor_execute)
+    event.listen(target, "after_cursor_execute", _after_cursor_execute)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+
+class RouteMetrics:
+    __slots__ = ("responses", "latency", "statements", "db_seconds", "rows", "over_budget")
+
+    def __init__(self):
+        self.responses = {}
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.statements = Histogram(STATEMENT_BUCKETS)
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.over_budget = 0
+
+
+class MetricsRegistry:
+    """Per-route request metrics, plus the snapshots of registered collectors, in Prometheus text format."""
+
+    def __init__(self, statement_budget: int = SQL_STATEMENT_BUDGET):
+        self.statement_budget = statement_budget
+        self.routes = {}
+        self.collectors = {}
+        self._lock = threading.Lock()
+
+    def register_collector(self, name: str, collect):
+        """Add `collect`, a function returning a dict of numbers (or dicts of numbers), to the output as gauges."""
+        self.collectors[name] = collect
+
+    def observe(self, method: str, route: str, status_code: int, elapsed: float, stats: RequestStats):
+        with self._lock:
+            metrics = self.routes.get((method, route))
+            if metrics is None:
+                metrics = self.routes[(method, route)] = RouteMetrics()
+            metrics.responses[status_code] = metrics.responses.get(status_code, 0) + 1
+            metrics.latency.observe(elapsed)
+            metrics.statements.observe(stats.statements)
+            metrics.db_seconds += stats.db_seconds
+            metrics.rows += stats.rows
+            if stats.statements > self.statement_budget:
+                metrics.over_budget += 1
+        if stats.statements > self.statement_budget:
+            logger.warning(
+                f"{method} {route} issued {stats.statements} SQL statements "
+                f"(budget {self.statement_budget}) in {stats.db_seconds * 1000:.1f} ms of DB time."
+            )
+
+    def render(self) -> str:
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def histogram(name, labels, histogram):
+            cumulative = 0
+            for bound, count in zip([*map(str, histogram.buckets), "+Inf"], histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {histogram.total}")
+            lines.append(f"{name}_count{{{labels}}} {cumulative}")
+
+        with self._lock:
+            routes = [(f'method="{method}",route="{route}"', metrics) for (method, route), metrics in sorted(self.routes.items())]
+
+            family("capstone_http_requests_total", "counter", "Responses by route and status code.")
+            for labels, metrics in routes:
+                for status_code, count in sorted(metrics.responses.items()):
+                    lines.append(f'capstone_http_requests_total{{{labels},status="{status_code}"}} {count}')
+            family("capstone_http_request_duration_seconds", "histogram", "Time to respond, by route.")
+            for labels, metrics in routes:
+                histogram("capstone_http_request_duration_seconds", labels, metrics.latency)
+            family("capstone_db_statements_per_request", "histogram", "SQL statements issued per request, by route.")
+            for labels, metrics in routes:
+                histogram("capstone_db_statements_per_request", labels, metrics.statements)
+            family("capstone_db_seconds_total", "counter", "Time spent executing SQL, by route.")
+            for labels, metrics in routes:
+                lines.append(f"capstone_db_seconds_total{{{labels}}} {metrics.db_seconds}")
+            family("capstone_db_rows_total", "counter", "Rows reported by the driver for the SQL statements, by route.")
+            for labels, metrics in routes:
+                lines.append(f"capstone_db_rows_total{{{labels}}} {metrics.rows}")
+            family("capstone_db_statement_budget_exceeded_total", "counter", "Requests over SQL_STATEMENT_BUDGET, by route.")
+            for labels, metrics in routes:
+                lines.append(f"capstone_db_statement_budget_exceeded_total{{{labels}}} {metrics.over_budget}")
+
+        for name, collect in self.collectors.items():
+            for key, value in collect().items():
+                metric = f"capstone_{name}_{key}"
+                family(metric, "gauge", f"{key.replace('_', ' ').capitalize()} of {name.replace('_', ' ')}.")
+                if isinstance(value, dict):
+                    lines.extend(f'{metric}{{key="{label}"}} {number}' for label, number in value.items())
+                else:
+                    lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics_registry = MetricsRegistry()
+
+
+class MetricsMiddleware:
+    """Times every HTTP request and records it with the SQL work it caused, under its route template."""
+
+    def __init__(self, app, registry: MetricsRegistry = metrics_registry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current_request.set(stats)
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_request.reset(token)
+            # The router records the matched route in the scope; unmatched paths share one label
+            route = scope.get("route")
+            self.registry.observe(scope["method"], getattr(route, "path", "<unmatched>"), status_code,
+                                  time.perf_counter() - start, stats)
+
+
+metrics_router = APIRouter(tags=["Metrics"])
+
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def fetch_metrics():
+    """
+    ## Prometheus metrics
+    Request latency, SQL statements, DB time and rows per route, and the state of the
+    password hashing pool, the response cache and the log queue
+    """
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
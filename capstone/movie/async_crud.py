@@ -0,0 +1,299 @@
+from fastapi import Depends, HTTPException, status
+from sqlalchemy import select
+
+from capstone.database import async_db_dependency
+from capstone.movie.schema import CreateMovie
+from capstone.user.schemas  import Login
+from capstone.movie.models import Movie as Movie_model, with_comment_counts
+from capstone.authentification.oauth2 import get_current_user
+from capstone.movie.schema import Rating as RatingSchema
+from capstone.movie.schema import Comment as CommentSchema
+from capstone.movie.models import Comment as CommentModel
+from capstone.movie.schema import ReplyComment
+from capstone.movie.crud import MOVIE_ORDERINGS, MAX_BATCH_IDS
+
+from capstone.movie.async_service import AsyncMovieService
+from capstone.movie.search import get_search_backend
+from capstone.movie.threads import thread_statement, build_threads, DEFAULT_THREAD_DEPTH
+from capstone.cache import response_cache, movie_tag, ACTIVITY, CATALOG
+from capstone.feed import feed_hub
+from capstone.pagination import keyset_query, keyset_result, encode_cursor, decode_offset, DEFAULT_LIMIT
+
+from capstone.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+async def list_movie(db : async_db_dependency, payload : CreateMovie, current_user : Login = Depends(get_current_user)):
+    logger.info(f"User {current_user.username} is attempting to list a new movie: {payload.title}")
+
+    user = await AsyncMovieService.fetch_user(db, current_user)
+    new_movie = await AsyncMovieService.create_new_movie(db, payload, user.id)
+    response_cache.invalidate(CATALOG)
+
+    logger.info(f"Movie '{new_movie.title}' has been listed by user {current_user.username} with ID {new_movie.id}.")
+    return new_movie
+
+
+async def fetch_movies(db : async_db_dependency, after : str | None = None, limit : int = DEFAULT_LIMIT, order : str = "id",
+                       stats : bool = False):
+    logger.info(f"Fetching movies after cursor={after} with limit={limit} ordered by {order} (stats={stats})")
+
+    columns, descending = MOVIE_ORDERINGS[order]
+    statement = select(Movie_model)
+    if stats:
+        # The rating aggregates are columns of the movie row; the comment counts are joined to the same statement
+        statement = with_comment_counts(statement, columns)
+    statement = keyset_query(statement, order, columns, after, limit, descending)
+    movies, next_cursor = keyset_result((await db.scalars(statement)).all(), order, columns, limit)
+    logger.info(f"Fetched {len(movies)} movies with limit={limit} ordered by {order}")
+    return movies, next_cursor
+
+
+async def fetch_leaderboard(db : async_db_dependency, after : str | None = None, limit : int = DEFAULT_LIMIT):
+    logger.info(f"Fetching the leaderboard after cursor={after} with limit={limit}")
+    entries, next_cursor = await AsyncMovieService.fetch_leaderboard(db, after, limit)
+    logger.info(f"Fetched {len(entries)} leaderboard entries with limit={limit}")
+    return entries, next_cursor
+
+
+async def fetch_movie_batch(db : async_db_dependency, movie_ids : list[int], include_ratings : bool = False):
+    logger.info(f"Fetching a batch of {len(movie_ids)} movie ID(s) (include_ratings={include_ratings})")
+    unique_ids = list(dict.fromkeys(movie_ids))
+    if len(unique_ids) > MAX_BATCH_IDS:
+        logger.warning(f"Batch lookup of {len(unique_ids)} movies rejected, the limit is {MAX_BATCH_IDS}")
+        raise HTTPException(
+            status_code = status.HTTP_400_BAD_REQUEST,
+            detail = f"At most {MAX_BATCH_IDS} movie IDs can be fetched at once"
+        )
+    movies = await AsyncMovieService.fetch_movies_by_ids(db, unique_ids) if unique_ids else []
+    batch = AsyncMovieService.batch_result(movie_ids, movies, include_ratings)
+    logger.info(f"Fetched {len(batch['movies'])} movie(s), {len(batch['missing'])} ID(s) not found")
+    return batch
+
+
+async def fetch_movie_by_id(db : async_db_dependency, movie_id : int):
+    logger.info(f"Fetching movie with ID={movie_id}")
+    movie = await AsyncMovieService.fetch_movie(db, movie_id)
+
+    if movie is None:
+        logger.warning(f"Movie with ID={movie_id} not found")
+        raise HTTPException(
+            status_code = status.HTTP_404_NOT_FOUND,
+            detail = "Movie not found"
+        )
+    logger.info(f"Movie with ID={movie_id} found: {movie.title}")
+
+    return movie
+
+
+async def update_movie(db : async_db_dependency, movie_id : int, payload : CreateMovie, current_user : Login = Depends(get_current_user)):
+    logger.info(f"User '{current_user.username}' is attempting to update movie with ID={movie_id}")
+
+    user = await AsyncMovieService.fetch_user(db, current_user)
+    movie = await AsyncMovieService.fetch_movie(db, movie_id)
+    if movie is None:
+        logger.info(f"User '{current_user.username}' is attempting to update movie with ID={movie_id}")
+        raise HTTPException(
+            status_code = status.HTTP_404_NOT_FOUND,
+            detail = "Movie not found"
+        )
+    AsyncMovieService.check_movie_ownership(user, movie)
+    movie = AsyncMovieService.update_movie_details(movie, payload)
+    await AsyncMovieService.commit_movie(db)
+    response_cache.invalidate(CATALOG, movie_tag(movie_id))
+    logger.info(f"Movie with ID={movie_id} successfully updated by user '{current_user.username}'")
+    return movie
+
+
+async def delete_movie(db : async_db_dependency, movie_id : int, current_user : Login = Depends(get_current_user)):
+    logger.info(f"User '{current_user.username}' is attempting to delete movie with ID={movie_id}")
+
+    user = await AsyncMovieService.fetch_user(db, current_user)
+    movie = await AsyncMovieService.fetch_movie(db, movie_id)
+
+    if movie is None:
+        logger.warning(f"Movie with ID={movie_id} not found. Deletion operation aborted.")
+        raise HTTPException(
+            status_code = status.HTTP_404_NOT_FOUND,
+            detail = "Movie not found"
+        )
+    AsyncMovieService.ensure_user_can_modify_movie(user, movie)
+    await db.delete(movie)
+    await db.commit()
+    response_cache.invalidate(CATALOG, movie_tag(movie_id))
+    logger.info(f"Movie with ID={movie_id} successfully deleted by user '{current_user.username}'")
+
+
+async def search_movie(db : async_db_dependency, title : str, after : str | None = None, limit : int = DEFAULT_LIMIT,
+                       stats : bool = False):
+    logger.info(f"Searching for movies matching '{title}' (after={after}, limit={limit}, stats={stats})")
+    offset = decode_offset(after, "search")
+    # The session picks its database once it connects, which a replica session only does from its greenlet
+    statement = get_search_backend(await db.connection()).statement(title, offset, limit + 1, stats)
+    movies = (await db.scalars(statement)).all() if statement is not None else []
+    if not movies:
+        logger.warning(f"No movies found matching '{title}'")
+        raise HTTPException(
+            status_code = status.HTTP_404_NOT_FOUND,
+            detail = "No results found"
+        )
+    next_cursor = encode_cursor("search", [offset + limit]) if len(movies) > limit else None
+    logger.info(f"Found {len(movies[:limit])} movie(s) matching '{title}'")
+    return movies[:limit], next_cursor
+
+
+async def rate_movie(db : async_db_dependency, payload : RatingSchema, current_user : Login = Depends(get_current_user)):
+    logger.info(f"User '{current_user.username}' is attempting to rate movie with ID={payload.movie_id}")
+
+    user = await AsyncMovieService.fetch_user(db, current_user)
+    target = await AsyncMovieService.fetch_rating_target(db, payload.movie_id, user.id)
+    if target is None:
+        logger.error(f"Movie with ID {payload.movie_id} not found.")
+        raise HTTPException(
+            status_code = status.HTTP_404_NOT_FOUND,
+            detail = "Movie not found"
+        )
+    movie, previous, prior_mean = target
+    if AsyncMovieService.check_rating_range(payload.rating):
+        raise HTTPException(
+            status_code = status.HTTP_400_BAD_REQUEST,
+            detail = "Rating must be an integer between 0 and 11"
+        )
+    # A new rating is inserted, a second one from the same user replaces the first
+    await db.execute(AsyncMovieService.rating_upsert(db, user.id, payload.movie_id, payload.rating))
+    # Update the movie's aggregates in the same transaction as the rating
+    AsyncMovieService.record_rating(movie, payload.rating, previous)
+    await AsyncMovieService.update_rankings(db, [movie], prior_mean)
+    await db.commit()
+    response_cache.invalidate(movie_tag(payload.movie_id), ACTIVITY)
+    feed_hub.publish(payload.movie_id, "rating", AsyncMovieService.rating_summary(movie))
+    logger.info(f"User {current_user.username} successfully rated movie with ID {payload.movie_id}"
+                f"{'' if previous is None else f' (was {previous})'}.")
+    return AsyncMovieService.average_rating(movie)
+
+
+async def get_ratings(db : async_db_dependency, movie_id : int):
+    logger.info(f"Fetching ratings for movie with ID={movie_id}")
+    movie = await AsyncMovieService.fetch_movie(db, movie_id)
+    if movie is None:
+        logger.error(f"Movie with ID {movie_id} not found.")
+        raise HTTPException(
+            status_code = status.HTTP_404_NOT_FOUND,
+            detail = "Movie not found"
+        )
+    return AsyncMovieService.average_rating(movie)
+
+
+async def get_rating_summary(db : async_db_dependency, movie_id : int):
+    logger.info(f"Fetching rating summary for movie with ID={movie_id}")
+    movie = await AsyncMovieService.fetch_movie(db, movie_id)
+    if movie is None:
+        logger.error(f"Movie with ID {movie_id} not found.")
+        raise HTTPException(
+            status_code = status.HTTP_404_NOT_FOUND,
+            detail = "Movie not found"
+        )
+    return AsyncMovieService.rating_summary(movie)
+
+
+async def comment(db : async_db_dependency, payload : CommentSchema,  current_user : Login = Depends(get_current_user)):
+    logger.info(f"User {current_user.username} is attempting to comment on movie with ID {payload.movie_id}.")
+    user = await AsyncMovieService.fetch_user(db, current_user)
+    movie = await AsyncMovieService.fetch_movie(db, payload.movie_id)
+    if movie is None:
+        logger.error(f"Movie with ID {payload.movie_id} not found.")
+        raise HTTPException(
+            status_code = status.HTTP_404_NOT_FOUND,
+            detail = "Movie not found"
+        )
+    new_comment = CommentModel(
+        user_id = user.id,
+        movie_id = payload.movie_id,
+        content = payload.content
+    )
+    db.add(new_comment)
+    await db.commit()
+    response_cache.invalidate(ACTIVITY)
+    await db.refresh(new_comment)
+    feed_hub.publish(payload.movie_id, "comment", AsyncMovieService.comment_event(new_comment))
+    logger.info(f"User {current_user.username} successfully commented on movie with ID {payload.movie_id}.")
+    return new_comment
+
+
+async def fetch_comments(db : async_db_dependency, movie_id : int, after : str | None = None, limit : int = DEFAULT_LIMIT):
+    movie = await AsyncMovieService.fetch_movie(db, movie_id)
+    if movie is None:
+        logger.error(f"Movie with ID {movie_id} not found.")
+        raise HTTPException(
+            status_code = status.HTTP_404_NOT_FOUND,
+            detail = "Movie not found"
+        )
+
+    logger.info(f"Fetching comments for movie with ID={movie_id}")
+    columns = [CommentModel.id]
+    statement = keyset_query(select(CommentModel).filter(CommentModel.movie_id == movie_id), "id", columns, after, limit)
+    comments, next_cursor = keyset_result((await db.scalars(statement)).all(), "id", columns, limit)
+    logger.info(f"Found {len(comments)} comments for movie with ID={movie_id}.")
+    return comments, next_cursor
+
+
+async def fetch_comment_threads(db : async_db_dependency, movie_id : int, after : str | None = None, limit : int = DEFAULT_LIMIT,
+                                depth : int = DEFAULT_THREAD_DEPTH):
+    movie = await AsyncMovieService.fetch_movie(db, movie_id)
+    if movie is None:
+        logger.error(f"Movie with ID {movie_id} not found.")
+        raise HTTPException(
+            status_code = status.HTTP_404_NOT_FOUND,
+            detail = "Movie not found"
+        )
+
+    logger.info(f"Fetching comment threads for movie with ID={movie_id} after cursor={after} with limit={limit} and depth={depth}")
+    roots = select(CommentModel.id).filter(CommentModel.movie_id == movie_id, CommentModel.parent_id.is_(None))
+    roots = keyset_query(roots, "thread", [CommentModel.id], after, limit)
+    threads = build_threads((await db.execute(thread_statement(roots, depth))).all())
+    next_cursor = None
+    if len(threads) > limit:
+        threads = threads[:limit]
+        next_cursor = encode_cursor("thread", [threads[-1]["id"]])
+    logger.info(f"Found {len(threads)} comment threads for movie with ID={movie_id}.")
+    return threads, next_cursor
+
+
+async def fetch_comment_thread(db : async_db_dependency, comment_id : int, depth : int = DEFAULT_THREAD_DEPTH):
+    logger.info(f"Fetching the thread of comment with ID={comment_id} with depth={depth}")
+    threads = build_threads((await db.execute(thread_statement([comment_id], depth))).all())
+    if not threads:
+        logger.error(f"Comment with ID {comment_id} not found.")
+        raise HTTPException(
+            status_code = status.HTTP_404_NOT_FOUND,
+            detail = "Comment not found"
+        )
+    return threads[0]
+
+
+async def reply_to_comment(db : async_db_dependency, payload : ReplyComment,  current_user : Login = Depends(get_current_user)):
+    logger.info(f"User {current_user.username} is attempting to reply to comment with ID={payload.comment_id}.")
+
+    user = await AsyncMovieService.fetch_user(db, current_user)
+    comment = await db.scalar(select(CommentModel).filter(CommentModel.id == payload.comment_id))
+    if comment is None:
+        logger.error(f"Comment with ID {payload.comment_id} not found.")
+        raise HTTPException(
+            status_code = status.HTTP_404_NOT_FOUND,
+            detail = "Comment not found"
+        )
+    logger.info(f"Movie with ID={comment.movie_id} found. Creating reply.")
+    new_reply = CommentModel(
+        user_id = user.id,
+        movie_id = comment.movie_id,
+        content = payload.content,
+        parent_id = payload.comment_id
+    )
+    db.add(new_reply)
+    await db.commit()
+    response_cache.invalidate(ACTIVITY)
+    await db.refresh(new_reply)
+    feed_hub.publish(comment.movie_id, "comment", AsyncMovieService.comment_event(new_reply))
+    logger.info(f"Reply created successfully with ID={new_reply.id} by user ID={user.id} for comment ID={payload.comment_id}.")
+    return new_reply
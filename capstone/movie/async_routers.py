@@ -0,0 +1,242 @@
+from typing import Literal
+
+from fastapi import APIRouter, Depends, Query, Request, Response, status
+
+
+from capstone.movie.schema import Movie, MovieStats, CreateMovie
+from capstone.user.schemas import Login
+from capstone.authentification.oauth2 import get_current_user
+from capstone.database import async_db_dependency, async_read_db_dependency
+import capstone.movie.async_crud as crud
+from capstone.movie.schema import Rating as RatingSchema
+from capstone.movie.schema import Comment as CommentSchema
+from capstone.movie.schema import CommentResponse
+from capstone.movie.schema import ReplyComment 
+from capstone.movie.schema import RatingSummary
+from capstone.movie.schema import CommentThread
+from capstone.movie.schema import LeaderboardEntry
+from capstone.movie.schema import MovieBatch, MovieBatchRequest
+from capstone.movie.threads import DEFAULT_THREAD_DEPTH, MAX_THREAD_DEPTH
+from capstone.pagination import DEFAULT_LIMIT, MAX_LIMIT, NEXT_CURSOR_HEADER
+from capstone.cache import response_cache, movie_tag, ACTIVITY, CATALOG
+
+
+
+async_movie_router = APIRouter(
+    prefix= "/movie",
+    tags= ["Movie"]
+)
+
+@async_movie_router.post("/", response_model = Movie, status_code = status.HTTP_201_CREATED)
+async def list_movie(db : async_db_dependency, payload : CreateMovie, current_user : Login = Depends(get_current_user)):
+
+    """
+    ## Listing a movie
+    This requires the folowing
+    - title : str
+    - description : str
+    """
+    return await crud.list_movie(db , payload , current_user)
+
+@async_movie_router.get("/", response_model= list[MovieStats] | list[Movie])
+async def fetch_movies(db : async_read_db_dependency, request : Request, after : str | None = None,
+                       limit : int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+                       order : Literal["id", "release_date"] = "id", stats : bool = False):
+    """
+    ## Fetch all movies
+    This lists all movies in database and can be accessed by the public.
+    Results are paginated with a cursor: when more movies exist, the
+    `X-Next-Cursor` response header holds the value to pass as `after`
+    to get the next page.
+    - order : "id" (oldest listing first) or "release_date" (newest first)
+    - stats : add each movie's average_rating, rating_count and comment_count
+
+    Responses carry an ETag: send it back in `If-None-Match` to get a 304 when nothing changed.
+    """
+
+    async def produce():
+        movies, next_cursor = await crud.fetch_movies(db, after, limit, order, stats)
+        headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+        schema = MovieStats if stats else Movie
+        return [schema.model_validate(movie, from_attributes=True).model_dump(mode="json") for movie in movies], headers
+
+    # Counts change with every rating and comment, the plain listing only with the catalog
+    tags = [CATALOG, ACTIVITY] if stats else [CATALOG]
+    return await response_cache.respond_async(request, f"movies:{order}:{after}:{limit}:{stats}", tags, produce)
+
+@async_movie_router.get("/leaderboard", response_model= list[LeaderboardEntry])
+async def fetch_leaderboard(db : async_read_db_dependency, response : Response, after : str | None = None,
+                            limit : int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT)):
+    """
+    ## Top-rated movies
+    This ranks rated movies by a Bayesian average: each movie's ratings plus a
+    fixed number of votes at the catalog's mean rating, so a few high ratings do
+    not outrank many. It can be accessed by the public.
+    Results are paginated with a cursor: pass the `X-Next-Cursor` response header as `after`.
+    """
+    entries, next_cursor = await crud.fetch_leaderboard(db, after, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return entries
+
+@async_movie_router.get("/batch", response_model= MovieBatch)
+async def fetch_movie_batch(db : async_read_db_dependency, request : Request, ids : list[int] = Query(), include_ratings : bool = False):
+    """
+    ## Fetch several movies by id
+    This resolves every id in one query and can be accessed by the public. Pass the ids
+    as repeated `ids` parameters; movies come back in the order requested, and ids with
+    no movie are listed in `missing`. Set `include_ratings` to embed each movie's rating summary.
+    For long lists, POST the same fields to this path instead.
+    """
+    async def produce():
+        batch = await crud.fetch_movie_batch(db, ids, include_ratings)
+        return MovieBatch.model_validate(batch).model_dump(mode="json"), None
+
+    # A batch changes with any of its movies, and when a missing id gets listed
+    tags = [CATALOG, *(movie_tag(movie_id) for movie_id in dict.fromkeys(ids))]
+    return await response_cache.respond_async(request, f"batch:{include_ratings}:{','.join(map(str, ids))}", tags, produce)
+
+@async_movie_router.post("/batch", response_model= MovieBatch)
+async def fetch_movie_batch_post(db : async_read_db_dependency, payload : MovieBatchRequest):
+    """
+    ## Fetch several movies by id
+    The POST form of `GET /movie/batch`, for lists of ids too long for a URL. This requires
+    - ids : list[int]
+    - include_ratings : bool (optional)
+    """
+    return await crud.fetch_movie_batch(db, payload.ids, payload.include_ratings)
+
+@async_movie_router.get("/{id}", response_model = Movie)
+async def fetch_movie(db : async_read_db_dependency, request : Request, id : int):
+    """
+    ## Fetch a movie by id
+    This fetches a movie by its id and can be accessed by the public.
+    Send the ETag back in `If-None-Match` to get a 304 when the movie has not changed.
+    """
+    async def produce():
+        movie = await crud.fetch_movie_by_id(db, id)
+        return Movie.model_validate(movie, from_attributes=True).model_dump(mode="json"), None
+
+    return await response_cache.respond_async(request, f"movie:{id}", [movie_tag(id)], produce)
+
+
+@async_movie_router.put("/{id}", response_model = Movie)
+async def update_movie(db : async_db_dependency, id : int, payload : CreateMovie, current_user : Login = Depends(get_current_user)):
+    """
+    ## Update a movie by id
+    This updates a movie by its id and can only be executed by the owner
+    """
+    return await crud.update_movie(db, id, payload, current_user)
+
+@async_movie_router.delete("/{id}", status_code= status.HTTP_204_NO_CONTENT)
+async def delete_movie(db : async_db_dependency, id : int, current_user : Login = Depends(get_current_user)):
+    """
+    ## Delete a movie by id
+    This deletes a movie by its id and can only be executed by the owner
+    """
+    return await crud.delete_movie(db, id, current_user)
+
+@async_movie_router.get("/search/{title}", response_model= list[MovieStats] | list[Movie])
+async def search_movie(db : async_read_db_dependency, title : str, response : Response, after : str | None = None,
+                       limit : int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT), stats : bool = False):
+    """
+    ## Search for a movie by title
+    This searches movie titles and descriptions and can be accessed by the public.
+    Every word must match, the last letters of a word can be left out, and the
+    best matches come first. Pass the `X-Next-Cursor` response header as `after`
+    to get the next page. Set `stats` to add each movie's average_rating,
+    rating_count and comment_count.
+    """
+    movies, next_cursor = await crud.search_movie(db, title, after, limit, stats)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    schema = MovieStats if stats else Movie
+    return [schema.model_validate(movie, from_attributes=True) for movie in movies]
+
+@async_movie_router.post("/{movie_id}/rate", status_code= status.HTTP_201_CREATED)
+async def rate_movie(db : async_db_dependency, payload : RatingSchema, current_user : Login = Depends(get_current_user)):
+    """
+    ## Rate a movie by id
+    This rates a movie by its id and can only be executed a registered users once
+    """
+    return await crud.rate_movie(db, payload, current_user)
+
+
+@async_movie_router.get("/{movie_id}/ratings")
+async def fetch_ratings(db : async_read_db_dependency, request : Request, movie_id : int):
+    """
+    ## Get ratings for a movie by id
+    This fetches ratings for a movie by its id and can be accessed by the public.
+    Send the ETag back in `If-None-Match` to get a 304 when no rating was added.
+    """
+    async def produce():
+        return await crud.get_ratings(db, movie_id), None
+
+    return await response_cache.respond_async(request, f"ratings:{movie_id}", [movie_tag(movie_id)], produce)
+
+@async_movie_router.get("/{movie_id}/ratings/summary", response_model= RatingSummary)
+async def fetch_rating_summary(db : async_read_db_dependency, movie_id : int):
+    """
+    ## Get the rating breakdown for a movie by id
+    This returns the rating count, average and per-score histogram of a movie and can be accessed by the public
+    """
+    return await crud.get_rating_summary(db, movie_id)
+
+@async_movie_router.post("/{id}/comment", response_model= CommentResponse, status_code=status.HTTP_201_CREATED)
+async def comment(db : async_db_dependency, payload : CommentSchema,  current_user : Login = Depends(get_current_user)):
+    """
+    ## Comment on a movie by id
+    This comments on a movie by its id and can only be executed registered users
+    """
+    return await crud.comment(db, payload, current_user)
+
+@async_movie_router.get("/{movie_id}/comments")
+async def fetch_comments(db : async_read_db_dependency, movie_id : int, response : Response, after : str | None = None,
+                         limit : int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT)):
+    """
+    ## Get comments for a movie by id
+    This fetches comments for a movie by its id and can be accessed by the public.
+    Pass the `X-Next-Cursor` response header as `after` to get the next page.
+    """
+
+    comments, next_cursor = await crud.fetch_comments(db, movie_id, after, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return comments
+
+@async_movie_router.get("/{movie_id}/comments/threads", response_model= list[CommentThread])
+async def fetch_comment_threads(db : async_read_db_dependency, movie_id : int, response : Response, after : str | None = None,
+                                limit : int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+                                depth : int = Query(DEFAULT_THREAD_DEPTH, ge=0, le=MAX_THREAD_DEPTH)):
+    """
+    ## Get comment threads for a movie by id
+    This fetches the top-level comments of a movie with their replies nested
+    up to `depth` levels, and can be accessed by the public. A reply with
+    `has_more_replies` has deeper replies, fetch them from its thread.
+    Pass the `X-Next-Cursor` response header as `after` to get the next page.
+    """
+
+    threads, next_cursor = await crud.fetch_comment_threads(db, movie_id, after, limit, depth)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return threads
+
+@async_movie_router.get("/comments/{comment_id}/thread", response_model= CommentThread)
+async def fetch_comment_thread(db : async_read_db_dependency, comment_id : int,
+                               depth : int = Query(DEFAULT_THREAD_DEPTH, ge=0, le=MAX_THREAD_DEPTH)):
+    """
+    ## Get the thread of a comment by id
+    This fetches a comment with its replies nested up to `depth` levels and can be accessed by the public
+    """
+    return await crud.fetch_comment_thread(db, comment_id, depth)
+
+@async_movie_router.post("/{comment_id}/reply")
+async def reply_to_comment(db : async_db_dependency, payload : ReplyComment,  current_user : Login = Depends(get_current_user)):
+    """
+    ## Reply to a comment by id
+    This replies to a comment by its id and can only be executed registered users
+    """
+    return await crud.reply_to_comment(db, payload, current_user)
+
+    
+
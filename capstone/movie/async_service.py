@@ -0,0 +1,75 @@
+from datetime import datetime, timezone
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from capstone.movie.models import Movie, MovieRanking, RankingPrior
+from capstone.movie.rankings import DEFAULT_PRIOR_MEAN, LEADERBOARD_COLUMNS, leaderboard_statement, ranking_row
+from capstone.database import upsert
+from capstone.pagination import keyset_query, keyset_result
+from capstone.movie.service import MovieService
+from capstone.user.models import User
+from capstone.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class AsyncMovieService(MovieService):
+    # AsyncSession counterparts of the MovieService queries; the checks that
+    # do not touch the database are inherited unchanged
+
+    # Creates a new movie entry in the database
+    async def create_new_movie(db, payload, user_id):
+        new_movie = Movie(
+            title=payload.title,
+            description=payload.description,
+            release_date=datetime.now(timezone.utc),
+            updated_at=datetime.now(timezone.utc),
+            user_id=user_id
+        )
+        db.add(new_movie)
+        await AsyncMovieService.commit_movie(db)
+        await db.refresh(new_movie)
+        return new_movie
+
+    # Upserts the leaderboard rows of rated movies from their stored aggregates, at the current prior
+    async def update_rankings(db, movies, prior_mean=None):
+        rated = [movie for movie in movies if movie.rating_count]
+        if not rated:
+            return
+        if prior_mean is None:
+            prior = await db.get(RankingPrior, 1)
+            prior_mean = prior.mean if prior else DEFAULT_PRIOR_MEAN
+        await db.execute(upsert(db, MovieRanking.__table__, ["movie_id"], [ranking_row(movie, prior_mean) for movie in rated]))
+
+    # Fetches one page of the leaderboard, best score first
+    async def fetch_leaderboard(db, after, limit):
+        statement = keyset_query(leaderboard_statement(), "leaderboard", LEADERBOARD_COLUMNS, after, limit, descending=True)
+        return keyset_result((await db.execute(statement)).all(), "leaderboard", LEADERBOARD_COLUMNS, limit)
+
+    # Fetches the user from the database based on the current session's user
+    async def fetch_user(db, current_user):
+        if current_user.id is not None:
+            return current_user
+        return await db.scalar(select(User).filter(User.username == current_user.username))
+
+    # Fetches the movie from the database based on the given movie ID
+    async def fetch_movie(db, movie_id):
+        return await db.scalar(select(Movie).filter(Movie.id == movie_id))
+
+    # Fetches the movies with the given IDs in a single IN query, in no particular order
+    async def fetch_movies_by_ids(db, movie_ids):
+        return (await db.scalars(select(Movie).filter(Movie.id.in_(movie_ids)))).all()
+
+    # Fetches the movie to rate, the user's previous rating (None if new) and the prior in one round trip
+    async def fetch_rating_target(db, movie_id, user_id):
+        return (await db.execute(MovieService.rating_target_statement(movie_id, user_id))).first()
+
+    # Commits a new or edited movie; the unique description hash index does the duplicate check
+    async def commit_movie(db):
+        try:
+            await db.commit()
+        except IntegrityError as error:
+            await db.rollback()
+            if "description_hash" not in str(error.orig):
+                raise
+            AsyncMovieService.reject_duplicate_description()
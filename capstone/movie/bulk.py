@@ -0,0 +1,246 @@
+import codecs
+import csv
+from datetime import datetime, timezone
+
+import orjson
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from capstone.movie.models import Movie, Rating as RatingModel, Comment as CommentModel, description_digest
+from capstone.movie.schema import CreateMovie, Rating as RatingSchema, CommentResponse
+from capstone.movie.service import MovieService
+from capstone.logger import get_logger
+
+logger = get_logger(__name__)
+
+IMPORT_KINDS = ("movies", "ratings", "comments")
+IMPORT_FORMATS = ("ndjson", "csv")
+DEFAULT_BATCH_SIZE = 1000
+MAX_BATCH_SIZE = 50_000
+# Errors listed per batch report, and over a whole import; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+
+class RecordReader:
+    """Turns the lines of an NDJSON or CSV upload into numbered records, one line at a time.
+
+    CSV files start with a header row naming the fields, and empty cells are read as null.
+    A record that cannot be parsed is returned as an error message instead of a dict.
+    """
+
+    def __init__(self, fmt: str):
+        self.fmt = fmt
+        self.line_number = 0
+        self._header = None
+        self._pending = ""
+        self._pending_line = 0
+
+    def feed(self, line: str) -> list[tuple[int, dict | str]]:
+        self.line_number += 1
+        if self.fmt == "ndjson":
+            return self._ndjson(line)
+        return self._csv(line)
+
+    def _ndjson(self, line):
+        if not line.strip():
+            return []
+        try:
+            record = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            return [(self.line_number, "Invalid JSON")]
+        if not isinstance(record, dict):
+            return [(self.line_number, "Expected a JSON object")]
+        return [(self.line_number, record)]
+
+    def _csv(self, line):
+        # A quoted cell can span lines, so a record is complete once its quotes are balanced
+        if not self._pending:
+            self._pending_line = self.line_number
+        self._pending += line
+        if self._pending.count('"') % 2:
+            return []
+        text, self._pending = self._pending, ""
+        if not text.strip():
+            return []
+        values = next(csv.reader([text]))
+        if self._header is None:
+            self._header = [name.strip() for name in values]
+            return []
+        if len(values) != len(self._header):
+            return [(self._pending_line, f"Expected {len(self._header)} fields, got {len(values)}")]
+        return [(self._pending_line, {name: value or None for name, value in zip(self._header, values)})]
+
+    def finish(self) -> list[tuple[int, dict | str]]:
+        """Report a record left open by an unterminated quote at the end of the upload."""
+        if self._pending:
+            self._pending = ""
+            return [(self._pending_line, "Unterminated quoted field")]
+        return []
+
+
+class BulkImporter:
+    """Validates records and writes them in batches, one transaction and one executemany per batch.
+
+    Every row is attributed to `user_id`. Records are buffered with `add` and written by
+    `flush`, which returns a report of what the batch inserted, skipped and rejected.
+    `summary` totals the batches and keeps only the first MAX_REPORTED_ERRORS errors,
+    so its size does not grow with the upload.
+    """
+
+    def __init__(self, db, user_id: int, kind: str, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.db = db
+        self.user_id = user_id
+        self.kind = kind
+        self.batch_size = batch_size
+        self.batch = []
+        self.batches = 0
+        self.totals = {"inserted": 0, "duplicates": 0, "errors": 0}
+        self.first_errors = []
+
+    def add(self, line_number: int, record) -> bool:
+        """Buffer a record, returning True once a full batch is waiting to be flushed."""
+        self.batch.append((line_number, record))
+        return len(self.batch) >= self.batch_size
+
+    def flush(self) -> dict | None:
+        if not self.batch:
+            return None
+        batch, self.batch = self.batch, []
+        self.batches += 1
+        errors = []
+        valid = []
+        for line_number, record in batch:
+            if isinstance(record, str):
+                errors.append({"line": line_number, "error": record})
+                continue
+            try:
+                valid.append((line_number, self._validate(record)))
+            except ValidationError as error:
+                first = error.errors()[0]
+                location = ".".join(str(part) for part in first["loc"])
+                errors.append({"line": line_number, "error": f"{location}: {first['msg']}"})
+
+        writer = {"movies": self._write_movies, "ratings": self._write_ratings, "comments": self._write_comments}[self.kind]
+        try:
+            inserted, duplicates = writer(valid, errors)
+            self.db.commit()
+        except IntegrityError:
+            # A concurrent write claimed a description or rating first, the batch can be sent again
+            self.db.rollback()
+            logger.warning(f"Import batch {self.batches} of {self.kind} conflicted with a concurrent write.")
+            inserted, duplicates = 0, 0
+            errors.extend({"line": line_number, "error": "Batch conflicted with a concurrent write"} for line_number, _ in valid)
+
+        errors.sort(key=lambda error: error["line"])
+        report = {
+            "batch": self.batches,
+            "first_line": batch[0][0],
+            "last_line": batch[-1][0],
+            "inserted": inserted,
+            "duplicates": duplicates,
+            "error_count": len(errors),
+            "errors": errors[:MAX_REPORTED_ERRORS],
+        }
+        self.totals["inserted"] += inserted
+        self.totals["duplicates"] += duplicates
+        self.totals["errors"] += len(errors)
+        self.first_errors.extend(errors[:MAX_REPORTED_ERRORS - len(self.first_errors)])
+        logger.info(f"Import batch {self.batches} of {self.kind}: {inserted} inserted, {duplicates} duplicates, {len(errors)} errors.")
+        return report
+
+    def _validate(self, record):
+        if self.kind == "movies":
+            return CreateMovie.model_validate(record)
+        if self.kind == "ratings":
+            return RatingSchema.model_validate(record)
+        return CommentResponse.model_validate({"parent_id": None, **record})
+
+    def _write_movies(self, valid, errors):
+        # Duplicates within the batch and against the catalog are found with one index probe
+        digests = {line_number: description_digest(movie.description) for line_number, movie in valid}
+        existing = set(self.db.scalars(select(Movie.description_hash).filter(Movie.description_hash.in_(set(digests.values())))))
+        now = datetime.now(timezone.utc)
+        rows = []
+        duplicates = 0
+        for line_number, movie in valid:
+            digest = digests[line_number]
+            if digest in existing:
+                duplicates += 1
+                continue
+            existing.add(digest)
+            rows.append({
+                "title": movie.title,
+                "description": movie.description,
+                "description_hash": digest,
+                "release_date": now,
+                "updated_at": now,
+                "user_id": self.user_id,
+            })
+        if rows:
+            self.db.execute(insert(Movie), rows)
+        return len(rows), duplicates
+
+    def _write_ratings(self, valid, errors):
+        movie_ids = {rating.movie_id for _, rating in valid}
+        # Lock the rated movies so their aggregates are updated in step with the inserted ratings
+        movies = {movie.id: movie for movie in self.db.query(Movie).filter(Movie.id.in_(movie_ids)).with_for_update()}
+        rated = set(self.db.scalars(select(RatingModel.movie_id).filter(
+            RatingModel.user_id == self.user_id, RatingModel.movie_id.in_(movie_ids)
+        )))
+        rows = []
+        duplicates = 0
+        for line_number, rating in valid:
+            if rating.movie_id not in movies:
+                errors.append({"line": line_number, "error": "Movie not found"})
+            elif MovieService.check_rating_range(rating.rating):
+                errors.append({"line": line_number, "error": "Rating must be an integer between 0 and 11"})
+            elif rating.movie_id in rated:
+                duplicates += 1
+            else:
+                rated.add(rating.movie_id)
+                rows.append({"user_id": self.user_id, "movie_id": rating.movie_id, "rating": rating.rating})
+                MovieService.record_rating(movies[rating.movie_id], rating.rating)
+        if rows:
+            self.db.execute(insert(RatingModel), rows)
+            MovieService.update_rankings(self.db, [movies[movie_id] for movie_id in {row["movie_id"] for row in rows}])
+        return len(rows), duplicates
+
+    def _write_comments(self, valid, errors):
+        movie_ids = set(self.db.scalars(select(Movie.id).filter(Movie.id.in_({comment.movie_id for _, comment in valid}))))
+        parent_ids = {comment.parent_id for _, comment in valid if comment.parent_id is not None}
+        parents = dict(self.db.execute(select(CommentModel.id, CommentModel.movie_id).filter(CommentModel.id.in_(parent_ids))).all())
+        rows = []
+        for line_number, comment in valid:
+            if comment.movie_id not in movie_ids:
+                errors.append({"line": line_number, "error": "Movie not found"})
+            elif comment.parent_id is not None and parents.get(comment.parent_id) != comment.movie_id:
+                errors.append({"line": line_number, "error": "Comment not found"})
+            else:
+                rows.append({
+                    "user_id": self.user_id,
+                    "movie_id": comment.movie_id,
+                    "parent_id": comment.parent_id,
+                    "content": comment.content,
+                })
+        if rows:
+            self.db.execute(insert(CommentModel), rows)
+        return len(rows), 0
+
+    def summary(self) -> dict:
+        return {"kind": self.kind, "batches": self.batches, **self.totals, "first_errors": self.first_errors}
+
+
+async def iter_lines(chunks):
+    """Split an async stream of byte chunks into decoded lines, keeping their line endings."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    async for chunk in chunks:
+        lines = (pending + decoder.decode(chunk)).split("\n")
+        # The last piece is the start of a line that continues in the next chunk
+        pending = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
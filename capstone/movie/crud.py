@@ -1,43 +1,32 @@
 from datetime import datetime, timezone
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from capstone.database import db_dependency
 from capstone.movie.schema import CreateMovie
 from capstone.user.schemas  import Login
 from capstone.user.models import User
-from capstone.movie.models import Movie as Movie_model
+from capstone.movie.models import Movie as Movie_model, with_comment_counts
 from capstone.authentification.oauth2 import get_current_user
-from capstone.movie.models import Rating as RatingModel
 from capstone.movie.schema import Rating as RatingSchema
 from capstone.movie.schema import Comment as CommentSchema
 from capstone.movie.models import Comment as CommentModel
 from capstone.movie.schema import ReplyComment
 
 from capstone.movie.service import MovieService
+from capstone.movie.search import get_search_backend
+from capstone.movie.bulk import BulkImporter, RecordReader, iter_lines, DEFAULT_BATCH_SIZE
+from capstone.movie.export import export_catalog
+from capstone.movie.threads import thread_statement, build_threads, DEFAULT_THREAD_DEPTH
+from capstone.cache import response_cache, movie_tag, ACTIVITY, CATALOG
+from capstone.feed import feed_hub
+from capstone.group_commit import commit_write
+from capstone.pagination import keyset_page, keyset_query, encode_cursor, decode_offset, DEFAULT_LIMIT
 
 
 from capstone.logger import get_logger
 
-import logging
-import sentry_sdk
-from sentry_sdk.integrations.logging import LoggingIntegration
-import logging
-# Enable sending logs from the standard Python logging module to Sentry
-logging_integration = LoggingIntegration(
-    level=logging.INFO,  # Capture info and above as breadcrumbs
-    event_level=logging.ERROR  # Send errors as events
-)
-sentry_sdk.init(
-    dsn="https://ee3ca659cdc5658bf02659af610f818b@o4507693153386496.ingest.de.sentry.io/4507693158629456",
-    # Set traces_sample_rate to 1.0 to capture 100%
-    # of transactions for performance monitoring.
-    traces_sample_rate=1.0,
-    # Set profiles_sample_rate to 1.0 to profile 100%
-    # of sampled transactions.
-    # We recommend adjusting this value in production.
-    profiles_sample_rate=1.0,
-    integrations= [logging_integration]
-)
 
 logger = get_logger(__name__)
 
@@ -46,19 +35,71 @@ def list_movie(db : db_dependency, payload : CreateMovie, current_user : Login =
     logger.info(f"User {current_user.username} is attempting to list a new movie: {payload.title}")
 
     user = MovieService.fetch_user(db, current_user)
-    MovieService.check_db_description(db, payload)
     new_movie = MovieService.create_new_movie(db, payload, user.id)
+    response_cache.invalidate(CATALOG)
 
     logger.info(f"Movie '{new_movie.title}' has been listed by user {current_user.username} with ID {new_movie.id}.")
     return new_movie
 
 
-def fetch_movies(db : db_dependency, offset : int = 0, limit : int =10):
-    logger.info(f"Fetching movies with offset={offset} and limit={limit}")
+# Keyset orderings for the catalog: the key columns and whether they are walked newest first
+MOVIE_ORDERINGS = {
+    "id": ([Movie_model.id], False),
+    "release_date": ([Movie_model.release_date, Movie_model.id], True),
+}
+
+
+def fetch_movies(db : db_dependency, after : str | None = None, limit : int = DEFAULT_LIMIT, order : str = "id",
+                 stats : bool = False):
+    logger.info(f"Fetching movies after cursor={after} with limit={limit} ordered by {order} (stats={stats})")
+
+    columns, descending = MOVIE_ORDERINGS[order]
+    query = db.query(Movie_model)
+    if stats:
+        # The rating aggregates are columns of the movie row; the comment counts are joined to the same statement
+        query = with_comment_counts(query, columns)
+    movies, next_cursor = keyset_page(query, order, columns, after, limit, descending)
+    logger.info(f"Fetched {len(movies)} movies with limit={limit} ordered by {order}")
+    return movies, next_cursor
+
+def export_movies(db : db_dependency, fmt : str = "ndjson", compress : bool = False, after : int | None = None):
+    logger.info(f"Exporting the catalog as {fmt} after movie ID={after} (gzip={compress})")
+    media_type = {"ndjson": "application/x-ndjson", "csv": "text/csv"}[fmt]
+    filename = f"catalog.{fmt}.gz" if compress else f"catalog.{fmt}"
+    # The rows are streamed from a connection of the export's own, which outlives this request's session;
+    # a replica session is bound to a connection, whose engine the export connects through
+    return StreamingResponse(
+        export_catalog(db.get_bind().engine, fmt, compress, after),
+        media_type = "application/gzip" if compress else media_type,
+        headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+def fetch_leaderboard(db : db_dependency, after : str | None = None, limit : int = DEFAULT_LIMIT):
+    logger.info(f"Fetching the leaderboard after cursor={after} with limit={limit}")
+    entries, next_cursor = MovieService.fetch_leaderboard(db, after, limit)
+    logger.info(f"Fetched {len(entries)} leaderboard entries with limit={limit}")
+    return entries, next_cursor
+
+
+# Most IDs one batch lookup resolves, which bounds the IN list sent to the database
+MAX_BATCH_IDS = 500
+
+
+def fetch_movie_batch(db : db_dependency, movie_ids : list[int], include_ratings : bool = False):
+    logger.info(f"Fetching a batch of {len(movie_ids)} movie ID(s) (include_ratings={include_ratings})")
+    unique_ids = list(dict.fromkeys(movie_ids))
+    if len(unique_ids) > MAX_BATCH_IDS:
+        logger.warning(f"Batch lookup of {len(unique_ids)} movies rejected, the limit is {MAX_BATCH_IDS}")
+        raise HTTPException(
+            status_code = status.HTTP_400_BAD_REQUEST,
+            detail = f"At most {MAX_BATCH_IDS} movie IDs can be fetched at once"
+        )
+    movies = MovieService.fetch_movies_by_ids(db, unique_ids) if unique_ids else []
+    batch = MovieService.batch_result(movie_ids, movies, include_ratings)
+    logger.info(f"Fetched {len(batch['movies'])} movie(s), {len(batch['missing'])} ID(s) not found")
+    return batch
 
-    movies = db.query(Movie_model).offset(offset).limit(limit).all()
-    logger.info(f"Fetched {len(movies)} movies with offset={offset} and limit={limit}")
-    return movies
 
 def fetch_movie_by_id(db : db_dependency, movie_id : int):
     logger.info(f"Fetching movie with ID={movie_id}")
@@ -88,9 +129,9 @@ def update_movie(db : db_dependency, movie_id : int, payload : CreateMovie, curr
             detail = "Movie not found"
         )
     MovieService.check_movie_ownership(user, movie)
-    MovieService.check_db_description(db, payload)
     movie = MovieService.update_movie_details(movie, payload)
-    db.commit()
+    MovieService.commit_movie(db)
+    response_cache.invalidate(CATALOG, movie_tag(movie_id))
     logger.info(f"Movie with ID={movie_id} successfully updated by user '{current_user.username}'")
     return movie
    
@@ -110,54 +151,66 @@ def delete_movie(db : db_dependency, movie_id : int, current_user : Login = Depe
     MovieService.ensure_user_can_modify_movie(user, movie)
     db.delete(movie)
     db.commit()
+    response_cache.invalidate(CATALOG, movie_tag(movie_id))
     logger.info(f"Movie with ID={movie_id} successfully deleted by user '{current_user.username}'")
 
    
 
 
-def search_movie(db : db_dependency, title : str, offset : int = 0, limit : int =10):
-    logger.info(f"Searching for movies with title '{title}' (offset={offset}, limit={limit})")
-    movies = db.query(Movie_model).filter(Movie_model.title == title).offset(offset).limit(limit).all()
+def search_movie(db : db_dependency, title : str, after : str | None = None, limit : int = DEFAULT_LIMIT,
+                 stats : bool = False):
+    logger.info(f"Searching for movies matching '{title}' (after={after}, limit={limit}, stats={stats})")
+    # Search results are ranked, so the cursor carries the position in the ranking
+    offset = decode_offset(after, "search")
+    movies = get_search_backend(db.get_bind()).search(db, title, offset, limit + 1, stats)
     if not movies:
-        logger.warning(f"No movies found with title '{title}'")
+        logger.warning(f"No movies found matching '{title}'")
         raise HTTPException(
             status_code = status.HTTP_404_NOT_FOUND,
             detail = "No results found"
         )
-    logger.info(f"Found {len(movies)} movie(s) with title '{title}'")
-    return movies
+    next_cursor = encode_cursor("search", [offset + limit]) if len(movies) > limit else None
+    logger.info(f"Found {len(movies[:limit])} movie(s) matching '{title}'")
+    return movies[:limit], next_cursor
 
 
 def rate_movie(db : db_dependency, payload : RatingSchema, current_user : Login = Depends(get_current_user)):
     logger.info(f"User '{current_user.username}' is attempting to rate movie with ID={payload.movie_id}")
 
-    movie =MovieService.fetch_movie(db, payload.movie_id)
     user =MovieService.fetch_user(db, current_user)
-    if movie is None:
-        logger.error(f"Movie with ID {payload.movie_id} not found.")
-        raise HTTPException(
-            status_code = status.HTTP_404_NOT_FOUND,
-            detail = "Movie not found"
-        )
-      # Check if the user has already rated the movie
-    MovieService.check_existing_rating(db, user, movie)
     is_invalid_rating = MovieService.check_rating_range(payload.rating)
     if is_invalid_rating:
                     raise HTTPException(
                 status_code = status.HTTP_400_BAD_REQUEST,
                 detail = "Rating must be an integer between 0 and 11"
             )
-    else:
-        new_rating = RatingModel(
-        user_id = user.id,
-        movie_id = payload.movie_id,
-        rating = payload.rating
+
+    # Read before commit_write, whose rollback expires the request's objects; the write may run on another thread
+    user_id = user.id
+
+    def write(db):
+        target = MovieService.fetch_rating_target(db, payload.movie_id, user_id)
+        if target is None:
+            logger.error(f"Movie with ID {payload.movie_id} not found.")
+            raise HTTPException(
+                status_code = status.HTTP_404_NOT_FOUND,
+                detail = "Movie not found"
             )
-        db.add(new_rating)
-        db.commit()
-        db.refresh(new_rating)
-        logger.info(f"User {current_user.username} successfully rated movie with ID {payload.movie_id}.")
-        return MovieService.average_rating(db, payload.movie_id)
+        movie, previous, prior_mean = target
+        # A new rating is inserted, a second one from the same user replaces the first
+        db.execute(MovieService.rating_upsert(db, user_id, payload.movie_id, payload.rating))
+        # Update the movie's aggregates in the same transaction as the rating
+        MovieService.record_rating(movie, payload.rating, previous)
+        MovieService.update_rankings(db, [movie], prior_mean)
+        # Read the new average and counts before the commit expires the movie
+        return MovieService.average_rating(movie), previous, MovieService.rating_summary(movie)
+
+    average, previous, summary = commit_write(db, write)
+    response_cache.invalidate(movie_tag(payload.movie_id), ACTIVITY)
+    feed_hub.publish(payload.movie_id, "rating", summary)
+    logger.info(f"User {current_user.username} successfully rated movie with ID {payload.movie_id}"
+                f"{'' if previous is None else f' (was {previous})'}.")
+    return average
 
 
 def get_ratings(db : db_dependency, movie_id : int):
@@ -169,7 +222,19 @@ def get_ratings(db : db_dependency, movie_id : int):
             status_code = status.HTTP_404_NOT_FOUND,
             detail = "Movie not found"
         )
-    return MovieService.average_rating(db, movie_id)
+    return MovieService.average_rating(movie)
+
+
+def get_rating_summary(db : db_dependency, movie_id : int):
+    logger.info(f"Fetching rating summary for movie with ID={movie_id}")
+    movie = MovieService.fetch_movie(db, movie_id)
+    if movie is None:
+        logger.error(f"Movie with ID {movie_id} not found.")
+        raise HTTPException(
+            status_code = status.HTTP_404_NOT_FOUND,
+            detail = "Movie not found"
+        )
+    return MovieService.rating_summary(movie)
 
 
 
@@ -183,19 +248,16 @@ def comment(db : db_dependency, payload : CommentSchema,  current_user : Login =
             status_code = status.HTTP_404_NOT_FOUND,
             detail = "Movie not found"
         )
+    new_comment = {"user_id": user.id, "movie_id": payload.movie_id, "content": payload.content, "parent_id": None}
+    comment_id = commit_write(db, lambda db: MovieService.add_comment(db, new_comment))
+    response_cache.invalidate(ACTIVITY)
+    new_comment = {"id": comment_id, **new_comment}
+    feed_hub.publish(payload.movie_id, "comment", new_comment)
     logger.info(f"User {current_user.username} successfully commented on movie with ID {payload.movie_id}.")
-    new_comment = CommentModel(
-        user_id = user.id,
-        movie_id = payload.movie_id,
-        content = payload.content
-    )
-    db.add(new_comment)
-    db.commit()
-    db.refresh(new_comment)
     return new_comment
 
 
-def fetch_comments(db : db_dependency, movie_id : int, offset : int = 0, limit : int =10):
+def fetch_comments(db : db_dependency, movie_id : int, after : str | None = None, limit : int = DEFAULT_LIMIT):
     movie = MovieService.fetch_movie(db, movie_id)
     if movie is None:
         logger.error(f"Movie with ID {movie_id} not found.")
@@ -205,9 +267,74 @@ def fetch_comments(db : db_dependency, movie_id : int, offset : int = 0, limit :
         )
 
     logger.info(f"Fetching comments for movie with ID={movie_id}")
-    comments = db.query(CommentModel).filter(CommentModel.movie_id == movie_id).offset(offset).limit(limit).all()
+    query = db.query(CommentModel).filter(CommentModel.movie_id == movie_id)
+    comments, next_cursor = keyset_page(query, "id", [CommentModel.id], after, limit)
     logger.info(f"Found {len(comments)} comments for movie with ID={movie_id}.")
-    return comments
+    return comments, next_cursor
+
+
+async def import_data(db : db_dependency, request : Request, kind : str, fmt : str = "ndjson",
+                      batch_size : int = DEFAULT_BATCH_SIZE, current_user : Login = Depends(get_current_user)):
+    logger.info(f"User {current_user.username} is importing {kind} as {fmt} in batches of {batch_size}")
+
+    # The upload is read as it arrives; each full batch is written from the threadpool with the blocking session
+    user = await run_in_threadpool(MovieService.fetch_user, db, current_user)
+    importer = BulkImporter(db, user.id, kind, batch_size)
+    reader = RecordReader(fmt)
+    async for line in iter_lines(request.stream()):
+        for line_number, record in reader.feed(line):
+            if importer.add(line_number, record):
+                await run_in_threadpool(importer.flush)
+    for line_number, record in reader.finish():
+        importer.add(line_number, record)
+    await run_in_threadpool(importer.flush)
+
+    if kind == "movies":
+        response_cache.invalidate(CATALOG)
+    elif kind == "ratings":
+        # Ratings change the aggregates of any number of movies
+        response_cache.clear()
+    else:
+        response_cache.invalidate(ACTIVITY)
+    summary = importer.summary()
+    logger.info(f"User {current_user.username} imported {summary['inserted']} {kind} with {summary['errors']} errors.")
+    # Only the totals and the first errors are returned, so the response stays small however large the upload
+    return summary
+
+
+def fetch_comment_threads(db : db_dependency, movie_id : int, after : str | None = None, limit : int = DEFAULT_LIMIT,
+                          depth : int = DEFAULT_THREAD_DEPTH):
+    movie = MovieService.fetch_movie(db, movie_id)
+    if movie is None:
+        logger.error(f"Movie with ID {movie_id} not found.")
+        raise HTTPException(
+            status_code = status.HTTP_404_NOT_FOUND,
+            detail = "Movie not found"
+        )
+
+    logger.info(f"Fetching comment threads for movie with ID={movie_id} after cursor={after} with limit={limit} and depth={depth}")
+    # The page of top-level comments is a subquery of the recursive query, one extra root tells whether another page exists
+    roots = db.query(CommentModel.id).filter(CommentModel.movie_id == movie_id, CommentModel.parent_id.is_(None))
+    roots = keyset_query(roots, "thread", [CommentModel.id], after, limit)
+    threads = build_threads(db.execute(thread_statement(roots.statement, depth)).all())
+    next_cursor = None
+    if len(threads) > limit:
+        threads = threads[:limit]
+        next_cursor = encode_cursor("thread", [threads[-1]["id"]])
+    logger.info(f"Found {len(threads)} comment threads for movie with ID={movie_id}.")
+    return threads, next_cursor
+
+
+def fetch_comment_thread(db : db_dependency, comment_id : int, depth : int = DEFAULT_THREAD_DEPTH):
+    logger.info(f"Fetching the thread of comment with ID={comment_id} with depth={depth}")
+    threads = build_threads(db.execute(thread_statement([comment_id], depth)).all())
+    if not threads:
+        logger.error(f"Comment with ID {comment_id} not found.")
+        raise HTTPException(
+            status_code = status.HTTP_404_NOT_FOUND,
+            detail = "Comment not found"
+        )
+    return threads[0]
 
 def reply_to_comment(db : db_dependency, payload : ReplyComment,  current_user : Login = Depends(get_current_user)):
     logger.info(f"User {current_user.username} is attempting to reply to comment with ID={payload.comment_id}.")
@@ -222,16 +349,12 @@ def reply_to_comment(db : db_dependency, payload : ReplyComment,  current_user :
         )
     movie = MovieService.fetch_movie(db, comment.movie_id)
     logger.info(f"Movie with ID={movie.id} found. Creating reply.")
-    new_reply = CommentModel(
-                    user_id = user.id,
-                    movie_id = movie.id, 
-                    content = payload.content,
-                    parent_id = payload.comment_id
-                )
-    db.add(new_reply)
-    db.commit()
-    db.refresh(new_reply)
-    logger.info(f"Reply created successfully with ID={new_reply.id} by user ID={user.id} for comment ID={payload.comment_id}.")
+    new_reply = {"user_id": user.id, "movie_id": movie.id, "content": payload.content, "parent_id": payload.comment_id}
+    reply_id = commit_write(db, lambda db: MovieService.add_comment(db, new_reply))
+    response_cache.invalidate(ACTIVITY)
+    new_reply = {"id": reply_id, **new_reply}
+    feed_hub.publish(movie.id, "comment", new_reply)
+    logger.info(f"Reply created successfully with ID={reply_id} by user ID={user.id} for comment ID={payload.comment_id}.")
     return new_reply           
 
   
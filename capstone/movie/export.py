@@ -0,0 +1,67 @@
+import csv
+import io
+import zlib
+
+import orjson
+from sqlalchemy import Float, case, cast, select
+
+from capstone.movie.models import Movie
+
+EXPORT_FORMATS = ("ndjson", "csv")
+# Rows fetched per round trip from the server-side cursor, and written per response chunk
+EXPORT_CHUNK_SIZE = 1000
+
+EXPORT_COLUMNS = ("id", "title", "description", "release_date", "updated_at", "rating_count", "average_rating")
+
+
+def export_statement(after: int | None = None):
+    """Select every movie with its stored rating aggregates in id order, starting after movie `after`."""
+    average = case((Movie.rating_count > 0, cast(Movie.rating_sum, Float) / Movie.rating_count), else_=None)
+    statement = select(
+        Movie.id, Movie.title, Movie.description, Movie.release_date, Movie.updated_at,
+        Movie.rating_count, average.label("average_rating"),
+    ).order_by(Movie.id)
+    if after is not None:
+        statement = statement.filter(Movie.id > after)
+    return statement
+
+
+def _ndjson_chunk(rows) -> bytes:
+    return b"".join(orjson.dumps(row._asdict()) + b"\n" for row in rows)
+
+
+def _csv_chunk(rows, header: bool) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow([value.isoformat() if hasattr(value, "isoformat") else value for value in row])
+    return buffer.getvalue().encode()
+
+
+def export_catalog(engine, fmt: str = "ndjson", compress: bool = False, after: int | None = None,
+                   chunk_size: int = EXPORT_CHUNK_SIZE):
+    """Yield the catalog as NDJSON or CSV bytes, one chunk per batch of rows.
+
+    The rows are read through a server-side cursor on a connection of its own, so memory
+    stays flat however large the table is. With `compress`, the output is a single gzip
+    stream, sync-flushed after every chunk, so an interrupted download still decompresses
+    up to its last complete chunk and can be resumed from the last exported id.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    header = fmt == "csv" and after is None
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=chunk_size).execute(export_statement(after))
+        for rows in result.partitions():
+            chunk = _ndjson_chunk(rows) if fmt == "ndjson" else _csv_chunk(rows, header)
+            header = False
+            if compressor:
+                chunk = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            yield chunk
+    if header:
+        # An empty catalog still gets its CSV header
+        chunk = _csv_chunk([], True)
+        yield compressor.compress(chunk) + compressor.flush() if compressor else chunk
+    elif compressor:
+        yield compressor.flush()
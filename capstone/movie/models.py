@@ -1,9 +1,19 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text
+import hashlib
+
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Float, Text, JSON, Index, DDL, event, func
 from datetime import datetime, timezone
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import query_expression, relationship, validates, with_expression
 from capstone.database import Base
 
 
+def description_digest(description):
+    """SHA-256 of a description with case and whitespace normalized, so near-identical listings collide."""
+    if description is None:
+        return None
+    normalized = " ".join(description.split()).casefold()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
 class Movie(Base):
 
     __tablename__ = "movies"
@@ -14,10 +24,63 @@ class Movie(Base):
     release_date = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = Column(DateTime, default=datetime.now(timezone.utc ))
     user_id = Column(Integer, ForeignKey("users.id"))
+    # Running rating aggregates, kept in step with the ratings table by crud.rate_movie
+    rating_count = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_sum = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_histogram = Column(JSON, nullable=False, default=dict, server_default="{}")
+    # Digest of the normalized description, set whenever the description is assigned.
+    # Its unique index is the duplicate-listing check (see MovieService.commit_movie)
+    description_hash = Column(String(64), nullable=True)
    
     owner = relationship("User", back_populates="movies")
     ratings = relationship("Rating", back_populates="movies")
     comments = relationship("Comment", back_populates="movies", cascade="all, delete-orphan")
+    ranking = relationship("MovieRanking", cascade="all, delete-orphan", uselist=False)
+
+    @property
+    def average_rating(self):
+        return round(self.rating_sum / self.rating_count, 1) if self.rating_count else None
+
+    __table_args__ = (
+        # Serves the newest-first keyset pagination of the catalog
+        Index("ix_movies_release_date_id", "release_date", "id"),
+        Index("ix_movies_description_hash", "description_hash", unique=True),
+        # Serves a user's profile: the count and keyset pagination of the movies they listed
+        Index("ix_movies_user_id_id", "user_id", "id"),
+    )
+
+    @validates("description")
+    def _hash_description(self, key, description):
+        self.description_hash = description_digest(description)
+        return description
+
+# Full-text search index over title and description, kept in sync by the database itself.
+# SQLite uses an external-content FTS5 table maintained by triggers, Postgres a generated
+# tsvector column with a GIN index (see capstone/movie/search.py for the queries).
+SQLITE_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5("
+    "title, description, content='movies', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS movies_fts_insert AFTER INSERT ON movies BEGIN "
+    "INSERT INTO movies_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS movies_fts_delete AFTER DELETE ON movies BEGIN "
+    "INSERT INTO movies_fts(movies_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS movies_fts_update AFTER UPDATE OF title, description ON movies BEGIN "
+    "INSERT INTO movies_fts(movies_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO movies_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+]
+POSTGRES_SEARCH_DDL = [
+    "ALTER TABLE movies ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'B')) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_movies_search_vector ON movies USING GIN (search_vector)",
+]
+
+for statement in SQLITE_SEARCH_DDL:
+    event.listen(Movie.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+for statement in POSTGRES_SEARCH_DDL:
+    event.listen(Movie.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+event.listen(Movie.__table__, "after_drop", DDL("DROP TABLE IF EXISTS movies_fts").execute_if(dialect="sqlite"))
+
 
 class Rating(Base):
     __tablename__ = "ratings"
@@ -29,6 +92,13 @@ class Rating(Base):
     owner = relationship("User", back_populates="ratings")
     movies = relationship("Movie", back_populates="ratings")
 
+    __table_args__ = (
+        # One rating per user and movie, the conflict target of the rating upsert
+        Index("uq_ratings_user_id_movie_id", "user_id", "movie_id", unique=True),
+        # Serves the per-movie lookups, covering the per-score grouping of the aggregate reconciliation
+        Index("ix_ratings_movie_id_rating", "movie_id", "rating"),
+    )
+
 class Comment(Base):
     __tablename__ = "comments"
     id = Column(Integer, primary_key=True, index=True)
@@ -42,4 +112,52 @@ class Comment(Base):
     movies = relationship("Movie", back_populates="comments")
     parent = relationship("Comment", remote_side= [id], backref = "replies")
 
+    __table_args__ = (
+        # Serves the keyset pagination of a movie's comments
+        Index("ix_comments_movie_id_id", "movie_id", "id"),
+        # Serves the reply lookups of the recursive thread query
+        Index("ix_comments_parent_id", "parent_id"),
+        # Serves the comment count of a user's profile
+        Index("ix_comments_user_id", "user_id"),
+    )
+
+
+# Loaded only by the statements that count the comments, such as the ones built by with_comment_counts
+Movie.comment_count = query_expression()
+
+
+def with_comment_counts(statement, columns: list):
+    """Count each movie's comments in a query or select() of movies, with a LEFT JOIN grouped on `columns`.
+
+    `columns` are the statement's key columns, ending with Movie.id: grouping on the key
+    the page is ordered by lets its index still walk the movies in order and stop after one page.
+    """
+    return (
+        statement.outerjoin(Comment, Comment.movie_id == Movie.id)
+        .group_by(*columns)
+        .options(with_expression(Movie.comment_count, func.count(Comment.id)))
+    )
+
+
+class MovieRanking(Base):
+    """A rated movie's place on the leaderboard, kept in step with its aggregates by crud.rate_movie."""
+    __tablename__ = "movie_rankings"
+    movie_id = Column(Integer, ForeignKey("movies.id"), primary_key=True)
+    rating_count = Column(Integer, nullable=False)
+    average_rating = Column(Float, nullable=False)
+    # Bayesian average: the movie's ratings plus LEADERBOARD_MIN_VOTES votes at the prior mean
+    score = Column(Float, nullable=False)
+
+    __table_args__ = (
+        # Serves the best-first keyset pagination of the leaderboard
+        Index("ix_movie_rankings_score_movie_id", "score", "movie_id"),
+    )
+
 
+class RankingPrior(Base):
+    """The catalog-wide mean rating the scores are pulled towards, refreshed by the full recompute."""
+    __tablename__ = "ranking_prior"
+    id = Column(Integer, primary_key=True)
+    mean = Column(Float, nullable=False)
+    rating_count = Column(Integer, nullable=False)
+    computed_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
@@ -0,0 +1,55 @@
+import os
+
+from sqlalchemy import Float, cast, delete, func, insert, select
+
+from capstone.movie.models import Movie, MovieRanking
+
+# Votes at the prior mean added to every movie, so a handful of perfect ratings does not top the board
+LEADERBOARD_MIN_VOTES = int(os.getenv("LEADERBOARD_MIN_VOTES", 10))
+# Prior used until the first full recompute: the middle of the 1-10 rating range
+DEFAULT_PRIOR_MEAN = 5.5
+
+LEADERBOARD_COLUMNS = [MovieRanking.score, MovieRanking.movie_id]
+
+
+def bayesian_score(rating_count: int, rating_sum: int, prior_mean: float, min_votes: int = LEADERBOARD_MIN_VOTES) -> float:
+    """Average of a movie's ratings and `min_votes` extra votes at `prior_mean`."""
+    return (rating_sum + min_votes * prior_mean) / (rating_count + min_votes)
+
+
+def ranking_row(movie, prior_mean: float) -> dict:
+    """The leaderboard row of a rated movie, from the aggregates stored on it."""
+    return {
+        "movie_id": movie.id,
+        "rating_count": movie.rating_count,
+        "average_rating": movie.rating_sum / movie.rating_count,
+        "score": bayesian_score(movie.rating_count, movie.rating_sum, prior_mean),
+    }
+
+
+def prior_statement():
+    """Select the number of ratings and their mean over the whole catalog, from the movies' aggregates."""
+    count = func.coalesce(func.sum(Movie.rating_count), 0)
+    return select(count.label("rating_count"), (cast(func.coalesce(func.sum(Movie.rating_sum), 0), Float) / func.nullif(count, 0)).label("mean"))
+
+
+def recompute_statements(prior_mean: float) -> list:
+    """Replace the whole leaderboard with scores recomputed from every movie's aggregates at `prior_mean`."""
+    total = cast(Movie.rating_sum, Float)
+    rated = select(
+        Movie.id,
+        Movie.rating_count,
+        total / Movie.rating_count,
+        (total + LEADERBOARD_MIN_VOTES * prior_mean) / (Movie.rating_count + LEADERBOARD_MIN_VOTES),
+    ).filter(Movie.rating_count > 0)
+    return [
+        delete(MovieRanking),
+        insert(MovieRanking).from_select(["movie_id", "rating_count", "average_rating", "score"], rated),
+    ]
+
+
+def leaderboard_statement():
+    """Select the leaderboard rows with their movie's title, for `keyset_query` on LEADERBOARD_COLUMNS."""
+    return select(
+        MovieRanking.movie_id, Movie.title, MovieRanking.score, MovieRanking.average_rating, MovieRanking.rating_count,
+    ).join(Movie, Movie.id == MovieRanking.movie_id)
@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends, status
+from typing import Literal
 
+from fastapi import APIRouter, Depends, Query, Request, Response, WebSocket, status
+from fastapi.responses import StreamingResponse
 
-from capstone.movie.schema import Movie, CreateMovie
+
+from capstone.movie.schema import Movie, MovieStats, CreateMovie
 from capstone.user.schemas import Login
-from capstone.database import db_dependency
+from capstone.database import db_dependency, read_db_dependency
 from capstone.authentification.oauth2 import get_current_user
 import capstone.movie.crud as crud
 from capstone.database import db_dependency
@@ -11,6 +14,15 @@ from capstone.movie.schema import Rating as RatingSchema
 from capstone.movie.schema import Comment as CommentSchema
 from capstone.movie.schema import CommentResponse
 from capstone.movie.schema import ReplyComment 
+from capstone.movie.schema import RatingSummary
+from capstone.movie.schema import CommentThread
+from capstone.movie.schema import LeaderboardEntry
+from capstone.movie.schema import MovieBatch, MovieBatchRequest
+from capstone.movie.threads import DEFAULT_THREAD_DEPTH, MAX_THREAD_DEPTH
+from capstone.movie.bulk import DEFAULT_BATCH_SIZE, MAX_BATCH_SIZE
+from capstone.pagination import DEFAULT_LIMIT, MAX_LIMIT, NEXT_CURSOR_HEADER
+from capstone.cache import response_cache, movie_tag, ACTIVITY, CATALOG
+from capstone.feed import feed_hub, event_stream, serve_websocket
 
 
 
@@ -30,22 +42,116 @@ def list_movie(db : db_dependency, payload : CreateMovie, current_user : Login =
     """
     return crud.list_movie(db , payload , current_user)
 
-@movie_router.get("/", response_model= list[Movie])
-def fetch_movies(db : db_dependency):
+@movie_router.get("/", response_model= list[MovieStats] | list[Movie])
+def fetch_movies(db : read_db_dependency, request : Request, after : str | None = None,
+                 limit : int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+                 order : Literal["id", "release_date"] = "id", stats : bool = False):
     """
     ## Fetch all movies
-    This lists all movies in database and can be accessed by the public
+    This lists all movies in database and can be accessed by the public.
+    Results are paginated with a cursor: when more movies exist, the
+    `X-Next-Cursor` response header holds the value to pass as `after`
+    to get the next page.
+    - order : "id" (oldest listing first) or "release_date" (newest first)
+    - stats : add each movie's average_rating, rating_count and comment_count
+
+    Responses carry an ETag: send it back in `If-None-Match` to get a 304 when nothing changed.
+    """
+
+    def produce():
+        movies, next_cursor = crud.fetch_movies(db, after, limit, order, stats)
+        headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+        schema = MovieStats if stats else Movie
+        return [schema.model_validate(movie, from_attributes=True).model_dump(mode="json") for movie in movies], headers
+
+    # Counts change with every rating and comment, the plain listing only with the catalog
+    tags = [CATALOG, ACTIVITY] if stats else [CATALOG]
+    return response_cache.respond(request, f"movies:{order}:{after}:{limit}:{stats}", tags, produce)
+
+@movie_router.post("/import")
+async def import_data(db : db_dependency, request : Request, kind : Literal["movies", "ratings", "comments"],
+                      format : Literal["ndjson", "csv"] = "ndjson",
+                      batch_size : int = Query(DEFAULT_BATCH_SIZE, ge=1, le=MAX_BATCH_SIZE),
+                      current_user : Login = Depends(get_current_user)):
     """
+    ## Bulk import movies, ratings or comments
+    The request body is streamed as NDJSON (one object per line) or CSV (a header row,
+    then one row per record) and written in batches of `batch_size`. Records take the
+    fields of the single-item endpoints:
+    - movies : title, description
+    - ratings : movie_id, rating
+    - comments : movie_id, content and optionally parent_id
+
+    Every record is attributed to the current user. Duplicates are skipped, invalid
+    records are counted, and the response lists the first 100 of them by line number.
+    """
+    return await crud.import_data(db, request, kind, format, batch_size, current_user)
+
+@movie_router.get("/export")
+def export_movies(db : read_db_dependency, format : Literal["ndjson", "csv"] = "ndjson", gzip : bool = False,
+                  after : int | None = None):
+    """
+    ## Export the whole catalog
+    This streams every movie with its rating count and average rating, in id order,
+    as NDJSON or CSV, optionally gzip compressed, and can be accessed by the public.
+    To resume an interrupted download, pass the id of the last movie received as `after`.
+    """
+    return crud.export_movies(db, format, gzip, after)
+
+@movie_router.get("/leaderboard", response_model= list[LeaderboardEntry])
+def fetch_leaderboard(db : read_db_dependency, response : Response, after : str | None = None,
+                      limit : int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT)):
+    """
+    ## Top-rated movies
+    This ranks rated movies by a Bayesian average: each movie's ratings plus a
+    fixed number of votes at the catalog's mean rating, so a few high ratings do
+    not outrank many. It can be accessed by the public.
+    Results are paginated with a cursor: pass the `X-Next-Cursor` response header as `after`.
+    """
+    entries, next_cursor = crud.fetch_leaderboard(db, after, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return entries
+
+@movie_router.get("/batch", response_model= MovieBatch)
+def fetch_movie_batch(db : read_db_dependency, request : Request, ids : list[int] = Query(), include_ratings : bool = False):
+    """
+    ## Fetch several movies by id
+    This resolves every id in one query and can be accessed by the public. Pass the ids
+    as repeated `ids` parameters; movies come back in the order requested, and ids with
+    no movie are listed in `missing`. Set `include_ratings` to embed each movie's rating summary.
+    For long lists, POST the same fields to this path instead.
+    """
+    def produce():
+        batch = crud.fetch_movie_batch(db, ids, include_ratings)
+        return MovieBatch.model_validate(batch).model_dump(mode="json"), None
+
+    # A batch changes with any of its movies, and when a missing id gets listed
+    tags = [CATALOG, *(movie_tag(movie_id) for movie_id in dict.fromkeys(ids))]
+    return response_cache.respond(request, f"batch:{include_ratings}:{','.join(map(str, ids))}", tags, produce)
 
-    return crud.fetch_movies(db)
+@movie_router.post("/batch", response_model= MovieBatch)
+def fetch_movie_batch_post(db : read_db_dependency, payload : MovieBatchRequest):
+    """
+    ## Fetch several movies by id
+    The POST form of `GET /movie/batch`, for lists of ids too long for a URL. This requires
+    - ids : list[int]
+    - include_ratings : bool (optional)
+    """
+    return crud.fetch_movie_batch(db, payload.ids, payload.include_ratings)
 
 @movie_router.get("/{id}", response_model = Movie)
-def fetch_movie(db : db_dependency, id : int):
+def fetch_movie(db : read_db_dependency, request : Request, id : int):
     """
     ## Fetch a movie by id
-    This fetches a movie by its id and can be accessed by the public
+    This fetches a movie by its id and can be accessed by the public.
+    Send the ETag back in `If-None-Match` to get a 304 when the movie has not changed.
     """
-    return crud.fetch_movie_by_id(db, id)
+    def produce():
+        movie = crud.fetch_movie_by_id(db, id)
+        return Movie.model_validate(movie, from_attributes=True).model_dump(mode="json"), None
+
+    return response_cache.respond(request, f"movie:{id}", [movie_tag(id)], produce)
 
 
 @movie_router.put("/{id}", response_model = Movie)
@@ -64,13 +170,22 @@ def delete_movie(db : db_dependency, id : int, current_user : Login = Depends(ge
     """
     return crud.delete_movie(db, id, current_user)
 
-@movie_router.get("/search/{title}", response_model= list[Movie])
-def search_movie(db : db_dependency, title : str):
+@movie_router.get("/search/{title}", response_model= list[MovieStats] | list[Movie])
+def search_movie(db : read_db_dependency, title : str, response : Response, after : str | None = None,
+                 limit : int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT), stats : bool = False):
     """
     ## Search for a movie by title
-    This searches for movies by their title and can be accessed by the public
+    This searches movie titles and descriptions and can be accessed by the public.
+    Every word must match, the last letters of a word can be left out, and the
+    best matches come first. Pass the `X-Next-Cursor` response header as `after`
+    to get the next page. Set `stats` to add each movie's average_rating,
+    rating_count and comment_count.
     """
-    return crud.search_movie(db, title)
+    movies, next_cursor = crud.search_movie(db, title, after, limit, stats)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    schema = MovieStats if stats else Movie
+    return [schema.model_validate(movie, from_attributes=True) for movie in movies]
 
 @movie_router.post("/{movie_id}/rate", status_code= status.HTTP_201_CREATED)
 def rate_movie(db : db_dependency, payload : RatingSchema, current_user : Login = Depends(get_current_user)):
@@ -82,12 +197,24 @@ def rate_movie(db : db_dependency, payload : RatingSchema, current_user : Login
 
 
 @movie_router.get("/{movie_id}/ratings")
-def fetch_ratings(db : db_dependency, movie_id : int):
+def fetch_ratings(db : read_db_dependency, request : Request, movie_id : int):
     """
     ## Get ratings for a movie by id
-    This fetches ratings for a movie by its id and can be accessed by the public
+    This fetches ratings for a movie by its id and can be accessed by the public.
+    Send the ETag back in `If-None-Match` to get a 304 when no rating was added.
+    """
+    def produce():
+        return crud.get_ratings(db, movie_id), None
+
+    return response_cache.respond(request, f"ratings:{movie_id}", [movie_tag(movie_id)], produce)
+
+@movie_router.get("/{movie_id}/ratings/summary", response_model= RatingSummary)
+def fetch_rating_summary(db : read_db_dependency, movie_id : int):
+    """
+    ## Get the rating breakdown for a movie by id
+    This returns the rating count, average and per-score histogram of a movie and can be accessed by the public
     """
-    return crud.get_ratings(db, movie_id)
+    return crud.get_rating_summary(db, movie_id)
 
 @movie_router.post("/{id}/comment", response_model= CommentResponse, status_code=status.HTTP_201_CREATED)
 def comment(db : db_dependency, payload : CommentSchema,  current_user : Login = Depends(get_current_user)):
@@ -98,13 +225,65 @@ def comment(db : db_dependency, payload : CommentSchema,  current_user : Login =
     return crud.comment(db, payload, current_user)
 
 @movie_router.get("/{movie_id}/comments")
-def fetch_comments(db : db_dependency, movie_id : int):
+def fetch_comments(db : read_db_dependency, movie_id : int, response : Response, after : str | None = None,
+                   limit : int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT)):
     """
     ## Get comments for a movie by id
-    This fetches comments for a movie by its id and can be accessed by the public
+    This fetches comments for a movie by its id and can be accessed by the public.
+    Pass the `X-Next-Cursor` response header as `after` to get the next page.
+    """
+
+    comments, next_cursor = crud.fetch_comments(db, movie_id, after, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return comments
+
+@movie_router.get("/{movie_id}/live")
+async def follow_movie(movie_id : int):
     """
+    ## Follow a movie's new comments and ratings
+    This streams server-sent events instead of polling the comments, and can be accessed by the public:
+    - comment : a new comment or reply, with its id, user_id, movie_id, parent_id and content
+    - rating : the movie's rating summary after a new rating
 
-    return crud.fetch_comments(db, movie_id)
+    The same path serves a WebSocket that sends the events as JSON messages with a `type` field.
+    A client that falls too far behind is disconnected; it should reconnect and refetch the comments.
+    """
+    return StreamingResponse(
+        event_stream(feed_hub, movie_id),
+        media_type = "text/event-stream",
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@movie_router.websocket("/{movie_id}/live")
+async def follow_movie_websocket(websocket : WebSocket, movie_id : int):
+    await serve_websocket(feed_hub, websocket, movie_id)
+
+@movie_router.get("/{movie_id}/comments/threads", response_model= list[CommentThread])
+def fetch_comment_threads(db : read_db_dependency, movie_id : int, response : Response, after : str | None = None,
+                          limit : int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+                          depth : int = Query(DEFAULT_THREAD_DEPTH, ge=0, le=MAX_THREAD_DEPTH)):
+    """
+    ## Get comment threads for a movie by id
+    This fetches the top-level comments of a movie with their replies nested
+    up to `depth` levels, and can be accessed by the public. A reply with
+    `has_more_replies` has deeper replies, fetch them from its thread.
+    Pass the `X-Next-Cursor` response header as `after` to get the next page.
+    """
+
+    threads, next_cursor = crud.fetch_comment_threads(db, movie_id, after, limit, depth)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return threads
+
+@movie_router.get("/comments/{comment_id}/thread", response_model= CommentThread)
+def fetch_comment_thread(db : read_db_dependency, comment_id : int,
+                         depth : int = Query(DEFAULT_THREAD_DEPTH, ge=0, le=MAX_THREAD_DEPTH)):
+    """
+    ## Get the thread of a comment by id
+    This fetches a comment with its replies nested up to `depth` levels and can be accessed by the public
+    """
+    return crud.fetch_comment_thread(db, comment_id, depth)
 
 @movie_router.post("/{comment_id}/reply")
 def reply_to_comment(db : db_dependency, payload : ReplyComment,  current_user : Login = Depends(get_current_user)):
@@ -9,6 +9,11 @@ class Movie(BaseModel):
     release_date: datetime
     updated_at: datetime
     
+class MovieStats(Movie):
+    average_rating: float | None
+    rating_count: int
+    comment_count: int
+
 class CreateMovie(BaseModel):
     title: str
     description: str
@@ -18,6 +23,31 @@ class Rating(BaseModel):
     rating: int
     movie_id : int
 
+class RatingSummary(BaseModel):
+    movie_id: int
+    rating_count: int
+    rating_sum: int
+    average_rating: float | None
+    histogram: dict[int, int]
+
+class BatchMovie(Movie):
+    ratings: RatingSummary | None = None
+
+class MovieBatch(BaseModel):
+    movies: list[BatchMovie]
+    missing: list[int]
+
+class MovieBatchRequest(BaseModel):
+    ids: list[int]
+    include_ratings: bool = False
+
+class LeaderboardEntry(BaseModel):
+    movie_id: int
+    title: str
+    score: float
+    average_rating: float
+    rating_count: int
+
 class Comment(BaseModel):
     content: str
     movie_id: int 
@@ -31,4 +61,14 @@ class ReplyComment(BaseModel):
     content: str
     comment_id: int
 
+class CommentThread(BaseModel):
+    id: int
+    user_id: int
+    movie_id: int
+    parent_id: int | None
+    content: str
+    depth: int
+    has_more_replies: bool
+    replies: list["CommentThread"]
+
 
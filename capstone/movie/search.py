@@ -0,0 +1,137 @@
+import re
+
+from sqlalchemy import and_, column, func, literal_column, or_, select, table, text
+
+from sqlalchemy.orm import aliased, with_expression
+
+from capstone.movie.models import Comment, Movie, SQLITE_SEARCH_DDL, POSTGRES_SEARCH_DDL
+
+# Title matches count ten times as much as description matches when ranking
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+
+def tokenize(query: str) -> list[str]:
+    """Split a free-text query into lower-cased word tokens, dropping any search syntax."""
+    return re.findall(r"\w+", query.lower())
+
+
+class MovieSearch:
+    """Ranked, prefix-matching search over movie titles and descriptions.
+
+    Every backend answers `search` with the same contract: movies matching all
+    query words (the last characters of each word may be missing), best match
+    first, ties broken by id so pages are stable.
+    """
+
+    def search(self, db, query: str, offset: int, limit: int, stats: bool = False) -> list[Movie]:
+        statement = self.statement(query, offset, limit, stats)
+        if statement is None:
+            return []
+        return db.scalars(statement).all()
+
+    def statement(self, query: str, offset: int, limit: int, stats: bool = False):
+        """Build the select() for one page of results, or None when the query has no words.
+
+        With `stats`, each movie's comment count is loaded by the same statement: the page
+        is ranked and cut first, then left joined to the comment counts of its movies, grouped.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return None
+        rank = self._rank(terms)
+        keys = [Movie.id] if rank is None else [rank, Movie.id]
+        statement = self._statement(terms).order_by(*keys).offset(offset).limit(limit)
+        if not stats:
+            return statement
+        # The rank functions cannot be used in a grouped query, so the page carries its rank as a column
+        page = (statement if rank is None else statement.add_columns(rank.label("rank"))).cte("search_page")
+        movie = aliased(Movie, page)
+        counts = (
+            select(Comment.movie_id, func.count(Comment.id).label("comment_count"))
+            .filter(Comment.movie_id.in_(select(page.c.id)))
+            .group_by(Comment.movie_id)
+            .subquery()
+        )
+        return (
+            select(movie)
+            .outerjoin(counts, counts.c.movie_id == movie.id)
+            .order_by(*([movie.id] if rank is None else [page.c.rank, movie.id]))
+            .options(with_expression(movie.comment_count, func.coalesce(counts.c.comment_count, 0)))
+        )
+
+    def _statement(self, terms):
+        """select() of the movies matching every term, in no particular order."""
+        raise NotImplementedError
+
+    def _rank(self, terms):
+        """Score of a match, lowest first, or None to list the matches by id."""
+        return None
+
+    def rebuild(self, connection):
+        """Create the index if it is missing and re-index every movie."""
+
+
+class SqliteSearch(MovieSearch):
+    """FTS5 external-content index, kept in sync with the movies table by triggers."""
+
+    fts = table("movies_fts", column("rowid"))
+
+    def _statement(self, terms):
+        # Every term becomes a quoted prefix query, and FTS5 ANDs adjacent terms
+        match = " ".join(f'"{term}"*' for term in terms)
+        return (
+            select(Movie)
+            .join(self.fts, self.fts.c.rowid == Movie.id)
+            .filter(literal_column("movies_fts").op("MATCH")(match))
+        )
+
+    def _rank(self, terms):
+        return func.bm25(literal_column("movies_fts"), TITLE_WEIGHT, DESCRIPTION_WEIGHT)
+
+    def rebuild(self, connection):
+        for statement in SQLITE_SEARCH_DDL:
+            connection.execute(text(statement))
+        connection.execute(text("INSERT INTO movies_fts(movies_fts) VALUES ('rebuild')"))
+
+
+class PostgresSearch(MovieSearch):
+    """Weighted tsvector generated column with a GIN index."""
+
+    @staticmethod
+    def _tsquery(terms):
+        return func.to_tsquery("english", " & ".join(f"{term}:*" for term in terms))
+
+    def _statement(self, terms):
+        return select(Movie).filter(literal_column("movies.search_vector").op("@@")(self._tsquery(terms)))
+
+    def _rank(self, terms):
+        # Negated, so the best match comes first like with bm25
+        return -func.ts_rank_cd(literal_column("movies.search_vector"), self._tsquery(terms))
+
+    def rebuild(self, connection):
+        # The generated column is computed for existing rows when it is added
+        for statement in POSTGRES_SEARCH_DDL:
+            connection.execute(text(statement))
+
+
+class LikeSearch(MovieSearch):
+    """Unindexed fallback for databases without a full-text engine."""
+
+    def _statement(self, terms):
+        conditions = [
+            or_(Movie.title.ilike(f"%{term}%"), Movie.description.ilike(f"%{term}%"))
+            for term in terms
+        ]
+        return select(Movie).filter(and_(*conditions))
+
+
+SEARCH_BACKENDS = {
+    "sqlite": SqliteSearch(),
+    "postgresql": PostgresSearch(),
+}
+
+
+def get_search_backend(bind) -> MovieSearch:
+    """Pick the search backend matching the dialect of an engine, connection or session bind."""
+    return SEARCH_BACKENDS.get(bind.dialect.name, LikeSearch())
@@ -1,31 +1,18 @@
 from datetime import datetime, timezone
 from fastapi import HTTPException, status
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.exc import IntegrityError
 
 from capstone.movie.models import Rating as RatingModel
 from capstone.logger import get_logger
-from capstone.movie.models import Movie
+from capstone.movie.models import Comment, Movie, MovieRanking, RankingPrior, description_digest
+from capstone.movie.rankings import (
+    DEFAULT_PRIOR_MEAN, LEADERBOARD_COLUMNS, leaderboard_statement, prior_statement, ranking_row, recompute_statements,
+)
+from capstone.database import upsert
+from capstone.pagination import keyset_query, keyset_result
 from capstone.user.models import User
 
-import logging
-import sentry_sdk
-from sentry_sdk.integrations.logging import LoggingIntegration
-import logging
-# Enable sending logs from the standard Python logging module to Sentry
-logging_integration = LoggingIntegration(
-    level=logging.INFO,  # Capture info and above as breadcrumbs
-    event_level=logging.ERROR  # Send errors as events
-)
-sentry_sdk.init(
-    dsn="https://ee3ca659cdc5658bf02659af610f818b@o4507693153386496.ingest.de.sentry.io/4507693158629456",
-    # Set traces_sample_rate to 1.0 to capture 100%
-    # of transactions for performance monitoring.
-    traces_sample_rate=1.0,
-    # Set profiles_sample_rate to 1.0 to profile 100%
-    # of sampled transactions.
-    # We recommend adjusting this value in production.
-    profiles_sample_rate=1.0,
-    integrations= [logging_integration]
-)
 
 logger = get_logger(__name__)
 
@@ -42,32 +29,111 @@ class MovieService:
             user_id=user_id  # Associate the movie with the user who created it
         )
         db.add(new_movie)  # Add the new movie instance to the database session
-        db.commit()  # Commit the session to save the movie in the database
+        MovieService.commit_movie(db)  # Commit the session, rejecting a duplicate description
         db.refresh(new_movie)  # Refresh the instance with the latest data from the database
         return new_movie  # Return the newly created movie instance
 
-    # Calculates and returns the average rating for a movie
-    def average_rating(db, movie_id) -> str:
-        # Query the database for all ratings associated with the given movie ID
-        ratings = db.query(RatingModel).filter(RatingModel.movie_id == movie_id).all()
-        if not ratings:  # If no ratings are found, raise a 404 error
-            logger.warning(f"No ratings found for movie with ID {movie_id}.")
+    # Returns the average rating for a movie from its stored aggregates
+    def average_rating(movie) -> str:
+        # The running count and sum live on the movie row, so no ratings need to be loaded
+        if not movie.rating_count:  # If no ratings have been recorded, raise a 404 error
+            logger.warning(f"No ratings found for movie with ID {movie.id}.")
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="No ratings found for this movie"
             )
-        # Extract rating values directly from the ORM objects
-        rating_values = [rating.rating for rating in ratings]
-        logger.info(f"Ratings for movie with ID {movie_id} retrieved successfully.")
-        # Calculate the sum of rating values and the number of ratings
-        total_rating = sum(rating_values)
-        len_ratings = len(rating_values)
+        logger.info(f"Ratings for movie with ID {movie.id} retrieved successfully.")
 
         # Return the average rating as a string formatted to one decimal place
-        return (f"average_rating : {total_rating / len_ratings:.1f}")
+        return (f"average_rating : {movie.rating_sum / movie.rating_count:.1f}")
+
+    # Returns the full rating aggregate (count, sum, average and per-score histogram) for a movie
+    def rating_summary(movie) -> dict:
+        count = movie.rating_count or 0
+        return {
+            "movie_id": movie.id,
+            "rating_count": count,
+            "rating_sum": movie.rating_sum or 0,
+            "average_rating": round(movie.rating_sum / count, 1) if count else None,
+            "histogram": {int(score): total for score, total in (movie.rating_histogram or {}).items()},
+        }
+
+    # Folds a new rating (or a changed one, when previous is given) into the movie's aggregates
+    def record_rating(movie, rating, previous=None):
+        # Copy the histogram so SQLAlchemy notices the change on the JSON column
+        histogram = dict(movie.rating_histogram or {})
+        if previous is None:
+            movie.rating_count = (movie.rating_count or 0) + 1
+        else:
+            movie.rating_sum = (movie.rating_sum or 0) - previous
+            histogram[str(previous)] = histogram.get(str(previous), 0) - 1
+            if histogram[str(previous)] <= 0:
+                del histogram[str(previous)]
+        movie.rating_sum = (movie.rating_sum or 0) + rating
+        histogram[str(rating)] = histogram.get(str(rating), 0) + 1
+        movie.rating_histogram = histogram
+        return movie
+
+    # Upserts the leaderboard rows of rated movies from their stored aggregates, at the given or stored prior
+    def update_rankings(db, movies, prior_mean=None):
+        rated = [movie for movie in movies if movie.rating_count]
+        if not rated:
+            return
+        if prior_mean is None:
+            prior = db.get(RankingPrior, 1)
+            prior_mean = prior.mean if prior else DEFAULT_PRIOR_MEAN
+        db.execute(upsert(db, MovieRanking.__table__, ["movie_id"], [ranking_row(movie, prior_mean) for movie in rated]))
+
+    # Rebuilds the whole leaderboard with a fresh catalog-wide prior, correcting the drift of the incremental updates
+    def recompute_rankings(db) -> int:
+        rating_count, mean = db.execute(prior_statement()).one()
+        prior_mean = mean if mean is not None else DEFAULT_PRIOR_MEAN
+        db.merge(RankingPrior(id=1, mean=prior_mean, rating_count=rating_count, computed_at=datetime.now(timezone.utc)))
+        for statement in recompute_statements(prior_mean):
+            db.execute(statement)
+        db.commit()
+        ranked = db.scalar(select(func.count()).select_from(MovieRanking))
+        logger.info(f"Recomputed the leaderboard: {ranked} movie(s) ranked around a mean of {prior_mean:.3f}.")
+        return ranked
+
+    # Fetches one page of the leaderboard, best score first
+    def fetch_leaderboard(db, after, limit):
+        statement = keyset_query(leaderboard_statement(), "leaderboard", LEADERBOARD_COLUMNS, after, limit, descending=True)
+        return keyset_result(db.execute(statement).all(), "leaderboard", LEADERBOARD_COLUMNS, limit)
+
+    # Recomputes the rating aggregates from the ratings table, for one movie or the whole catalog
+    def reconcile_rating_aggregates(db, movie_id=None) -> int:
+        # Group the ratings by movie and score in a single query
+        query = db.query(RatingModel.movie_id, RatingModel.rating, func.count(RatingModel.id)) \
+            .group_by(RatingModel.movie_id, RatingModel.rating)
+        movies = db.query(Movie)
+        if movie_id is not None:
+            query = query.filter(RatingModel.movie_id == movie_id)
+            movies = movies.filter(Movie.id == movie_id)
+
+        histograms = {}
+        for rated_movie_id, rating, total in query:
+            histograms.setdefault(rated_movie_id, {})[str(rating)] = total
+
+        updated = 0
+        for movie in movies.yield_per(1000):
+            histogram = histograms.get(movie.id, {})
+            count = sum(histogram.values())
+            total = sum(int(score) * hits for score, hits in histogram.items())
+            if (movie.rating_count, movie.rating_sum, movie.rating_histogram) != (count, total, histogram):
+                movie.rating_count = count
+                movie.rating_sum = total
+                movie.rating_histogram = histogram
+                updated += 1
+        db.commit()
+        logger.info(f"Reconciled rating aggregates, {updated} movie(s) updated.")
+        return updated
 
     # Fetches the user from the database based on the current session's user
     def fetch_user(db, current_user) -> str:
+        # The token already carries the user's id and username, which is all callers need
+        if current_user.id is not None:
+            return current_user
         # Query the database for a user with the same username as the current user
         user = db.query(User).filter(User.username == current_user.username).first()
         return user  # Return the user instance
@@ -78,30 +144,102 @@ class MovieService:
         movie = db.query(Movie).filter(Movie.id == movie_id).first()
         return movie  # Return the movie instance
 
-    # Checks if the user has already rated the movie
-    def check_existing_rating(db, user, movie) -> str:
-        # Query the database for an existing rating from the user for the given movie
-        existing_rating = db.query(RatingModel).filter(
-            RatingModel.movie_id == movie.id,
-            RatingModel.user_id == user.id
-        ).first()
-        if existing_rating:  # If a rating already exists, raise a 400 error
-            logger.warning(f"User has already rated movie with ID {movie.id}.")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="You have already rated this movie"
-            )
+    # Adds a comment or reply row and returns its generated ID, leaving the commit to the caller
+    def add_comment(db, row) -> int:
+        new_comment = Comment(**row)
+        db.add(new_comment)
+        db.flush()  # Send the INSERT now so the database assigns the ID
+        return new_comment.id
 
-    # Checks if a movie with the same description already exists in the database
-    def check_db_description(db, payload) -> str:
-        # Query the database for a movie with the same description as the provided payload
-        db_description = db.query(Movie).filter(Movie.description == payload.description).first()
-        if db_description:  # If a matching movie is found, raise a 406 error
-            logger.warning("Listing failed for user, A movie with a similar description already exists.")
-            raise HTTPException(
-                status_code=status.HTTP_406_NOT_ACCEPTABLE,
-                detail="Similar Movie already exists, Contact Support to make complaints."
-            )
+    # The fields of a committed comment or reply, as sent to the movie's live feed
+    def comment_event(comment) -> dict:
+        return {column: getattr(comment, column) for column in ("id", "user_id", "movie_id", "parent_id", "content")}
+
+    # Fetches the movies with the given IDs in a single IN query, in no particular order
+    def fetch_movies_by_ids(db, movie_ids):
+        return db.query(Movie).filter(Movie.id.in_(movie_ids)).all()
+
+    # Orders fetched movies as the IDs were requested and lists the IDs that were not found
+    def batch_result(movie_ids, movies, include_ratings) -> dict:
+        found = {movie.id: movie for movie in movies}
+        result = []
+        for movie_id in movie_ids:
+            movie = found.get(movie_id)
+            if movie is not None:
+                item = {column: getattr(movie, column) for column in ("id", "title", "description", "release_date", "updated_at")}
+                # The rating aggregates live on the movie row, so embedding them costs no extra query
+                item["ratings"] = MovieService.rating_summary(movie) if include_ratings else None
+                result.append(item)
+        missing = [movie_id for movie_id in dict.fromkeys(movie_ids) if movie_id not in found]
+        return {"movies": result, "missing": missing}
+
+    # Selects the movie, locking its row until the transaction ends so aggregate updates do not race,
+    # together with the user's current rating of it and the leaderboard prior
+    def rating_target_statement(movie_id, user_id):
+        return select(Movie, RatingModel.rating, func.coalesce(RankingPrior.mean, DEFAULT_PRIOR_MEAN)) \
+            .outerjoin(RatingModel, (RatingModel.movie_id == Movie.id) & (RatingModel.user_id == user_id)) \
+            .outerjoin(RankingPrior, RankingPrior.id == 1) \
+            .filter(Movie.id == movie_id) \
+            .with_for_update(of=Movie)
+
+    # Fetches the movie to rate, the user's previous rating (None if new) and the prior in one round trip
+    def fetch_rating_target(db, movie_id, user_id):
+        return db.execute(MovieService.rating_target_statement(movie_id, user_id)).first()
+
+    # Builds the INSERT .. ON CONFLICT that adds a rating or replaces the user's previous one
+    def rating_upsert(db, user_id, movie_id, rating):
+        return upsert(db, RatingModel.__table__, ["user_id", "movie_id"], [{"user_id": user_id, "movie_id": movie_id, "rating": rating}])
+
+    # Commits a new or edited movie; the unique description hash index does the duplicate check
+    def commit_movie(db):
+        try:
+            db.commit()
+        except IntegrityError as error:
+            db.rollback()
+            # Any other constraint violation is a genuine error
+            if "description_hash" not in str(error.orig):
+                raise
+            MovieService.reject_duplicate_description()
+
+    # Raises the error returned when a listing repeats an existing description
+    def reject_duplicate_description():
+        logger.warning("Listing failed for user, A movie with a similar description already exists.")
+        raise HTTPException(
+            status_code=status.HTTP_406_NOT_ACCEPTABLE,
+            detail="Similar Movie already exists, Contact Support to make complaints."
+        )
+
+    # Fills in the description hash of movies stored before the column existed, in batches.
+    # A movie repeating an earlier movie's description keeps no hash, as the index allows only one
+    def backfill_description_hashes(db, batch_size=1000) -> tuple[int, int]:
+        seen = {digest for digest, in db.query(Movie.description_hash).filter(Movie.description_hash.isnot(None))}
+        statement = update(Movie.__table__) \
+            .where(Movie.__table__.c.id == bindparam("movie_id")) \
+            .values(description_hash=bindparam("digest"))
+        updated = duplicates = last_id = 0
+        while True:
+            rows = db.query(Movie.id, Movie.description) \
+                .filter(Movie.description_hash.is_(None), Movie.id > last_id) \
+                .order_by(Movie.id).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            values = []
+            for movie_id, description in rows:
+                digest = description_digest(description)
+                if digest is None:
+                    continue
+                if digest in seen:
+                    duplicates += 1
+                    continue
+                seen.add(digest)
+                values.append({"movie_id": movie_id, "digest": digest})
+            if values:
+                db.execute(statement, values)
+                updated += len(values)
+            db.commit()
+        logger.info(f"Backfilled {updated} description hash(es), {duplicates} duplicate description(s) left unhashed.")
+        return updated, duplicates
 
     # Validates the rating value to ensure it is within the acceptable range (1 to 10)
     def check_rating_range(rating) -> bool:
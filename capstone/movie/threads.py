@@ -0,0 +1,59 @@
+from sqlalchemy import literal_column, select
+from sqlalchemy.orm import aliased
+
+from capstone.movie.models import Comment
+
+DEFAULT_THREAD_DEPTH = 10
+# Deeper threads are read in several requests, continuing from a comment with has_more_replies
+MAX_THREAD_DEPTH = 100
+
+
+def thread_statement(anchor_ids, max_depth: int):
+    """Select the comments in `anchor_ids` and their replies down to `max_depth` levels in one recursive query.
+
+    Args:
+        anchor_ids: The ids of the comments the threads start from, a list or a select() of ids.
+        max_depth (int): How many levels of replies to fetch below each anchor.
+
+    Returns:
+        Select: Rows of comment columns plus `root_id`, `depth` and `has_more`, parents before their replies.
+    """
+    anchor = select(
+        Comment.id, Comment.user_id, Comment.movie_id, Comment.parent_id, Comment.content,
+        Comment.id.label("root_id"), literal_column("0").label("depth"),
+    ).filter(Comment.id.in_(anchor_ids))
+    thread = anchor.cte("thread", recursive=True)
+    replies = select(
+        Comment.id, Comment.user_id, Comment.movie_id, Comment.parent_id, Comment.content,
+        thread.c.root_id, (thread.c.depth + 1).label("depth"),
+    ).join(thread, Comment.parent_id == thread.c.id).filter(thread.c.depth < max_depth)
+    thread = thread.union_all(replies)
+
+    # Only the comments on the last level can have replies that were not fetched
+    reply = aliased(Comment)
+    has_more = (thread.c.depth == max_depth) & select(reply.id).filter(reply.parent_id == thread.c.id).exists()
+    return select(thread, has_more.label("has_more")).order_by(thread.c.depth, thread.c.id)
+
+
+def build_threads(rows) -> list[dict]:
+    """Nest the rows of a `thread_statement` into comment trees, returning the anchors in id order."""
+    nodes = {}
+    roots = []
+    for row in rows:
+        node = {
+            "id": row.id,
+            "user_id": row.user_id,
+            "movie_id": row.movie_id,
+            "parent_id": row.parent_id,
+            "content": row.content,
+            "depth": row.depth,
+            "has_more_replies": bool(row.has_more),
+            "replies": [],
+        }
+        nodes[row.id] = node
+        # Rows are ordered by depth, so a reply's parent has always been seen already
+        if row.depth:
+            nodes[row.parent_id]["replies"].append(node)
+        else:
+            roots.append(node)
+    return roots
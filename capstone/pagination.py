@@ -0,0 +1,154 @@
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, or_
+
+from capstone.logger import get_logger
+
+logger = get_logger(__name__)
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+
+
+def encode_cursor(order: str, values: list) -> str:
+    """Pack the sort key of the last row on a page into an opaque, URL-safe cursor.
+
+    Args:
+        order (str): The name of the ordering the cursor belongs to.
+        values (list): The sort key values of the last row, in key order.
+
+    Returns:
+        str: The encoded cursor.
+    """
+    payload = {
+        "o": order,
+        "v": [value.isoformat() if isinstance(value, datetime) else value for value in values],
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, order: str, columns: list) -> list:
+    """Unpack a cursor produced by `encode_cursor` for the given ordering.
+
+    Args:
+        cursor (str): The cursor received from the client.
+        order (str): The ordering the current request uses.
+        columns (list): The key columns, used to check the type of each value and restore datetimes.
+
+    Returns:
+        list: The sort key values stored in the cursor.
+
+    Raises:
+        HTTPException: If the cursor is malformed, belongs to another ordering or holds a
+        value of the wrong type for its column, an exception with status code 400 and a
+        message "Invalid cursor" is raised.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        values = payload["v"]
+        if payload["o"] != order or len(values) != len(columns):
+            raise ValueError("cursor does not match the requested ordering")
+        return [_restore(column, value) for column, value in zip(columns, values)]
+    except (ValueError, KeyError, TypeError) as error:
+        logger.warning(f"Rejected pagination cursor '{cursor}': {error}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+def _restore(column, value):
+    # A value of the wrong type would reach the keyset comparison, where PostgreSQL rejects it with an error
+    try:
+        python_type = column.type.python_type
+    except (AttributeError, NotImplementedError):
+        return value
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is float and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    if python_type in (int, float, str) and type(value) is not python_type:
+        raise ValueError(f"cursor value {value!r} is not of type {python_type.__name__}")
+    return value
+
+
+def keyset_page(query, order: str, columns: list, after: str | None, limit: int, descending: bool = False):
+    """Fetch one page of a query using keyset (seek) pagination.
+
+    The query is ordered on `columns`, which must end with a unique column so the
+    order is total. Rows after the cursor are located with a range predicate on the
+    key instead of OFFSET, so every page costs the same no matter how deep it is.
+
+    Args:
+        query: The SQLAlchemy query to paginate.
+        order (str): The name of the ordering, stored in the cursor.
+        columns (list): The key columns, most significant first.
+        after (str | None): The cursor returned with the previous page, if any.
+        limit (int): The maximum number of rows to return.
+        descending (bool): Whether the key is walked from highest to lowest.
+
+    Returns:
+        tuple: The rows of the page and the cursor for the next page, or None on the last page.
+    """
+    rows = keyset_query(query, order, columns, after, limit, descending).all()
+    return keyset_result(rows, order, columns, limit)
+
+
+def keyset_query(query, order: str, columns: list, after: str | None, limit: int, descending: bool = False):
+    """Apply the cursor, ordering and limit of `keyset_page` to a query or select() without running it.
+
+    One row more than `limit` is requested so `keyset_result` can tell whether another page exists.
+    """
+    if after:
+        values = decode_cursor(after, order, columns)
+        query = query.filter(_seek_predicate(columns, values, descending))
+
+    ordering = [column.desc() if descending else column.asc() for column in columns]
+    return query.order_by(*ordering).limit(limit + 1)
+
+
+def keyset_result(rows: list, order: str, columns: list, limit: int):
+    """Trim the rows fetched by a `keyset_query` to one page and build the cursor for the next."""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(order, [getattr(last, column.key) for column in columns])
+    return rows, next_cursor
+
+
+def decode_offset(after: str | None, order: str) -> int:
+    """Read the position stored in a cursor for results that cannot be walked by key, such as ranked matches.
+
+    Args:
+        after (str | None): The cursor returned with the previous page, if any.
+        order (str): The name of the ordering the cursor belongs to.
+
+    Returns:
+        int: The number of results already returned.
+    """
+    if not after:
+        return 0
+    offset = decode_cursor(after, order, [None])[0]
+    if not isinstance(offset, int) or offset < 0:
+        logger.warning(f"Rejected pagination cursor '{after}': bad offset")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    return offset
+
+
+def _seek_predicate(columns, values, descending):
+    # Expands (a, b) > (x, y) into a > x OR (a = x AND b > y), which every backend can use with an index
+    column, value = columns[0], values[0]
+    beyond = column < value if descending else column > value
+    if len(columns) == 1:
+        return beyond
+    return or_(beyond, and_(column == value, _seek_predicate(columns[1:], values[1:], descending)))
@@ -0,0 +1,120 @@
+import itertools
+import os
+import threading
+import time
+
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from capstone.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Seconds a replica that failed to connect is left out before it is tried again
+REPLICA_RETRY_INTERVAL = float(os.getenv("REPLICA_RETRY_INTERVAL", 10))
+
+
+class ReplicaSet:
+    """Read replicas taken in turn, each one skipped for a while after it fails to connect.
+
+    A `ReplicaSession` connects through `connect` on its first statement, so a
+    replica that is down is noticed before that statement runs and the session
+    falls back to the primary. Replica engines are built with pool_pre_ping, which
+    also catches pooled connections to a replica that restarted.
+    """
+
+    def __init__(self, sessionmakers: list, names: list[str] | None = None, retry_interval: float = REPLICA_RETRY_INTERVAL):
+        self.sessionmakers = sessionmakers
+        self.names = names or [f"replica{index}" for index in range(len(sessionmakers))]
+        self.retry_interval = retry_interval
+        self._down_until = [0.0] * len(sessionmakers)
+        self._turns = itertools.count()
+        self._lock = threading.Lock()
+        self.reads = 0
+        self.failures = 0
+        self.fallbacks = 0
+
+    def candidates(self) -> list[int]:
+        """The replicas to try for the next read, healthy ones only, starting with the next in turn."""
+        now = time.monotonic()
+        with self._lock:
+            start = next(self._turns)
+        count = len(self.sessionmakers)
+        return [index for index in ((start + offset) % count for offset in range(count)) if self._down_until[index] <= now]
+
+    def mark_down(self, index: int, error: Exception):
+        with self._lock:
+            self._down_until[index] = time.monotonic() + self.retry_interval
+            self.failures += 1
+        logger.warning(f"Read replica {self.names[index]} is unavailable, skipping it for {self.retry_interval:g}s: {error}")
+
+    def _served(self, connection):
+        with self._lock:
+            if connection is None:
+                self.fallbacks += 1
+            else:
+                self.reads += 1
+        return connection
+
+    def connect(self):
+        """A connection to a healthy replica, or None when every replica is down."""
+        for index in self.candidates():
+            bind = self.sessionmakers[index].kw["bind"]
+            try:
+                # The sync engine of an async one too: sessions call this from their greenlet
+                connection = getattr(bind, "sync_engine", bind).connect()
+            except DBAPIError as error:
+                self.mark_down(index, error)
+                continue
+            return self._served(connection)
+        return self._served(None)
+
+    def engines(self) -> list:
+        return [factory.kw["bind"] for factory in self.sessionmakers]
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "replicas": len(self.sessionmakers),
+                "down": sum(until > now for until in self._down_until),
+                "reads": self.reads,
+                "failures": self.failures,
+                "fallbacks": self.fallbacks,
+            }
+
+
+class ReplicaSession(Session):
+    """A read-only session that picks its database on its first statement, not when it is created.
+
+    A route answered from the response cache, or with a 304, never runs a statement
+    and so never touches a replica. The first statement connects to a healthy
+    replica, or runs on `primary`, an engine, when every replica is down;
+    `on_replica` is called once a replica serves the session. Also used as the
+    `sync_session_class` of an AsyncSession.
+    """
+
+    def __init__(self, replicas: ReplicaSet, primary, on_replica=None, **kw):
+        super().__init__(**kw)
+        self.replicas = replicas
+        self.primary = primary
+        self.on_replica = on_replica
+        self._routed_bind = None
+
+    def get_bind(self, mapper=None, **kw):
+        if self._routed_bind is None:
+            connection = self.replicas.connect()
+            if connection is None:
+                self._routed_bind = self.primary
+            else:
+                self._routed_bind = connection
+                if self.on_replica is not None:
+                    self.on_replica()
+        return self._routed_bind
+
+    def close(self):
+        super().close()
+        # The session only joined the replica connection, it is returned to the pool here
+        if self._routed_bind is not None and self._routed_bind is not self.primary:
+            self._routed_bind.close()
+        self._routed_bind = None
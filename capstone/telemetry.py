@@ -0,0 +1,91 @@
+import logging
+import os
+import re
+
+import sentry_sdk
+from sentry_sdk.integrations.logging import LoggingIntegration
+
+SENTRY_DSN = os.getenv("SENTRY_DSN", "")
+SENTRY_ENVIRONMENT = os.getenv("SENTRY_ENVIRONMENT", "production")
+# Fraction of requests traced when no rule matches them
+TRACES_SAMPLE_RATE = float(os.getenv("TRACES_SAMPLE_RATE", 0.01))
+# Fraction of the traced requests that are also profiled
+PROFILES_SAMPLE_RATE = float(os.getenv("PROFILES_SAMPLE_RATE", 0.0))
+# Fraction of error events sent, errors are not sampled by default
+ERROR_SAMPLE_RATE = float(os.getenv("ERROR_SAMPLE_RATE", 1.0))
+# Per-route trace rates, e.g. "GET /movie/{id}=0.01,/movie/import=1"
+TRACE_SAMPLING_RULES = os.getenv("TRACE_SAMPLING_RULES", "")
+
+_initialized = False
+
+
+class TraceSampler:
+    """Decides the trace rate of a request from its method and path.
+
+    Rules are tried in order and the first one matching wins. A rule's path is
+    a route template whose `{parameters}` match one path segment, and a rule
+    without a method applies to every method. A request continuing a trace
+    keeps the upstream decision.
+    """
+
+    def __init__(self, rules: list[tuple[str | None, str, float]], default_rate: float):
+        self.default_rate = default_rate
+        self.rules = [
+            (method, re.compile(re.sub(r"\\{[^/]+?\\}", "[^/]+", re.escape(path)) + "/?"), rate)
+            for method, path, rate in rules
+        ]
+
+    def rate(self, method: str | None, path: str) -> float:
+        for rule_method, pattern, rate in self.rules:
+            if (rule_method is None or rule_method == method) and pattern.fullmatch(path):
+                return rate
+        return self.default_rate
+
+    def __call__(self, sampling_context: dict) -> float:
+        parent_sampled = sampling_context.get("parent_sampled")
+        if parent_sampled is not None:
+            return float(parent_sampled)
+        scope = sampling_context.get("asgi_scope") or {}
+        return self.rate(scope.get("method"), scope.get("path", ""))
+
+
+def parse_rules(value: str) -> list[tuple[str | None, str, float]]:
+    """Parse "METHOD /path=rate,/path=rate" into (method, path, rate) rules."""
+    rules = []
+    for item in value.split(","):
+        route, _, rate = item.rpartition("=")
+        if not route.strip():
+            continue
+        method, _, path = route.strip().rpartition(" ")
+        rules.append((method.upper() or None, path, float(rate)))
+    return rules
+
+
+def sentry_options(dsn: str = SENTRY_DSN, traces_sample_rate: float = TRACES_SAMPLE_RATE,
+                   profiles_sample_rate: float = PROFILES_SAMPLE_RATE, rules: str = TRACE_SAMPLING_RULES) -> dict:
+    """The arguments `init_telemetry` passes to `sentry_sdk.init`."""
+    return {
+        "dsn": dsn,
+        "environment": SENTRY_ENVIRONMENT,
+        "sample_rate": ERROR_SAMPLE_RATE,
+        "traces_sampler": TraceSampler(parse_rules(rules), traces_sample_rate),
+        "profiles_sample_rate": profiles_sample_rate,
+        "integrations": [
+            # Log lines become breadcrumbs, errors logged become events
+            LoggingIntegration(level=logging.INFO, event_level=logging.ERROR),
+        ],
+    }
+
+
+def init_telemetry() -> bool:
+    """Initialize Sentry once for the process, returning whether it is enabled.
+
+    Without SENTRY_DSN nothing is initialized and the SDK calls are no-ops.
+    """
+    global _initialized
+    if not SENTRY_DSN:
+        return False
+    if not _initialized:
+        sentry_sdk.init(**sentry_options())
+        _initialized = True
+    return True
@@ -0,0 +1,6 @@
+import os
+
+# Keep the suite's logs in memory instead of shipping them to Papertrail
+os.environ.setdefault("LOG_SINK", "memory")
+# and its errors and traces out of Sentry
+os.environ["SENTRY_DSN"] = ""
@@ -0,0 +1,125 @@
+import os
+
+from dotenv import load_dotenv
+
+import pytest
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from fastapi  import status
+
+from capstone.cache import response_cache
+from capstone.database import Base, get_async_db, to_async_url
+from capstone.main import include_routers
+from capstone.user.async_routers import async_user_router
+from capstone.movie.async_routers import async_movie_router
+
+load_dotenv()
+
+SQLALCHEMY_DATABASE_URL = os.getenv("SQLALCHEMY_DATABASE_URL")
+
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+)
+async_engine = create_async_engine(to_async_url(SQLALCHEMY_DATABASE_URL))
+TestingAsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+# The async routers on their own, as served when DATABASE_MODE=async
+async_app = FastAPI()
+include_routers(async_app, [async_user_router, async_movie_router])
+async_app.dependency_overrides[get_async_db] = override_get_async_db
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(async_app) as c:
+        yield c
+
+
+@pytest.fixture(scope="module")
+def setup_database():
+    Base.metadata.create_all(bind=engine)
+    response_cache.clear()
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture(scope="module")
+def token(client, setup_database):
+    response = client.post(
+        "/user/signup",
+        json={"username": "asyncuser", "email": "async@example.com", "password": "secret"}
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.json() == {"username": "asyncuser", "movies": []}
+    response = client.post("/user/auth/login", data={"username": "asyncuser", "password": "secret"})
+    assert response.status_code == status.HTTP_200_OK
+    return response.json()["access_token"]
+
+
+def test_async_signup_checks(client, token):
+    response = client.post(
+        "/user/signup",
+        json={"username": "asyncuser", "email": "other@example.com", "password": "secret"}
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()["detail"] == "Username already exists"
+    response = client.post("/user/auth/login", data={"username": "asyncuser", "password": "wrong"})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_async_list_fetch_and_search(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    for title in ("Async Movie", "Another Feature"):
+        response = client.post("/movie", json={"title": title, "description": f"{title} Description"}, headers=headers)
+        assert response.status_code == status.HTTP_201_CREATED
+
+    response = client.post("/movie", json={"title": "Copy", "description": "Async Movie Description"}, headers=headers)
+    assert response.status_code == status.HTTP_406_NOT_ACCEPTABLE
+
+    response = client.get("/movie", params={"limit": 1})
+    assert [movie["title"] for movie in response.json()] == ["Async Movie"]
+    response = client.get("/movie", params={"after": response.headers["X-Next-Cursor"]})
+    assert [movie["title"] for movie in response.json()] == ["Another Feature"]
+
+    assert client.get("/movie/1").json()["title"] == "Async Movie"
+    assert client.get("/movie/999").status_code == status.HTTP_404_NOT_FOUND
+    assert [movie["id"] for movie in client.get("/movie/search/asy mov").json()] == [1]
+
+
+def test_async_rate_and_comment(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.post("/movie/1/rate", json={"movie_id": 1, "rating": 8}, headers=headers)
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.json() == "average_rating : 8.0"
+    # Rating again replaces the first rating instead of adding one
+    response = client.post("/movie/1/rate", json={"movie_id": 1, "rating": 6}, headers=headers)
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.json() == "average_rating : 6.0"
+    assert client.get("/movie/1/ratings/summary").json()["histogram"] == {"6": 1}
+
+    response = client.post("/movie/1/comment", json={"movie_id": 1, "content": "Async"}, headers=headers)
+    assert response.status_code == status.HTTP_201_CREATED
+    response = client.post("/movie/1/reply", json={"comment_id": 1, "content": "Reply"}, headers=headers)
+    assert response.json()["parent_id"] == 1
+    assert [comment["content"] for comment in client.get("/movie/1/comments").json()] == ["Async", "Reply"]
+
+
+def test_async_update_and_delete(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.put("/movie/2", json={"title": "Renamed", "description": "Fresh"}, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["title"] == "Renamed"
+
+    response = client.delete("/movie/1", headers=headers)
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert client.get("/movie/1").status_code == status.HTTP_404_NOT_FOUND
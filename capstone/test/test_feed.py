@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from fastapi.testclient import TestClient
+from fastapi  import status
+
+from capstone import database
+from capstone.cache import response_cache
+from capstone.database import Base, get_db
+from capstone.feed import FeedHub, event_stream
+from capstone.main import app
+from capstone.movie.models import Movie
+
+
+def test_events_reach_the_movie_subscribers_only():
+    async def scenario():
+        hub = FeedHub(queue_size=10)
+        followers = [hub.subscribe(1) for _ in range(3)]
+        other = hub.subscribe(2)
+        hub.publish(1, "comment", {"id": 7, "content": "Hello"})
+        events = [await follower.next(1) for follower in followers]
+        assert all(event.json == '{"type":"comment","id":7,"content":"Hello"}' for event in events)
+        assert other.queue.empty()
+        return hub.stats()
+
+    assert asyncio.run(scenario()) == {"movies": 2, "subscribers": 4, "published": 1, "delivered": 3, "evicted": 0}
+
+
+def test_slow_subscribers_are_evicted():
+    async def scenario():
+        hub = FeedHub(queue_size=2)
+        slow = hub.subscribe(1)
+        fast = hub.subscribe(1)
+        for rating in range(3):
+            hub.publish(1, "rating", {"movie_id": 1, "rating_count": rating + 1})
+            assert (await fast.next(1)).json.endswith(f'"rating_count":{rating + 1}}}')
+        # The third event did not fit: the waiting ones are dropped and the feed ends
+        assert await slow.next(1) is None
+        assert slow.close_code == status.WS_1013_TRY_AGAIN_LATER
+        return hub.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["evicted"] == 1 and stats["subscribers"] == 1
+
+
+def test_event_stream_sends_server_sent_events():
+    async def scenario():
+        hub = FeedHub()
+        stream = event_stream(hub, 1)
+        waiting = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        hub.publish(1, "comment", {"id": 1})
+        assert await waiting == 'event: comment\ndata: {"type":"comment","id":1}\n\n'
+        hub.close()
+        with pytest.raises(StopAsyncIteration):
+            await anext(stream)
+        return hub.stats()["subscribers"]
+
+    assert asyncio.run(scenario()) == 0
+
+
+@pytest.fixture
+def live_app(tmp_path, monkeypatch):
+    """The app on a database file holding one movie to follow."""
+    engine = create_engine(f"sqlite:///{tmp_path}/feed.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(Movie.__table__.insert(), [{"title": "Live", "description": "A live movie"}])
+    monkeypatch.setattr(database, "get_sessionmaker", lambda: sessionmaker(autocommit=False, autoflush=False, bind=engine))
+    monkeypatch.setattr(database, "get_replicas", lambda: None)
+    monkeypatch.delitem(app.dependency_overrides, get_db, raising=False)
+    response_cache.clear()
+    yield TestClient(app)
+    response_cache.clear()
+    engine.dispose()
+
+
+def test_websocket_follows_new_comments_and_ratings(live_app):
+    client = live_app
+    client.post("/user/signup", json={"username": "viewer", "email": "viewer@example.com", "password": "secret"})
+    token = client.post("/user/auth/login", data={"username": "viewer", "password": "secret"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    with client.websocket_connect("/movie/1/live") as websocket:
+        response = client.post("/movie/1/comment", json={"movie_id": 1, "content": "Live!"}, headers=headers)
+        assert response.status_code == status.HTTP_201_CREATED
+        event = websocket.receive_json()
+        assert event["type"] == "comment" and event["content"] == "Live!" and event["parent_id"] is None
+
+        client.post("/movie/1/reply", json={"comment_id": event["id"], "content": "Indeed"}, headers=headers)
+        assert websocket.receive_json()["parent_id"] == event["id"]
+
+        client.post("/movie/1/rate", json={"movie_id": 1, "rating": 9}, headers=headers)
+        event = websocket.receive_json()
+        assert event["type"] == "rating"
+        assert (event["rating_count"], event["average_rating"], event["histogram"]) == (1, 9.0, {"9": 1})
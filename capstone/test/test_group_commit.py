@@ -0,0 +1,142 @@
+import threading
+
+import pytest
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from fastapi  import status
+
+from capstone import database, group_commit
+from capstone.cache import response_cache
+from capstone.database import Base, get_db
+from capstone.group_commit import GroupCommitBuffer
+from capstone.main import app
+from capstone.movie.models import Comment, Movie
+from capstone.movie.service import MovieService
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """A database file holding one movie to comment on."""
+    engine = create_engine(f"sqlite:///{tmp_path}/group.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(Movie.__table__.insert(), [{"title": "Grouped", "description": "A grouped movie"}])
+    yield engine
+    engine.dispose()
+
+
+def comment_write(content):
+    return lambda db: MovieService.add_comment(db, {"movie_id": 1, "content": content})
+
+
+def count_comments(engine):
+    with engine.connect() as connection:
+        return connection.execute(select(func.count()).select_from(Comment)).scalar()
+
+
+def test_concurrent_writes_share_one_commit(engine):
+    buffer = GroupCommitBuffer(interval=5, max_rows=3)
+    futures = [buffer.submit(engine, comment_write(f"Comment {number}")) for number in range(3)]
+    # The batch is full, so it is committed without waiting for the interval
+    ids = [future.result(timeout=2) for future in futures]
+    buffer.close()
+
+    assert sorted(ids) == [1, 2, 3]
+    assert count_comments(engine) == 3
+    assert buffer.stats() == {"pending": 0, "batches": 1, "rows": 3, "retries": 0}
+
+
+def test_close_commits_the_waiting_writes(engine):
+    buffer = GroupCommitBuffer(interval=60, max_rows=100)
+    future = buffer.submit(engine, comment_write("Last one"))
+    buffer.close()
+    assert future.result(timeout=0) == 1
+    assert count_comments(engine) == 1
+
+
+def test_a_failing_write_fails_alone(engine):
+    def not_found(db):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Movie not found")
+
+    def duplicate(db):
+        return MovieService.add_comment(db, {"id": 1, "movie_id": 1, "content": "Same id"})
+
+    buffer = GroupCommitBuffer(interval=5, max_rows=4)
+    futures = [buffer.submit(engine, write) for write in (comment_write("Kept"), not_found, duplicate, comment_write("Also kept"))]
+    buffer.close()
+
+    assert futures[0].result() == 1
+    with pytest.raises(HTTPException):
+        futures[1].result()
+    # The duplicate primary key aborts the shared commit; the batch is retried write by write
+    with pytest.raises(Exception):
+        futures[2].result()
+    assert futures[3].result() == 2
+    assert count_comments(engine) == 2
+    assert buffer.stats()["retries"] == 1
+
+
+def test_the_flusher_survives_a_failed_batch(engine, monkeypatch):
+    buffer = GroupCommitBuffer(interval=0.01)
+    commit = buffer._commit
+
+    def lost_connection(bind, writes):
+        # Fail outside the writes, once, as a rollback on a dead connection would
+        monkeypatch.setattr(buffer, "_commit", commit)
+        raise RuntimeError("connection lost")
+
+    monkeypatch.setattr(buffer, "_commit", lost_connection)
+    with pytest.raises(RuntimeError):
+        buffer.submit(engine, comment_write("Lost")).result(timeout=2)
+    assert buffer.submit(engine, comment_write("Kept")).result(timeout=2) == 1
+    buffer.close()
+
+
+@pytest.fixture
+def grouped(engine, monkeypatch):
+    """The app committing through a buffer of its own, on the movie database."""
+    buffer = GroupCommitBuffer(interval=0.05, max_rows=100)
+    monkeypatch.setattr(group_commit, "GROUP_COMMIT", True)
+    monkeypatch.setattr(group_commit, "write_buffer", buffer)
+    monkeypatch.setattr(database, "get_sessionmaker", lambda: sessionmaker(autocommit=False, autoflush=False, bind=engine))
+    monkeypatch.setattr(database, "get_replicas", lambda: None)
+    monkeypatch.delitem(app.dependency_overrides, get_db, raising=False)
+    response_cache.clear()
+    yield buffer
+    buffer.close()
+    response_cache.clear()
+
+
+def test_routes_answer_once_their_rows_are_committed(grouped, engine):
+    client = TestClient(app)
+    client.post("/user/signup", json={"username": "grouper", "email": "grouper@example.com", "password": "secret"})
+    token = client.post("/user/auth/login", data={"username": "grouper", "password": "secret"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    responses = [None] * 4
+
+    def post(index):
+        responses[index] = client.post("/movie/1/comment", json={"movie_id": 1, "content": f"Together {index}"}, headers=headers)
+
+    threads = [threading.Thread(target=post, args=(index,)) for index in range(len(responses))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(response.status_code == status.HTTP_201_CREATED for response in responses)
+    assert count_comments(engine) == len(responses)
+
+    response = client.post("/movie/1/reply", json={"comment_id": 1, "content": "Replied"}, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["id"] == len(responses) + 1
+
+    response = client.post("/movie/1/rate", json={"movie_id": 1, "rating": 7}, headers=headers)
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.json() == "average_rating : 7.0"
+    response = client.post("/movie/2/rate", json={"movie_id": 2, "rating": 7}, headers=headers)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert grouped.stats()["rows"] == len(responses) + 2
@@ -0,0 +1,98 @@
+import logging
+import queue
+import socket
+import time
+
+from capstone.logger import (
+    BatchingQueueListener, BatchingSysLogHandler, BoundedQueueHandler, MemorySink, SamplingFilter,
+    get_logger, parse_sampling, start_logging,
+)
+
+
+def make_record(name="capstone.test", level=logging.INFO, message="message"):
+    return logging.LogRecord(name, level, __file__, 0, message, None, None)
+
+
+def test_logs_reach_the_memory_sink():
+    get_logger("capstone.test").info("shipped off the request path")
+    sink = start_logging()
+    for _ in range(100):
+        if any(line.endswith("capstone.test shipped off the request path") for line in sink.lines):
+            break
+        time.sleep(0.01)
+    else:
+        raise AssertionError("the log line never reached the sink")
+
+
+def test_full_queue_drops_records():
+    handler = BoundedQueueHandler(queue.Queue(1), "drop")
+    handler.handle(make_record())
+    handler.handle(make_record())
+    assert handler.dropped == 1
+
+    handler = BoundedQueueHandler(queue.Queue(1), "block", block_timeout=0.01)
+    handler.handle(make_record())
+    handler.handle(make_record())
+    assert handler.dropped == 1
+
+
+def test_sampling_keeps_warnings():
+    sampling = SamplingFilter(parse_sampling("capstone.movie=0, capstone.movie.service=1"))
+    assert not sampling.filter(make_record("capstone.movie.crud"))
+    assert sampling.filter(make_record("capstone.movie.crud", logging.WARNING))
+    assert sampling.filter(make_record("capstone.movie.service"))
+    assert sampling.filter(make_record("capstone.user.crud"))
+    assert sampling.sampled_out == 1
+
+
+def test_listener_flushes_in_batches():
+    log_queue = queue.Queue()
+    for number in range(50):
+        log_queue.put(make_record(message=f"line {number}"))
+    memory = MemorySink()
+    listener = BatchingQueueListener(log_queue, memory)
+    listener.start()
+    listener.stop()
+    assert list(memory.lines) == [f"line {number}" for number in range(50)]
+    assert memory.flushes <= 2
+
+
+def test_syslog_frames_are_sent_per_batch():
+    collector = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    collector.bind(("127.0.0.1", 0))
+    collector.settimeout(1)
+    handler = BatchingSysLogHandler(collector.getsockname(), batch_size=2)
+    handler.handle(make_record(message="first"))
+    handler.handle(make_record(message="second"))
+    assert collector.recv(1024) == b"<14>first"
+    assert collector.recv(1024) == b"<14>second"
+    handler.close()
+    collector.close()
+
+
+def test_a_failed_start_is_retried_by_the_next_record():
+    attempts = []
+
+    def start():
+        attempts.append(len(attempts))
+        if len(attempts) == 1:
+            raise OSError("collector unreachable")
+
+    handler = BoundedQueueHandler(queue.Queue(), on_first_record=start)
+    for _ in range(3):
+        handler.handle(make_record())
+    assert attempts == [0, 1]
+    assert handler.queue.qsize() == 3
+
+
+def test_syslog_handler_connects_on_its_first_flush():
+    collector = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    collector.bind(("127.0.0.1", 0))
+    address = collector.getsockname()
+    collector.close()
+    # Nothing listens there: building the handler does not notice, its first batch fails
+    handler = BatchingSysLogHandler(address, socket.SOCK_STREAM, batch_size=1)
+    assert handler.socket is None
+    handler.handle(make_record())
+    assert handler.failed == 1 and handler.socket is None
+    handler.close()
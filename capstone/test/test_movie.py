@@ -1,3 +1,5 @@
+import gzip
+import json
 import os
 
 from dotenv import load_dotenv
@@ -10,8 +12,14 @@ from sqlalchemy.orm import sessionmaker
 from fastapi.testclient import TestClient
 from fastapi  import status
 
+from capstone.cache import response_cache
+from capstone.metrics import MetricsRegistry, RequestStats
 from capstone.database import Base, get_db
 from capstone.main import app
+from capstone.movie import bulk
+from capstone.movie.models import Movie as Movie_model
+from capstone.movie.service import MovieService
+from capstone.pagination import encode_cursor
 
 load_dotenv()
 
@@ -45,6 +53,7 @@ def client():
 @pytest.fixture(scope="module")
 def setup_database():
     Base.metadata.create_all(bind=engine)
+    response_cache.clear()
     yield
     Base.metadata.drop_all(bind=engine)
   
@@ -91,6 +100,11 @@ def test_description_already_exists(client, setup_database, username, email, pas
     assert response.status_code == status.HTTP_406_NOT_ACCEPTABLE
     assert response.json().get("detail") == "Similar Movie already exists, Contact Support to make complaints."
 
+    # Case and whitespace differences do not make a description new
+    movie_data = {"title": "Test Movie", "description": "  test   DESCRIPTION "}
+    response = client.post("/movie", json=movie_data, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == status.HTTP_406_NOT_ACCEPTABLE
+
 @pytest.mark.parametrize("username, password", [("testuser", "testpassword")])
 def test_fetch_movies(client, setup_database, username, password):
     response = client.get("/movie")
@@ -288,20 +302,31 @@ def test_user_already_rated_movie(client, setup_database, username, password):
     response = client.post("/user/auth/login", data={"username": username, "password": password})
     assert response.status_code == status.HTTP_200_OK
     token = response.json()["access_token"]
-        #Rate the movie id == 2
+        #Rating the movie id == 2 again replaces the first rating
     response = client.post(
         "/movie/{movie_id}/rate",
         json={
             "movie_id" : 2,
-            "rating": 6.0
+            "rating": 8
         },
         headers={
             "Authorization": f"Bearer {token}",
             "content_type": "application/json"
         }
     ) 
-    assert response.status_code == status.HTTP_400_BAD_REQUEST
-    assert response.json().get("detail") == "You have already rated this movie"
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.json() == "average_rating : 8.0"
+    summary = client.get("/movie/2/ratings/summary").json()
+    assert summary["rating_count"] == 1
+    assert summary["histogram"] == {"8": 1}
+
+    # Change it back for the tests that follow
+    response = client.post(
+        "/movie/{movie_id}/rate",
+        json={"movie_id" : 2, "rating": 6},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.json() == "average_rating : 6.0"
     
 
 @pytest.mark.parametrize("username, password", [("username", "password")])
@@ -371,6 +396,32 @@ def test_get_movie_ratings(client, setup_database, username, password):
     assert response.status_code == status.HTTP_200_OK
     assert response.json() == "average_rating : 6.5"
 
+def test_get_movie_rating_summary(client, setup_database):
+    response = client.get("/movie/2/ratings/summary")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {
+        "movie_id": 2,
+        "rating_count": 2,
+        "rating_sum": 13,
+        "average_rating": 6.5,
+        "histogram": {"6": 1, "7": 1}
+    }
+
+
+def test_reconcile_rating_aggregates(client, setup_database):
+    # Drift the stored aggregates away from the ratings table, then rebuild them
+    db = TestingSessionLocal()
+    try:
+        movie = db.query(Movie_model).filter(Movie_model.id == 2).first()
+        movie.rating_count, movie.rating_sum, movie.rating_histogram = 0, 0, {}
+        db.commit()
+        assert MovieService.reconcile_rating_aggregates(db) == 1
+    finally:
+        db.close()
+    response = client.get("/movie/2/ratings")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == "average_rating : 6.5"
+
 @pytest.mark.parametrize("username, password", [("username", "testpassword")])
 def test_toGet_ratings_not_found(client, setup_database, username, password):
     # Attempt to get the ratings of a non-existent movie
@@ -446,6 +497,72 @@ def test_get_comments_onMovie(client, setup_database, username, password):
             }
     ]
 
+def test_fetch_movies_cursor_pagination(client, setup_database):
+    response = client.get("/movie", params={"limit": 2})
+    assert response.status_code == status.HTTP_200_OK
+    assert [movie["id"] for movie in response.json()] == [1, 2]
+    cursor = response.headers.get("X-Next-Cursor")
+    assert cursor is not None
+
+    response = client.get("/movie", params={"limit": 2, "after": cursor})
+    assert response.status_code == status.HTTP_200_OK
+    assert [movie["id"] for movie in response.json()] == [3]
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_fetch_movies_newest_first(client, setup_database):
+    response = client.get("/movie", params={"limit": 1, "order": "release_date"})
+    assert [movie["id"] for movie in response.json()] == [3]
+    response = client.get("/movie", params={"limit": 5, "order": "release_date", "after": response.headers["X-Next-Cursor"]})
+    assert [movie["id"] for movie in response.json()] == [2, 1]
+
+
+def test_fetch_movies_invalid_cursor(client, setup_database):
+    first_page = client.get("/movie", params={"limit": 1})
+    # A cursor issued for one ordering cannot be replayed against another
+    response = client.get("/movie", params={"order": "release_date", "after": first_page.headers["X-Next-Cursor"]})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json().get("detail") == "Invalid cursor"
+    response = client.get("/movie", params={"after": "not-a-cursor"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    # A well-formed cursor whose values do not fit the key columns
+    for order, values in (("id", ["x"]), ("release_date", ["2024-01-01T00:00:00", 1.5])):
+        response = client.get("/movie", params={"order": order, "after": encode_cursor(order, values)})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+def test_search_movie_prefix_and_description(client, setup_database):
+    # Partial words match, and descriptions are searched as well as titles
+    response = client.get("/movie/search/tes mov")
+    assert response.status_code == status.HTTP_200_OK
+    assert [movie["id"] for movie in response.json()] == [1, 2, 3]
+
+    response = client.get("/movie/search/comment")
+    assert response.status_code == status.HTTP_200_OK
+    assert [movie["id"] for movie in response.json()] == [3]
+
+
+def test_search_movie_pagination(client, setup_database):
+    response = client.get("/movie/search/test", params={"limit": 2})
+    assert len(response.json()) == 2
+    seen = [movie["id"] for movie in response.json()]
+    response = client.get("/movie/search/test", params={"limit": 2, "after": response.headers["X-Next-Cursor"]})
+    seen += [movie["id"] for movie in response.json()]
+    assert sorted(seen) == [1, 2, 3]
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_search_index_follows_updates(client, setup_database):
+    response = client.post("/user/auth/login", data={"username": "username", "password": "testpassword"})
+    token = response.json()["access_token"]
+    movie_data = {"title": "Renamed Feature", "description": "Searchable Synopsis"}
+    response = client.put("/movie/3", json=movie_data, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == status.HTTP_200_OK
+
+    response = client.get("/movie/search/synop")
+    assert [movie["id"] for movie in response.json()] == [3]
+    response = client.get("/movie/search/comment")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
 @pytest.mark.parametrize("username, password", [("unique", "password")])
 def test_reply_comments(client, setup_database, username, password):
     #Login user
@@ -509,6 +626,242 @@ def test_comment_to_reply_notFound(client, setup_database, username, password):
                 
 
 
+def test_backfill_description_hashes(setup_database):
+    db = TestingSessionLocal()
+    try:
+        # Rows written before the hash column existed, one repeating another's description
+        db.execute(Movie_model.__table__.insert(), [
+            {"title": "Legacy", "description": "Legacy Description"},
+            {"title": "Legacy Copy", "description": "legacy description"},
+        ])
+        db.commit()
+        assert MovieService.backfill_description_hashes(db, batch_size=1) == (1, 1)
+        assert db.query(Movie_model).filter(Movie_model.description_hash.is_(None)).count() == 1
+    finally:
+        db.close()
+
+
+def test_fetch_comment_threads(client, setup_database):
+    response = client.get("/movie/3/comments/threads")
+    assert response.status_code == status.HTTP_200_OK
+    [thread] = response.json()
+    assert (thread["id"], thread["depth"], thread["has_more_replies"]) == (1, 0, False)
+    assert [(reply["id"], reply["parent_id"], reply["depth"]) for reply in thread["replies"]] == [(2, 1, 1)]
+
+    # Replies below the requested depth are flagged instead of fetched
+    [thread] = client.get("/movie/3/comments/threads", params={"depth": 0}).json()
+    assert thread["replies"] == []
+    assert thread["has_more_replies"] is True
 
+    assert client.get("/movie/999/comments/threads").status_code == status.HTTP_404_NOT_FOUND
 
 
+def test_fetch_comment_thread(client, setup_database):
+    response = client.get("/movie/comments/2/thread")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["content"] == "Great Comment and I am glad you enjoyed it"
+    assert response.json()["replies"] == []
+    response = client.get("/movie/comments/999/thread")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json().get("detail") == "Comment not found"
+
+
+def test_import_movies_and_comments(client, setup_database):
+    response = client.post("/user/auth/login", data={"username": "username", "password": "testpassword"})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    body = "\n".join([
+        '{"title": "Imported One", "description": "Imported Description One"}',
+        '{"title": "Imported Copy", "description": "imported  description one"}',
+        '{"title": "Missing Description"}',
+        'not json',
+        '{"title": "Imported Two", "description": "Imported Description Two"}',
+    ])
+    response = client.post("/movie/import", params={"kind": "movies", "batch_size": 2}, content=body, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert (data["inserted"], data["duplicates"], data["errors"], data["batches"]) == (2, 1, 2, 3)
+    assert [error["line"] for error in data["first_errors"]] == [3, 4]
+    assert client.get("/movie/search/imported").status_code == status.HTTP_200_OK
+
+    body = 'movie_id,content,parent_id\r\n3,"Imported, over\ntwo lines",\r\n3,Imported reply,1\r\n999,Lost,\r\n'
+    response = client.post("/movie/import", params={"kind": "comments", "format": "csv"}, content=body, headers=headers)
+    data = response.json()
+    assert (data["inserted"], data["errors"]) == (2, 1)
+    assert data["first_errors"] == [{"line": 5, "error": "Movie not found"}]
+
+
+def test_import_response_does_not_grow_with_the_upload(client, setup_database, monkeypatch):
+    monkeypatch.setattr(bulk, "MAX_REPORTED_ERRORS", 2)
+    response = client.post("/user/auth/login", data={"username": "username", "password": "testpassword"})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    body = "\n".join('{"movie_id": 999, "rating": 5}' for _ in range(5))
+    response = client.post("/movie/import", params={"kind": "ratings", "batch_size": 1}, content=body, headers=headers)
+    data = response.json()
+    assert (data["inserted"], data["errors"], data["batches"]) == (0, 5, 5)
+    assert [error["line"] for error in data["first_errors"]] == [1, 2]
+    assert "reports" not in data
+
+
+def test_export_movies(client, setup_database):
+    response = client.get("/movie/export")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    ids = [row["id"] for row in rows]
+    assert ids == sorted(ids) and len(ids) > 2
+    assert set(rows[0]) == {"id", "title", "description", "release_date", "updated_at", "rating_count", "average_rating"}
+
+    # A download resumes after the last id received
+    response = client.get("/movie/export", params={"after": ids[1]})
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == ids[2:]
+
+    response = client.get("/movie/export", params={"format": "csv", "gzip": True})
+    lines = gzip.decompress(response.content).decode().splitlines()
+    assert lines[0] == "id,title,description,release_date,updated_at,rating_count,average_rating"
+    assert len(lines) == len(ids) + 1
+
+
+def test_fetch_movie_etag(client, setup_database):
+    movie = client.get("/movie", params={"order": "release_date", "limit": 1}).json()[0]
+    response = client.get(f"/movie/{movie['id']}")
+    etag = response.headers["ETag"]
+    hits = response_cache.stats()["hits"]
+
+    # A client holding the current copy gets a 304 served from memory
+    response = client.get(f"/movie/{movie['id']}", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.headers["ETag"] == etag
+    assert response_cache.stats()["hits"] == hits + 1
+
+    response = client.post("/user/auth/login", data={"username": "username", "password": "testpassword"})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    payload = {"title": "Cached Movie", "description": "Cached Movie Description"}
+    assert client.put(f"/movie/{movie['id']}", json=payload, headers=headers).status_code == status.HTTP_200_OK
+
+    # The update invalidates the cached copy and the catalog pages
+    response = client.get(f"/movie/{movie['id']}", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["ETag"] != etag
+    assert response.json()["title"] == "Cached Movie"
+    assert client.get("/movie", params={"order": "release_date", "limit": 1}).json()[0]["title"] == "Cached Movie"
+
+
+def metric_value(text, sample):
+    for line in text.splitlines():
+        if line.startswith(f"{sample} "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_metrics_count_statements_per_route(client, setup_database):
+    movie = client.get("/movie", params={"limit": 1}).json()[0]
+    labels = 'method="GET",route="/movie/{movie_id}/ratings/summary"'
+    samples = [
+        f'capstone_http_requests_total{{{labels},status="200"}}',
+        f'capstone_db_statements_per_request_bucket{{{labels},le="0"}}',
+        f'capstone_db_statements_per_request_bucket{{{labels},le="1"}}',
+    ]
+    before = client.get("/metrics").text
+    assert client.get(f"/movie/{movie['id']}/ratings/summary").status_code == status.HTTP_200_OK
+    after = client.get("/metrics")
+    assert after.status_code == status.HTTP_200_OK
+
+    # The summary is read from the movie row in a single statement
+    assert [metric_value(after.text, sample) - metric_value(before, sample) for sample in samples] == [1, 0, 1]
+    assert "capstone_response_cache_hits" in after.text
+
+
+def test_metrics_statement_budget():
+    registry = MetricsRegistry(statement_budget=2)
+    stats = RequestStats()
+    stats.statements = 3
+    registry.observe("GET", "/user/{id}", 200, 0.01, stats)
+    assert 'capstone_db_statement_budget_exceeded_total{method="GET",route="/user/{id}"} 1' in registry.render()
+
+
+def test_fetch_user_profile(client, setup_database):
+    response = client.get("/user/username", params={"limit": 1})
+    assert response.status_code == status.HTTP_200_OK
+    profile = response.json()
+    assert profile["username"] == "username"
+    assert profile["movie_count"] > 1 and profile["rating_count"] > 0 and profile["comment_count"] > 0
+    assert len(profile["movies"]) == 1
+
+    response = client.get("/user/username", params={"limit": 100, "after": response.headers["X-Next-Cursor"]})
+    movies = response.json()["movies"]
+    assert len(movies) == profile["movie_count"] - 1
+    assert movies[0]["id"] > profile["movies"][0]["id"]
+    assert "X-Next-Cursor" not in response.headers
+
+    response = client.get("/user/nobody")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json().get("detail") == "User not found"
+
+
+def test_fetch_leaderboard(client, setup_database):
+    response = client.get("/movie/leaderboard")
+    assert response.status_code == status.HTTP_200_OK
+    entries = response.json()
+    assert entries
+    scores = [entry["score"] for entry in entries]
+    assert scores == sorted(scores, reverse=True)
+
+    response = client.get("/movie/leaderboard", params={"limit": 1})
+    assert response.json() == entries[:1]
+    if len(entries) > 1:
+        response = client.get("/movie/leaderboard", params={"limit": 100, "after": response.headers["X-Next-Cursor"]})
+        assert response.json() == entries[1:]
+
+    # A full recompute ranks the same movies, scored against the catalog's own mean rating
+    db = TestingSessionLocal()
+    try:
+        assert MovieService.recompute_rankings(db) == len(entries)
+    finally:
+        db.close()
+    recomputed = client.get("/movie/leaderboard").json()
+    assert sorted(entry["movie_id"] for entry in recomputed) == sorted(entry["movie_id"] for entry in entries)
+    assert [entry["score"] for entry in recomputed] == sorted((entry["score"] for entry in recomputed), reverse=True)
+
+
+def test_fetch_movie_batch(client, setup_database):
+    response = client.get("/movie/batch", params={"ids": [2, 1, 999, 2]})
+    assert response.status_code == status.HTTP_200_OK
+    batch = response.json()
+    assert [movie["id"] for movie in batch["movies"]] == [2, 1, 2]
+    assert batch["missing"] == [999]
+    assert batch["movies"][0]["ratings"] is None
+
+    response = client.post("/movie/batch", json={"ids": [2, 999], "include_ratings": True})
+    assert response.status_code == status.HTTP_200_OK
+    batch = response.json()
+    assert [movie["id"] for movie in batch["movies"]] == [2]
+    assert batch["movies"][0]["ratings"] == client.get("/movie/2/ratings/summary").json()
+    assert batch["missing"] == [999]
+
+    response = client.post("/movie/batch", json={"ids": list(range(1, 502))})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_fetch_movies_with_stats(client, setup_database):
+    response = client.get("/movie/", params={"stats": True, "limit": 100})
+    assert response.status_code == status.HTTP_200_OK
+    movie = next(movie for movie in response.json() if movie["id"] == 2)
+    summary = client.get("/movie/2/ratings/summary").json()
+    assert movie["average_rating"] == summary["average_rating"]
+    assert movie["rating_count"] == summary["rating_count"]
+    assert movie["comment_count"] == len(client.get("/movie/2/comments", params={"limit": 100}).json())
+    assert "comment_count" not in client.get("/movie/", params={"limit": 100}).json()[0]
+
+    # A new comment shows up in the cached listing's counts
+    token = client.post("/user/auth/login", data={"username": "username", "password": "testpassword"}).json()["access_token"]
+    response = client.post("/movie/2/comment", json={"movie_id": 2, "content": "Counted"},
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == status.HTTP_201_CREATED
+    response = client.get("/movie/", params={"stats": True, "limit": 100})
+    assert next(item for item in response.json() if item["id"] == 2)["comment_count"] == movie["comment_count"] + 1
+
+    response = client.get(f"/movie/search/{movie['title'].split()[0]}", params={"stats": True, "limit": 100})
+    assert response.status_code == status.HTTP_200_OK
+    assert all("comment_count" in item and "average_rating" in item for item in response.json())
@@ -0,0 +1,248 @@
+import json
+import os
+import random
+import re
+
+import pytest
+
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.orm import sessionmaker
+
+from fastapi.testclient import TestClient
+
+from capstone.authentification.hash import Hash
+from capstone.cache import response_cache
+from capstone.database import Base, get_db
+from capstone.main import app
+from capstone.movie.models import Movie, Rating, Comment, description_digest
+from capstone.movie.service import MovieService
+from capstone.user.models import User
+
+# Tables with at least this many rows must not be read by a full scan
+SCAN_THRESHOLD = int(os.getenv("QUERY_PLAN_SCAN_THRESHOLD", 1000))
+# Set to a PostgreSQL URL to check the plans there; defaults to a temporary SQLite file
+QUERY_PLAN_DATABASE_URL = os.getenv("QUERY_PLAN_DATABASE_URL")
+
+WORDS = ["night", "river", "silent", "golden", "last", "city", "storm", "winter", "lost", "empire", "shadow", "garden"]
+# Seeded users who wrote the movies, ratings and comments; the other seeded users only make the users table large
+AUTHORS = 50
+PASSWORD = "planner-password"
+
+
+def seed(engine, rows):
+    rng = random.Random(0)
+    hashed_password = Hash.bcrypt(PASSWORD)
+    with engine.begin() as connection:
+        connection.execute(User.__table__.insert(), [
+            {"username": f"user{number}", "email": f"user{number}@example.com", "password": hashed_password}
+            for number in range(1, rows + 1)
+        ])
+        movies = []
+        for number in range(rows):
+            description = f"{' '.join(rng.sample(WORDS, 5))} {number}"
+            movies.append({
+                "title": f"{rng.choice(WORDS).title()} {number}",
+                "description": description,
+                "description_hash": description_digest(description),
+                "user_id": number % AUTHORS + 1,
+            })
+        connection.execute(Movie.__table__.insert(), movies)
+        connection.execute(Rating.__table__.insert(), [
+            {"user_id": number % AUTHORS + 1, "movie_id": number + 1, "rating": number % 9 + 1} for number in range(rows)
+        ])
+        connection.execute(Comment.__table__.insert(), [
+            {"user_id": number % AUTHORS + 1, "movie_id": number // 2 + 1, "content": f"Seeded comment {number}",
+             "parent_id": number if number % 2 else None}
+            for number in range(rows)
+        ])
+
+
+def table_name(name, tables):
+    """The table behind a name in a plan, which may be an alias such as comments_1."""
+    if name in tables:
+        return name
+    base = re.sub(r"_\d+$", "", name)
+    return base if base in tables else None
+
+
+def query_levels(statement):
+    """The statement and each of its subqueries, every one with its own subqueries cut out."""
+    levels, stack = [], [[]]
+    for char in statement:
+        if char == "(":
+            stack.append([])
+        elif char == ")" and len(stack) > 1:
+            inner = "".join(stack.pop())
+            if re.match(r"\s*SELECT\b", inner, re.IGNORECASE):
+                levels.append(inner)
+                stack[-1].append("(?)")
+            else:
+                stack[-1].append(f"({inner})")
+        else:
+            stack[-1].append(char)
+    levels.append("".join(stack[0]))
+    return levels
+
+
+def filtered_names(statement):
+    """The tables and aliases a WHERE clause filters, in the query or subquery that reads them.
+
+    A correlated subquery's condition on an outer table does not filter that table.
+    """
+    names = set()
+    for level in query_levels(statement):
+        for select in re.split(r"\bUNION(?:\s+ALL)?\b", level, flags=re.IGNORECASE):
+            from_ = re.search(r"\bFROM\b(.*?)(?=\bWHERE\b|\bGROUP BY\b|\bORDER BY\b|\bLIMIT\b|$)", select, re.S | re.I)
+            where = re.search(r"\bWHERE\b(.*?)(?=\bGROUP BY\b|\bORDER BY\b|\bLIMIT\b|$)", select, re.S | re.I)
+            if from_ and where:
+                read = set(re.findall(r"\w+", from_.group(1)))
+                names.update(name for name in re.findall(r"\b(\w+)\.\w+", where.group(1)) if name in read)
+    return names
+
+
+def sqlite_scans(connection, statement, parameters, tables):
+    """The tables a statement reads in full, each with whether a LIMIT can stop the scan early,
+    and whether its rows come out in index order."""
+    details = [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+    filtered = filtered_names(statement)
+    scans = []
+    for detail in details:
+        match = re.match(r"SCAN (\w+)", detail)
+        # Virtual tables are the full-text index, which is searched even when the plan says SCAN
+        if match and "VIRTUAL TABLE" not in detail and table_name(match.group(1), tables):
+            # Walking an index, or a table nothing filters, yields the first rows right away
+            stoppable = "USING" in detail or match.group(1) not in filtered
+            scans.append((table_name(match.group(1), tables), stoppable))
+    return scans, not any("TEMP B-TREE" in detail for detail in details)
+
+
+def postgresql_scans(connection, statement, parameters, tables):
+    """The tables a statement reads in full, each with whether a LIMIT can stop the scan early,
+    and whether its rows come out in index order."""
+    plan = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters).scalar()
+    plan = plan if isinstance(plan, list) else json.loads(plan)
+    scans, sorted_ = [], False
+    nodes = [plan[0]["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        if node["Node Type"] == "Seq Scan" and table_name(node["Relation Name"], tables):
+            # A filtered sequential scan may read the whole table before it finds a matching row
+            scans.append((table_name(node["Relation Name"], tables), "Filter" not in node))
+        sorted_ = sorted_ or node["Node Type"] in ("Sort", "Incremental Sort")
+        nodes.extend(node.get("Plans", []))
+    return scans, not sorted_
+
+
+@pytest.fixture(scope="module")
+def planned_engine(tmp_path_factory):
+    database_url = QUERY_PLAN_DATABASE_URL or f"sqlite:///{tmp_path_factory.mktemp('plans')}/plans.db"
+    engine = create_engine(database_url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    seed(engine, SCAN_THRESHOLD * 2)
+
+    db = sessionmaker(autoflush=False, bind=engine)()
+    try:
+        MovieService.reconcile_rating_aggregates(db)
+        MovieService.recompute_rankings(db)
+    finally:
+        db.close()
+    with engine.begin() as connection:
+        connection.execute(text("ANALYZE"))
+    yield engine
+    Base.metadata.drop_all(bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture(scope="module")
+def statements(planned_engine):
+    """Every statement the routes send while they are exercised, with its parameters."""
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and re.match(r"\s*(SELECT|INSERT|UPDATE|DELETE|WITH)", statement, re.IGNORECASE):
+            captured.append((statement, parameters))
+
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=planned_engine)
+
+    def override_get_db():
+        db = TestingSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    previous = app.dependency_overrides.get(get_db)
+    app.dependency_overrides[get_db] = override_get_db
+    response_cache.clear()
+    event.listen(planned_engine, "before_cursor_execute", capture)
+    try:
+        with TestClient(app) as client:
+            exercise(client)
+    finally:
+        event.remove(planned_engine, "before_cursor_execute", capture)
+        if previous is None:
+            app.dependency_overrides.pop(get_db, None)
+        else:
+            app.dependency_overrides[get_db] = previous
+        response_cache.clear()
+    return captured
+
+
+def exercise(client):
+    """Call every route backed by movie/crud.py, movie/service.py and user/service.py, except bulk import and export."""
+    def check(response):
+        assert response.status_code < 400, (response.request.url, response.text)
+        return response
+
+    check(client.post("/user/signup", json={"username": "planner", "email": "planner@example.com", "password": PASSWORD}))
+    token = check(client.post("/user/auth/login", data={"username": "planner", "password": PASSWORD})).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    for order in ("id", "release_date"):
+        cursor = check(client.get("/movie/", params={"order": order, "limit": 20})).headers["X-Next-Cursor"]
+        check(client.get("/movie/", params={"order": order, "limit": 20, "after": cursor, "stats": True}))
+    check(client.get("/movie/7"))
+    check(client.get("/movie/batch", params={"ids": [3, 1, 2], "include_ratings": True}))
+    check(client.post("/movie/batch", json={"ids": list(range(1, 60))}))
+    cursor = check(client.get("/movie/search/night river", params={"limit": 5})).headers["X-Next-Cursor"]
+    check(client.get("/movie/search/night river", params={"limit": 5, "after": cursor, "stats": True}))
+    cursor = check(client.get("/movie/leaderboard", params={"limit": 5})).headers["X-Next-Cursor"]
+    check(client.get("/movie/leaderboard", params={"limit": 5, "after": cursor}))
+    check(client.get("/movie/7/ratings"))
+    check(client.get("/movie/7/ratings/summary"))
+    cursor = check(client.get("/movie/7/comments", params={"limit": 1})).headers["X-Next-Cursor"]
+    check(client.get("/movie/7/comments", params={"limit": 1, "after": cursor}))
+    check(client.get("/movie/7/comments/threads"))
+    check(client.get("/movie/comments/13/thread"))
+    cursor = check(client.get("/user/user1", params={"limit": 5})).headers["X-Next-Cursor"]
+    check(client.get("/user/user1", params={"limit": 5, "after": cursor}))
+
+    movie_id = check(client.post("/movie/", json={"title": "Planned", "description": "A planned movie"}, headers=headers)).json()["id"]
+    check(client.put(f"/movie/{movie_id}", json={"title": "Planned", "description": "A replanned movie"}, headers=headers))
+    for rating in (4, 8):
+        check(client.post(f"/movie/{movie_id}/rate", json={"movie_id": movie_id, "rating": rating}, headers=headers))
+    check(client.post(f"/movie/{movie_id}/comment", json={"movie_id": movie_id, "content": "Planned"}, headers=headers))
+    # The comment response carries no id, the movie's comments do
+    comment_id = check(client.get(f"/movie/{movie_id}/comments")).json()[0]["id"]
+    check(client.post(f"/movie/{comment_id}/reply", json={"comment_id": comment_id, "content": "Replanned"}, headers=headers))
+    check(client.get("/user/planner"))
+    check(client.delete(f"/movie/{movie_id}", headers=headers))
+
+
+def test_no_full_scans_over_threshold(planned_engine, statements):
+    assert statements
+    tables = set(inspect(planned_engine).get_table_names())
+    with planned_engine.connect() as connection:
+        sizes = {table: connection.execute(text(f"SELECT count(*) FROM {table}")).scalar() for table in tables}
+        explain = postgresql_scans if planned_engine.dialect.name == "postgresql" else sqlite_scans
+        failures = []
+        for statement, parameters in statements:
+            scans, ordered = explain(connection, statement, parameters, tables)
+            # A LIMIT walked in index order stops after one page, however large the table,
+            # unless the scan has to skip over the rows a WHERE clause rejects
+            limited = ordered and re.search(r"\bLIMIT\b", statement, re.IGNORECASE)
+            large = [table for table, stoppable in scans if sizes[table] >= SCAN_THRESHOLD and not (limited and stoppable)]
+            if large:
+                failures.append(f"full scan of {', '.join(large)}: {' '.join(statement.split())}")
+    assert not failures, "\n".join(failures)
@@ -0,0 +1,112 @@
+import pytest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from fastapi.testclient import TestClient
+from fastapi  import status
+
+from capstone import database
+from capstone.cache import response_cache
+from capstone.database import Base, READ_PRIMARY_COOKIE, get_db
+from capstone.main import app
+from capstone.movie.models import Movie
+from capstone.replicas import ReplicaSet
+
+
+def seeded_sessionmaker(path, title):
+    """A database file holding one movie, whose title tells which database served a read."""
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = factory()
+    db.add(Movie(title=title, description=f"{title} description"))
+    db.commit()
+    db.close()
+    return factory
+
+
+@pytest.fixture
+def replicated(tmp_path, monkeypatch):
+    """The app on a primary and a replica SQLite file, which stand for two PostgreSQL servers."""
+    primary = seeded_sessionmaker(tmp_path / "primary.db", "Primary copy")
+    replica = seeded_sessionmaker(tmp_path / "replica.db", "Replica copy")
+    replicas = ReplicaSet([replica])
+    monkeypatch.setattr(database, "get_sessionmaker", lambda: primary)
+    monkeypatch.setattr(database, "get_replicas", lambda: replicas)
+    # The other test modules point get_db at their own database
+    monkeypatch.delitem(app.dependency_overrides, get_db, raising=False)
+    response_cache.clear()
+    yield replicas
+    response_cache.clear()
+
+
+def test_reads_go_to_the_replica(replicated):
+    client = TestClient(app)
+    response = client.get("/movie/1")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["title"] == "Replica copy"
+    assert replicated.stats()["reads"] == 1
+
+
+def test_cached_reads_do_not_touch_the_replica(replicated):
+    client = TestClient(app)
+    etag = client.get("/movie/1").headers["etag"]
+    assert client.get("/movie/1").status_code == status.HTTP_200_OK
+    assert client.get("/movie/1", headers={"If-None-Match": etag}).status_code == status.HTTP_304_NOT_MODIFIED
+    # Only the miss connected to the replica
+    assert replicated.stats()["reads"] == 1
+
+
+def test_reads_follow_own_writes_to_the_primary(replicated):
+    client = TestClient(app)
+    response = client.post("/user/signup", json={"username": "writer", "email": "writer@example.com", "password": "secret"})
+    assert response.status_code == status.HTTP_201_CREATED
+    assert READ_PRIMARY_COOKIE in response.cookies
+
+    # The replica has not caught up with the signup, the primary serves this client's reads
+    response = client.get("/user/writer")
+    assert response.status_code == status.HTTP_200_OK
+    assert client.get("/movie/1").json()["title"] == "Primary copy"
+    assert replicated.stats()["reads"] == 0
+
+    # Other clients, and this one once the window is over, read from the replica again
+    client.cookies.clear()
+    response_cache.clear()
+    assert client.get("/movie/1").json()["title"] == "Replica copy"
+
+
+def test_falls_back_to_the_primary_when_replicas_are_down(replicated, tmp_path, monkeypatch):
+    broken = sessionmaker(bind=create_engine(f"sqlite:///{tmp_path}/missing/replica.db"))
+    replicas = ReplicaSet([broken], retry_interval=60)
+    monkeypatch.setattr(database, "get_replicas", lambda: replicas)
+
+    client = TestClient(app)
+    assert client.get("/movie/1").json()["title"] == "Primary copy"
+    response_cache.clear()
+    assert client.get("/movie/1").json()["title"] == "Primary copy"
+    # The replica is skipped after its first failure instead of being retried on every read
+    assert replicas.stats() == {"replicas": 1, "down": 1, "reads": 0, "failures": 1, "fallbacks": 2}
+
+
+def test_cached_reads_follow_own_writes(replicated):
+    writer = TestClient(app)
+    writer.post("/user/signup", json={"username": "rater", "email": "rater@example.com", "password": "secret"})
+    token = writer.post("/user/auth/login", data={"username": "rater", "password": "secret"}).json()["access_token"]
+    response = writer.post("/movie/1/rate", json={"movie_id": 1, "rating": 9}, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == status.HTTP_201_CREATED
+
+    # Another client reads the rating summary from the replica, which lacks the rating
+    def rating_count(client):
+        movies = client.get("/movie/batch", params={"ids": [1], "include_ratings": True}).json()["movies"]
+        return movies[0]["ratings"]["rating_count"]
+
+    reader = TestClient(app)
+    assert rating_count(reader) == 0
+    # The replica's copy came right after the write, so it is not cached for anyone
+    assert response_cache.stats()["entries"] == 0
+
+    # The writer skips the cache and reads its rating from the primary
+    bypasses = response_cache.stats()["bypasses"]
+    assert rating_count(writer) == 1
+    assert response_cache.stats()["bypasses"] == bypasses + 1
@@ -0,0 +1,29 @@
+import os
+
+from benchmarks.startup import measure_startup
+
+# Seconds an import of the app may take before the test fails, generous enough for slow CI machines
+STARTUP_BUDGET = float(os.getenv("STARTUP_BUDGET", 5))
+
+
+def test_import_is_lazy_and_fast():
+    # Without a DATABASE_URL, which the import must not need
+    startup = measure_startup()
+    assert not startup["engine_built"]
+    assert not startup["log_thread_started"]
+    assert startup["import"] < STARTUP_BUDGET
+
+
+def test_first_request_is_served(tmp_path):
+    from sqlalchemy import create_engine
+    from capstone.database import Base
+    import capstone.user.models  # noqa: F401 - registers the tables
+    import capstone.movie.models  # noqa: F401
+
+    database_url = f"sqlite:///{tmp_path}/startup.db"
+    engine = create_engine(database_url)
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+
+    startup = measure_startup(database_url)
+    assert startup["first_request"] < STARTUP_BUDGET
@@ -0,0 +1,18 @@
+from capstone.telemetry import TraceSampler, init_telemetry, parse_rules
+
+
+def test_trace_sampler_rules():
+    sampler = TraceSampler(parse_rules("GET /movie/{id}=0.01, /movie/import=1"), 0.1)
+    assert sampler({"asgi_scope": {"method": "GET", "path": "/movie/42"}}) == 0.01
+    assert sampler({"asgi_scope": {"method": "PUT", "path": "/movie/42"}}) == 0.1
+    assert sampler({"asgi_scope": {"method": "POST", "path": "/movie/import"}}) == 1
+    assert sampler({"asgi_scope": {"method": "GET", "path": "/movie/42/ratings"}}) == 0.1
+
+
+def test_trace_sampler_follows_upstream_decision():
+    sampler = TraceSampler([], 0.0)
+    assert sampler({"parent_sampled": True, "asgi_scope": {"method": "GET", "path": "/movie"}}) == 1.0
+
+
+def test_telemetry_is_a_no_op_without_dsn():
+    assert init_telemetry() is False
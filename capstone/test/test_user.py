@@ -1,3 +1,4 @@
+import asyncio
 import os
 
 from dotenv import load_dotenv
@@ -8,8 +9,10 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 from fastapi.testclient import TestClient
-from fastapi  import status
+from fastapi  import HTTPException, status
 
+from capstone.authentification.hash import HashPool
+from capstone.authentification.jwt import TokenCache, token_cache, verify_token
 from capstone.database import Base, get_db
 from capstone.main import app
 
@@ -138,4 +141,65 @@ def test_password_incorrect(client, setup_database, username, email, password):
     assert response.json() == {"detail": "Incorrect password"}
 
 
+def test_hash_pool_round_trip():
+    pool = HashPool(workers=1, queue_size=1)
+    try:
+        hashed_password = asyncio.run(pool.bcrypt("secret"))
+        assert asyncio.run(pool.verify("secret", hashed_password))
+        assert not asyncio.run(pool.verify("wrong", hashed_password))
+    finally:
+        pool.shutdown()
+    metrics = pool.metrics()
+    assert metrics["completed"] == 3
+    assert metrics["in_flight"] == 0
+    assert sum(metrics["latency_seconds_buckets"].values()) == 3
+
 
+def test_hash_pool_recovers_from_a_dead_worker():
+    pool = HashPool(workers=1, queue_size=1)
+    try:
+        # The worker exits mid-task, which breaks the executor
+        with pytest.raises(Exception):
+            pool.executor().submit(os._exit, 1).result()
+        assert asyncio.run(pool.verify("secret", asyncio.run(pool.bcrypt("secret"))))
+    finally:
+        pool.shutdown()
+    assert pool.metrics()["in_flight"] == 0
+
+
+def test_hash_pool_rejects_when_saturated():
+    pool = HashPool(workers=1, queue_size=0)
+    # Pretend the only worker is busy
+    pool.in_flight = 1
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(pool.bcrypt("secret"))
+    assert error.value.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert error.value.headers == {"Retry-After": "1"}
+    assert pool.metrics()["rejected"] == 1
+
+
+@pytest.mark.parametrize("username, email, password", [("tokenuser", "tokenuser@example.com", "123")])
+def test_token_carries_user_id(client, setup_database, username, email, password):
+    client.post("/user/signup", json={"username": username, "email": email, "password": password})
+    token = client.post("/user/auth/login", data={"username": username, "password": password}).json()["access_token"]
+
+    token_cache.clear()
+    token_data = verify_token(token, HTTPException(status_code=status.HTTP_401_UNAUTHORIZED))
+    assert token_data.username == username
+    assert token_data.id is not None
+    # The second lookup is served from the cache without decoding the token
+    assert verify_token(token, None) is token_data
+
+
+def test_token_cache_eviction_and_expiry():
+    cache = TokenCache(max_size=2, ttl=60)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    assert cache.get("a") == "A"
+    cache.put("c", "C")
+    # "b" was the least recently used entry
+    assert cache.get("b") is None
+    assert len(cache) == 2
+
+    cache.put("expired", "E", exp=0)
+    assert cache.get("expired") is None
@@ -0,0 +1,58 @@
+from fastapi import Depends
+from fastapi.security import OAuth2PasswordRequestForm
+
+from capstone.database import async_db_dependency
+from capstone.user.schemas import SignUpModel
+from capstone.pagination import DEFAULT_LIMIT
+from capstone.authentification.jwt import create_access_token
+from capstone.user.async_service import AsyncUserService
+
+from capstone.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+async def sign_up(db : async_db_dependency, payload : SignUpModel):
+    logger.info("Creating a new user: %s", payload.username)
+
+    await AsyncUserService.check_existing_email(db, payload.email)
+    await AsyncUserService.check_existing_username(db, payload.username)
+
+    hashed_password = await AsyncUserService.hash_password(payload.password)
+    new_user = await AsyncUserService.create_user(db, payload, hashed_password)
+    logger.info(f"User {payload.username} has been created")
+    # A new account has not listed anything yet, and the relationship cannot be lazy loaded here
+    return {
+        "username": new_user.username,
+        "movies": []
+    }
+
+
+async def login(db : async_db_dependency, payload : OAuth2PasswordRequestForm = Depends()):
+    logger.info(f"Login attempt for user: {payload.username}")
+
+    user = await AsyncUserService.get_user_by_username(db, payload.username)
+    logger.info(f"User found: {payload.username}")
+
+    await AsyncUserService.verify_password(payload.password, user.password)
+    logger.info(f"Password verified for user: {payload.username}")
+
+    access_token = create_access_token(data = {
+        "sub" : user.username,
+        "user_id" : user.id
+    })
+    logger.info(f"User {payload.username} logged in successfully")
+
+    return {
+        "access_token" : access_token,
+        "token_type" : "bearer"
+    }
+
+
+async def get_profile(db : async_db_dependency, username : str, after : str | None = None, limit : int = DEFAULT_LIMIT):
+    logger.info(f"Fetching the profile of user '{username}' after cursor={after} with limit={limit}")
+
+    profile = await AsyncUserService.get_profile(db, username)
+    movies, next_cursor = await AsyncUserService.fetch_user_movies(db, profile.id, after, limit)
+    logger.info(f"Fetched the profile of user '{username}' with {len(movies)} of {profile.movie_count} movies")
+    return {**profile._asdict(), "movies": movies}, next_cursor
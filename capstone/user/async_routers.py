@@ -0,0 +1,60 @@
+from fastapi import APIRouter, Depends, Query, Response, status
+from fastapi.security import OAuth2PasswordRequestForm
+
+from capstone.database import async_db_dependency, async_read_db_dependency
+from capstone.user.schemas import SignUpModel, UserResponse, UserProfile
+from capstone.pagination import DEFAULT_LIMIT, MAX_LIMIT, NEXT_CURSOR_HEADER
+import capstone.user.async_crud as crud
+
+
+async_user_router = APIRouter(
+    prefix="/user",
+    tags=["User"]
+)
+
+
+@async_user_router.post("/signup", response_model= UserResponse, status_code= status.HTTP_201_CREATED)
+async def sign_up(db : async_db_dependency, payload : SignUpModel):
+
+    """
+    ## Creates a user
+    Requires the following
+    ```
+    username : str
+    email : str 
+    password : str
+    ```
+    """
+        
+    return await crud.sign_up(db, payload)
+
+@async_user_router.post("/auth/login", status_code= status.HTTP_200_OK)
+async def login(db : async_db_dependency, payload : OAuth2PasswordRequestForm = Depends()):
+
+    """
+    ## Login a user
+    Requires the following
+    ```
+    username : str
+    password : str
+    ```
+    and returns a token pair 'access' 
+    """
+
+    return await crud.login(db, payload)
+
+
+@async_user_router.get("/{username}", response_model= UserProfile)
+async def fetch_profile(db : async_read_db_dependency, username : str, response : Response, after : str | None = None,
+                        limit : int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT)):
+    """
+    ## Fetch a user's profile
+    Returns the user's movie, rating and comment counts and one page of the
+    movies they listed, oldest first, and can be accessed by the public.
+    - after : cursor from the `X-Next-Cursor` header of the previous page
+    - limit : number of movies per page (1-100)
+    """
+    profile, next_cursor = await crud.get_profile(db, username, after, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return profile
@@ -0,0 +1,98 @@
+from fastapi import HTTPException, status
+from sqlalchemy import select
+
+from capstone.user.models import User
+from capstone.movie.models import Movie
+from capstone.pagination import keyset_query, keyset_result
+from capstone.user.service import UserService
+from capstone.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class AsyncUserService(UserService):
+    """AsyncSession counterparts of the UserService queries.
+
+    Password hashing and verification are inherited, they already await the bcrypt process pool.
+    """
+
+    @staticmethod
+    async def check_existing_email(db, email: str):
+        """Check if an email is already registered in the database.
+
+        Raises:
+            HTTPException: If the email is already registered, an exception with
+            status code 400 and a message "Email already exists" is raised.
+        """
+        if await db.scalar(select(User.id).filter(User.email == email)):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Email already exists"
+            )
+
+    @staticmethod
+    async def check_existing_username(db, username: str):
+        """Check if a username is already taken in the database.
+
+        Raises:
+            HTTPException: If the username is already taken, an exception with
+            status code 400 and a message "Username already exists" is raised.
+        """
+        if await db.scalar(select(User.id).filter(User.username == username)):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Username already exists"
+            )
+
+    @staticmethod
+    async def create_user(db, payload, hashed_password: str):
+        """Create a new user with an already hashed password.
+
+        Returns:
+            User: The newly created user object after being added to the database.
+        """
+        new_user = User(
+            email=payload.email,
+            username=payload.username,
+            password=hashed_password
+        )
+        db.add(new_user)
+        await db.commit()
+        await db.refresh(new_user)
+        return new_user
+
+    @staticmethod
+    async def get_user_by_username(db, username: str):
+        """Retrieve a user by their username from the database.
+
+        Raises:
+            HTTPException: If the user is not found, an exception with
+            status code 404 and a message "Invalid credentials" is raised.
+        """
+        user = await db.scalar(select(User).filter(User.username == username))
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Invalid credentials"
+            )
+        return user
+
+    @staticmethod
+    async def get_profile(db, username: str):
+        """Retrieve a user's profile counts.
+
+        Raises:
+            HTTPException: If the user does not exist, an exception with
+            status code 404 and a message "User not found" is raised.
+        """
+        profile = (await db.execute(UserService.profile_statement(username))).first()
+        UserService.ensure_profile_found(profile, username)
+        return profile
+
+    @staticmethod
+    async def fetch_user_movies(db, user_id: int, after: str | None, limit: int):
+        """Fetch one page of the movies a user listed, oldest first, and the cursor for the next page."""
+        columns = [Movie.id]
+        statement = keyset_query(select(Movie).filter(Movie.user_id == user_id), "user_movies", columns, after, limit)
+        movies = (await db.scalars(statement)).all()
+        return keyset_result(movies, "user_movies", columns, limit)
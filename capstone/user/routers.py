@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, Query, Response, status
 from fastapi.security import OAuth2PasswordRequestForm
 
-from capstone.database import db_dependency
-from capstone.user.schemas import SignUpModel, UserResponse
+from capstone.database import db_dependency, read_db_dependency
+from capstone.user.schemas import SignUpModel, UserResponse, UserProfile
+from capstone.pagination import DEFAULT_LIMIT, MAX_LIMIT, NEXT_CURSOR_HEADER
 import capstone.user.crud as crud 
 
 
@@ -13,7 +14,7 @@ user_router = APIRouter(
 
 
 @user_router.post("/signup", response_model= UserResponse, status_code= status.HTTP_201_CREATED)
-def sign_up(db : db_dependency, payload : SignUpModel):
+async def sign_up(db : db_dependency, payload : SignUpModel):
 
     """
     ## Creates a user
@@ -25,10 +26,10 @@ def sign_up(db : db_dependency, payload : SignUpModel):
     ```
     """
         
-    return crud.sign_up(db, payload)
+    return await crud.sign_up(db, payload)
 
 @user_router.post("/auth/login", status_code= status.HTTP_200_OK)
-def login(db : db_dependency, payload : OAuth2PasswordRequestForm = Depends()):
+async def login(db : db_dependency, payload : OAuth2PasswordRequestForm = Depends()):
 
     """
     ## Login a user
@@ -40,4 +41,20 @@ def login(db : db_dependency, payload : OAuth2PasswordRequestForm = Depends()):
     and returns a token pair 'access' 
     """
 
-    return crud.login(db, payload)
+    return await crud.login(db, payload)
+
+
+@user_router.get("/{username}", response_model= UserProfile)
+def fetch_profile(db : read_db_dependency, username : str, response : Response, after : str | None = None,
+                  limit : int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT)):
+    """
+    ## Fetch a user's profile
+    Returns the user's movie, rating and comment counts and one page of the
+    movies they listed, oldest first, and can be accessed by the public.
+    - after : cursor from the `X-Next-Cursor` header of the previous page
+    - limit : number of movies per page (1-100)
+    """
+    profile, next_cursor = crud.get_profile(db, username, after, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return profile
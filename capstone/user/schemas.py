@@ -40,6 +40,17 @@ class UserResponse(BaseModel):
         }
     )
         
+class UserProfile(BaseModel):
+    id : int
+    username : str
+    movie_count : int
+    rating_count : int
+    comment_count : int
+    movies : list[Movie]
+
+    model_config = ConfigDict(from_attributes=True)
+
+
 class Login(BaseModel):
     username: str
     password: str
@@ -53,6 +64,7 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     username: Optional[str] = None
+    id: Optional[int] = None
 
 
 
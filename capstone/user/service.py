@@ -1,28 +1,12 @@
 from fastapi import HTTPException, status
+from sqlalchemy import func, select
+
 from capstone.user.models import User
-from capstone.authentification.hash import Hash
+from capstone.movie.models import Movie, Rating, Comment
+from capstone.pagination import keyset_page
+from capstone.authentification.hash import hash_pool
 from capstone.authentification.jwt import create_access_token
 from capstone.logger import get_logger
-import logging
-import sentry_sdk
-from sentry_sdk.integrations.logging import LoggingIntegration
-import logging
-# Enable sending logs from the standard Python logging module to Sentry
-logging_integration = LoggingIntegration(
-    level=logging.INFO,  # Capture info and above as breadcrumbs
-    event_level=logging.ERROR  # Send errors as events
-)
-sentry_sdk.init(
-    dsn="https://ee3ca659cdc5658bf02659af610f818b@o4507693153386496.ingest.de.sentry.io/4507693158629456",
-    # Set traces_sample_rate to 1.0 to capture 100%
-    # of transactions for performance monitoring.
-    traces_sample_rate=1.0,
-    # Set profiles_sample_rate to 1.0 to profile 100%
-    # of sampled transactions.
-    # We recommend adjusting this value in production.
-    profiles_sample_rate=1.0,
-    integrations= [logging_integration]
-)
 
 logger = get_logger(__name__)
 
@@ -68,20 +52,33 @@ class UserService:
             )
 
     @staticmethod
-    def create_user(db, payload):
-        """Create a new user after hashing the password.
+    async def hash_password(password: str) -> str:
+        """Hash a password for storage in the bcrypt process pool.
+        
+        Args:
+            password (str): The plain text password.
+
+        Returns:
+            str: The bcrypt hash of the password.
+
+        Raises:
+            HTTPException: If the hashing pool is saturated, an exception with
+            status code 503 is raised.
+        """
+        return await hash_pool.bcrypt(password)
+
+    @staticmethod
+    def create_user(db, payload, hashed_password: str):
+        """Create a new user with an already hashed password.
         
         Args:
             db: The database session.
-            payload: The data required to create a new user, including email, username, 
-            and password.
+            payload: The data required to create a new user, including email and username.
+            hashed_password (str): The password hashed by `hash_password`.
 
         Returns:
             User: The newly created user object after being added to the database.
         """
-        # Hash the user's password for secure storage
-        hashed_password = Hash.bcrypt(payload.password)
-        
         # Create a new user object with the hashed password
         new_user = User(
             email=payload.email,
@@ -122,8 +119,8 @@ class UserService:
         return user
 
     @staticmethod
-    def verify_password(provided_password: str, stored_password: str):
-        """Verify the provided password against the stored hashed password.
+    async def verify_password(provided_password: str, stored_password: str):
+        """Verify the provided password against the stored hashed password in the bcrypt process pool.
         
         Args:
             provided_password (str): The password provided by the user during login.
@@ -132,10 +129,80 @@ class UserService:
         Raises:
             HTTPException: If the provided password does not match the stored password, 
             an exception with status code 401 and a message "Incorrect password" is raised.
+            If the hashing pool is saturated, an exception with status code 503 is raised.
         """
-        if not Hash.verify(provided_password, stored_password):
+        if not await hash_pool.verify(provided_password, stored_password):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect password"
             )
 
+    @staticmethod
+    def profile_statement(username: str):
+        """Select a user with the number of movies, ratings and comments they wrote, in a single query.
+
+        Args:
+            username (str): The username of the user.
+
+        Returns:
+            Select: The statement, yielding one row with id, username and the three counts.
+        """
+        def count(model):
+            return select(func.count()).select_from(model).filter(model.user_id == User.id).scalar_subquery()
+
+        return select(
+            User.id,
+            User.username,
+            count(Movie).label("movie_count"),
+            count(Rating).label("rating_count"),
+            count(Comment).label("comment_count"),
+        ).filter(User.username == username)
+
+    @staticmethod
+    def ensure_profile_found(profile, username: str):
+        """Raise a 404 when `profile_statement` found no user.
+
+        Raises:
+            HTTPException: If the user does not exist, an exception with
+            status code 404 and a message "User not found" is raised.
+        """
+        if profile is None:
+            logger.warning(f"Profile of user '{username}' not found")
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
+
+    @staticmethod
+    def get_profile(db, username: str):
+        """Retrieve a user's profile counts.
+
+        Args:
+            db: The database session.
+            username (str): The username of the user.
+
+        Returns:
+            Row: The id, username, movie_count, rating_count and comment_count of the user.
+
+        Raises:
+            HTTPException: If the user does not exist, an exception with
+            status code 404 and a message "User not found" is raised.
+        """
+        profile = db.execute(UserService.profile_statement(username)).first()
+        UserService.ensure_profile_found(profile, username)
+        return profile
+
+    @staticmethod
+    def fetch_user_movies(db, user_id: int, after: str | None, limit: int):
+        """Fetch one page of the movies a user listed, oldest first.
+
+        Args:
+            db: The database session.
+            user_id (int): The id of the user.
+            after (str | None): The cursor returned with the previous page, if any.
+            limit (int): The maximum number of movies to return.
+
+        Returns:
+            tuple: The movies of the page and the cursor for the next page, or None on the last page.
+        """
+        return keyset_page(db.query(Movie).filter(Movie.user_id == user_id), "user_movies", [Movie.id], after, limit)